@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Offline Go/Stop detection of a directory or a list of images
+
+Decodes the images in a pool of worker threads, runs batched inference and the
+Go/Stop decision of main.py (see pipeline.py), and streams the results to a
+JSONL file, or to columnar NPZ shards with the raw detections:
+
+    results-00000.npz: path, command, confidence, boxes [n, K, 4], scores [n, K]
+                       and classes [n, K] of n images
+
+The paths of the images whose results are written are appended to a checkpoint
+file, so that an interrupted run continues where it stopped with --resume.
+Results are checkpointed after they are flushed, so images processed just
+before an interruption may appear twice in the output.
+
+Usage:
+    python batch_detect.py --input archive/ --output results.jsonl
+    python batch_detect.py --file_list stills.txt --output results/ --format npz \\
+        --workers 8 --batch_size 8 --resume
+"""
+
+import argparse
+import collections
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from image_cache import ImageCache, list_images
+from pipeline import (classify_records, detect_batches, print_stage_report, run_pipeline,
+                      start_detector)
+
+
+### Checkpoint
+def read_checkpoint(checkpoint_path):
+    """
+    :return: set of the paths already processed
+    """
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path) as f:
+        return set(line.rstrip('\n') for line in f if line.strip())
+
+
+def append_checkpoint(checkpoint_path, image_paths):
+    with open(checkpoint_path, 'a') as f:
+        f.writelines(path + '\n' for path in image_paths)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def remove_results(output_path, checkpoint_path):
+    """
+    remove the checkpoint and the results of a previous run, before starting over
+    """
+    stale_paths = [checkpoint_path]
+    if os.path.isdir(output_path):
+        stale_paths.extend(os.path.join(output_path, name) for name in os.listdir(output_path)
+                           if name.startswith('results-') and name.endswith('.npz'))
+    else:
+        stale_paths.append(output_path)
+    for stale_path in stale_paths:
+        if os.path.isfile(stale_path):
+            os.remove(stale_path)
+
+
+### Stages
+def load_image(image_path):
+    """
+    :return: RGB uint8 numpy array of the image
+    """
+    with Image.open(image_path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def decode_images(_, image_paths, workers=4, loader=load_image):
+    """
+    decoding stage: decode the images in a pool of threads, in order
+    :param image_paths: list of paths
+    :param workers: number of decoding threads
+    :param loader: function returning the RGB numpy array of an image path,
+        e.g. ImageCache.load
+    :return: iterator of records with 'path' and the RGB 'image'; images that
+        cannot be decoded are reported and skipped
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Only a few images per worker are decoded ahead of the pipeline
+        pending = collections.deque()
+        image_paths = iter(image_paths)
+        while True:
+            for image_path in image_paths:
+                pending.append((image_path, executor.submit(loader, image_path)))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            image_path, future = pending.popleft()
+            try:
+                yield {'path': image_path, 'image': future.result()}
+            except (IOError, OSError, ValueError) as e:
+                print(f"Skipping {image_path}: {e}")
+
+
+def write_jsonl(records, output_path, checkpoint_path, checkpoint_every=100):
+    """
+    output stage: append one JSON line per image to output_path
+    :param records: iterator of records of classify_records
+    :param checkpoint_every: number of images between flushes and checkpoints
+    :return: iterator of the records, once written
+    """
+    written = []
+    with open(output_path, 'a') as f:
+        for record in records:
+            f.write(json.dumps({'path': record['path'], 'command': record['command'],
+                                'confidence': record['confidence']}) + '\n')
+            written.append(record['path'])
+            if len(written) >= checkpoint_every:
+                f.flush()
+                append_checkpoint(checkpoint_path, written)
+                written = []
+            yield record
+        f.flush()
+        append_checkpoint(checkpoint_path, written)
+
+
+def write_npz_shards(records, output_dir, checkpoint_path, shard_size=1000):
+    """
+    output stage: write the results and raw detections as columnar NPZ shards
+    :param records: iterator of records of classify_records
+    :param output_dir: directory of the shards; shards are numbered after the
+        existing ones
+    :param shard_size: number of images per shard
+    :return: iterator of the records, once buffered
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shard_index = len([name for name in os.listdir(output_dir)
+                       if name.startswith('results-') and name.endswith('.npz')])
+    columns = collections.defaultdict(list)
+
+    def write_shard():
+        nonlocal shard_index
+        shard_path = os.path.join(output_dir, f"results-{shard_index:05d}.npz")
+        # Written under a temporary name so that a shard is either complete or missing
+        with open(shard_path + '.tmp', 'wb') as f:
+            np.savez(f, path=np.array(columns['path']), command=np.array(columns['command']),
+                     confidence=np.array(columns['confidence'], dtype=np.float32),
+                     boxes=np.stack(columns['boxes']).astype(np.float32),
+                     scores=np.stack(columns['scores']).astype(np.float32),
+                     classes=np.stack(columns['classes']).astype(np.int32))
+        os.replace(shard_path + '.tmp', shard_path)
+        append_checkpoint(checkpoint_path, columns['path'])
+        shard_index += 1
+        columns.clear()
+
+    for record in records:
+        for key in ('path', 'command', 'confidence', 'boxes', 'scores', 'classes'):
+            columns[key].append(record[key])
+        if len(columns['path']) >= shard_size:
+            write_shard()
+        yield record
+    if columns:
+        write_shard()
+
+
+def report_throughput(records, num_images, report_every=100):
+    """
+    wrap the output stage to print the throughput every report_every images
+    :return: iterator of the records
+    """
+    start = time.perf_counter()
+    for count, record in enumerate(records, 1):
+        if count % report_every == 0 or count == num_images:
+            elapsed = time.perf_counter() - start
+            print(f"{count}/{num_images} images, {count / elapsed:.2f} images/s")
+        yield record
+
+
+### Job
+def process_images(image_paths, output_path, output_format='jsonl', checkpoint_path=None,
+                   workers=4, batch_size=4, queue_size=16, shard_size=1000, image_cache=None):
+    """
+    run the pipeline on a list of images
+    :param image_paths: list of paths, already processed ones excluded
+    :param output_path: JSONL file, or directory of the NPZ shards
+    :param output_format: jsonl or npz
+    :param checkpoint_path: checkpoint file, defaults to output_path + '.checkpoint'
+    :param workers: number of decoding threads
+    :param batch_size: maximum number of images per inference
+    :param queue_size: maximum number of images waiting between two stages
+    :param shard_size: number of images per NPZ shard
+    :param image_cache: optional ImageCache the images are read from, see image_cache.py
+    :return: list of stage stats, see pipeline.run_pipeline
+    """
+    checkpoint_path = checkpoint_path or output_path.rstrip('/\\') + '.checkpoint'
+    if output_format == 'jsonl':
+        write = functools.partial(write_jsonl, output_path=output_path,
+                                  checkpoint_path=checkpoint_path)
+    elif output_format == 'npz':
+        write = functools.partial(write_npz_shards, output_dir=output_path,
+                                  checkpoint_path=checkpoint_path, shard_size=shard_size)
+    else:
+        raise ValueError(f"Unknown output format {output_format}")
+
+    with start_detector() as sess:
+        return run_pipeline([
+            ('decode', functools.partial(decode_images, image_paths=image_paths,
+                                         workers=workers,
+                                         loader=image_cache.load if image_cache else load_image)),
+            ('detect', functools.partial(detect_batches, sess=sess, batch_size=batch_size)),
+            ('classify', classify_records),
+            ('write', lambda records: report_throughput(write(records), len(image_paths))),
+        ], queue_size=queue_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Go/Stop detection of images")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--input', help="directory searched recursively for images")
+    inputs.add_argument('--file_list', help="text file with one image path per line")
+    parser.add_argument('--output', required=True,
+                        help="JSONL file, or directory of the NPZ shards with --format npz")
+    parser.add_argument('--format', choices=['jsonl', 'npz'], default='jsonl')
+    parser.add_argument('--checkpoint', help="checkpoint file, defaults to OUTPUT.checkpoint")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip the images of the checkpoint and append to the output")
+    parser.add_argument('--workers', type=int, default=4, help="decoding threads")
+    parser.add_argument('--batch_size', type=int, default=4, help="images per inference")
+    parser.add_argument('--queue_size', type=int, default=16,
+                        help="maximum number of images waiting between two stages")
+    parser.add_argument('--shard_size', type=int, default=1000, help="images per NPZ shard")
+    parser.add_argument('--image_cache',
+                        help="pre-decoded image cache built with image_cache.py")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or args.output.rstrip('/\\') + '.checkpoint'
+    image_paths = list_images(args.input, args.file_list)
+    if args.resume:
+        done = read_checkpoint(checkpoint_path)
+        print(f"Resuming: {len(done)} images already processed")
+        image_paths = [path for path in image_paths if path not in done]
+    else:
+        remove_results(args.output, checkpoint_path)
+    if not image_paths:
+        print("No images to process")
+        sys.exit(0)
+
+    print(f"Processing {len(image_paths)} images...")
+    start = time.perf_counter()
+    try:
+        stats = process_images(image_paths, args.output, output_format=args.format,
+                               checkpoint_path=checkpoint_path, workers=args.workers,
+                               batch_size=args.batch_size, queue_size=args.queue_size,
+                               shard_size=args.shard_size,
+                               image_cache=ImageCache(args.image_cache) if args.image_cache else None)
+    except RuntimeError as e:
+        print(f"Batch processing failed: {e}")
+        print(f"Run again with --resume to continue from {checkpoint_path}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    num_images = stats[-1]['items']
+    print(f"Processed {num_images} images in {elapsed:.1f}s "
+          f"({num_images / elapsed:.2f} images/s)")
+    print(f"Results written to {args.output}")
+    print_stage_report(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Pre-decoded image cache with memory-mapped access
+
+Decodes (and optionally resizes) a set of images once and stores their RGB
+pixels in a single uint8 file, so that repeated evaluation and sweep runs over
+the same images skip JPEG decoding. The cache directory holds:
+
+    images-<version>.bin: the pixels of all images, concatenated
+    index.json: version of the data file, offset and shape of every image, the
+                SHA-1 of its source file, and the size and modification time of
+                the source when cached
+
+New images are appended to the data file before the index is replaced. When
+the data file is rewritten (compacted or rebuilt), it gets a new version and
+the old one is deleted only after the index refers to the new one, so that a
+reader never combines the offsets of one index with the data of another.
+
+The reader memory-maps the data file and returns read-only views of it, without
+copying; consecutive images of the same shape are returned as a single
+[batch, height, width, 3] view, ready for batched inference. An image whose
+source file changed is not returned: its size or modification time differ,
+and the content hash of the file no longer matches.
+
+Usage:
+    python image_cache.py --input archive/ --cache archive_cache/
+    python image_cache.py --file_list stills.txt --cache stills_cache/ --resize 1280 720
+
+    cache = ImageCache('archive_cache/')
+    image = cache.load('archive/img_1.jpg')  # cached view, or decoded from the file
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DATA_FILENAME_FORMAT = 'images-{version}.bin'
+INDEX_FILENAME = 'index.json'
+
+
+### Inputs
+def list_images(input_dir=None, file_list=None, extensions=IMAGE_EXTENSIONS):
+    """
+    list the images to process, in a deterministic order
+    :param input_dir: directory searched recursively for images
+    :param file_list: text file with one image path per line
+    :param extensions: file extensions of the images of input_dir
+    :return: list of paths
+    """
+    if file_list:
+        with open(file_list) as f:
+            return [line.strip() for line in f if line.strip()]
+    image_paths = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        image_paths.extend(os.path.join(root, name) for name in sorted(files)
+                           if name.lower().endswith(extensions))
+    return image_paths
+
+
+### Decoding
+def decode_image_file(image_path, resize=None):
+    """
+    read, hash and decode an image file
+    :param image_path: path of the image
+    :param resize: optional (width, height) the image is resized to
+    :return: RGB uint8 numpy array, and the entry of the image in the index
+        without its offset
+    """
+    stat = os.stat(image_path)
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    if resize:
+        image = image.resize(tuple(resize), Image.BILINEAR)
+    image_np = np.asarray(image, dtype=np.uint8)
+    return image_np, {'shape': list(image_np.shape), 'sha1': hashlib.sha1(data).hexdigest(),
+                      'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def is_fresh(entry, image_path, verify=False):
+    """
+    whether the cached entry of an image still matches its source file
+    :param entry: entry of the image in the index
+    :param image_path: path of the source file
+    :param verify: if True, the content hash is always checked; otherwise only
+        when the size or modification time of the file changed
+    :return: bool
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return False
+    if not verify and (stat.st_size, stat.st_mtime_ns) == (entry['size'], entry['mtime_ns']):
+        return True
+    return stat.st_size == entry['size'] and file_sha1(image_path) == entry['sha1']
+
+
+### Index
+def _read_index(cache_dir):
+    index_path = os.path.join(cache_dir, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        index = json.load(f)
+    # Caches without a versioned data file are rebuilt
+    return index if 'version' in index else None
+
+
+def _write_index(cache_dir, index):
+    # Written under a temporary name so that readers never see a partial index
+    index_path = os.path.join(cache_dir, INDEX_FILENAME)
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(index_path + '.tmp', index_path)
+
+
+def _data_path(cache_dir, index):
+    return os.path.join(cache_dir, DATA_FILENAME_FORMAT.format(version=index['version']))
+
+
+def _remove_stale_data_files(cache_dir, index):
+    # Readers that mapped a removed data file keep their mapping
+    current_name = os.path.basename(_data_path(cache_dir, index))
+    for name in os.listdir(cache_dir):
+        if name.startswith('images') and name.endswith('.bin') and name != current_name:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass  # still mapped on Windows, removed by the next build
+
+
+def _num_bytes(shape):
+    return int(np.prod(shape))
+
+
+### Reader
+class ImageCache:
+    """
+    read-only access to a cache built by build_image_cache
+    """
+    def __init__(self, cache_dir, verify=False):
+        """
+        :param cache_dir: directory of the cache
+        :param verify: if True, the content hash of the source file is checked
+            every time an image is read, see is_fresh
+        """
+        for _ in range(3):
+            index = _read_index(cache_dir)
+            if index is None:
+                raise ValueError(f"No image cache in {cache_dir}")
+            try:
+                data_path = _data_path(cache_dir, index)
+                if os.path.getsize(data_path):
+                    self._data = np.memmap(data_path, dtype=np.uint8, mode='r')
+                else:
+                    self._data = np.zeros(0, dtype=np.uint8)
+                break
+            except FileNotFoundError:
+                # The data file was replaced after the index was read
+                continue
+        else:
+            raise ValueError(f"Image cache {cache_dir} is being rebuilt")
+        self.cache_dir = cache_dir
+        self.resize = index['resize']
+        self.verify = verify
+        self._entries = index['entries']
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, image_path):
+        return image_path in self._entries
+
+    def _view(self, entry, num_images=None):
+        shape = entry['shape'] if num_images is None else [num_images] + entry['shape']
+        offset = entry['offset']
+        return self._data[offset:offset + _num_bytes(shape)].reshape(shape)
+
+    def get(self, image_path):
+        """
+        :param image_path: path of the source image
+        :return: read-only view of the cached image, or None if the image is not
+            cached or its source file changed
+        """
+        entry = self._entries.get(image_path)
+        if entry is None or not is_fresh(entry, image_path, self.verify):
+            return None
+        return self._view(entry)
+
+    def load(self, image_path):
+        """
+        :param image_path: path of the source image
+        :return: the cached image, or the image decoded from its source file
+            (and resized like the cached images) if it is not cached or changed
+        """
+        image = self.get(image_path)
+        if image is None:
+            image, _ = decode_image_file(image_path, self.resize)
+        return image
+
+    def get_batch(self, image_paths):
+        """
+        :param image_paths: list of paths of images of the same shape
+        :return: [batch, height, width, 3] array of the images; a view without
+            copy if they are cached consecutively and fresh
+        """
+        entries = [self._entries.get(image_path) for image_path in image_paths]
+        if entries and all(entry is not None and entry['shape'] == entries[0]['shape']
+                           for entry in entries):
+            image_bytes = _num_bytes(entries[0]['shape'])
+            consecutive = all(entry['offset'] == entries[0]['offset'] + i * image_bytes
+                              for i, entry in enumerate(entries))
+            if consecutive and all(is_fresh(entry, image_path, self.verify)
+                                   for entry, image_path in zip(entries, image_paths)):
+                return self._view(entries[0], num_images=len(entries))
+        return np.stack([self.load(image_path) for image_path in image_paths])
+
+
+### Builder
+def _decode_or_error(image_path, resize):
+    try:
+        return decode_image_file(image_path, resize)
+    except (IOError, OSError, ValueError) as e:
+        return e
+
+
+def _compact(cache_dir, index):
+    # Rewrites the images of the index contiguously into a new data file,
+    # dropping replaced images; the old file is removed once the index is written
+    old_data = np.memmap(_data_path(cache_dir, index), dtype=np.uint8, mode='r')
+    index['version'] += 1
+    offset = 0
+    with open(_data_path(cache_dir, index), 'wb') as f:
+        for entry in index['entries'].values():
+            num_bytes = _num_bytes(entry['shape'])
+            f.write(old_data[entry['offset']:entry['offset'] + num_bytes].tobytes())
+            entry['offset'] = offset
+            offset += num_bytes
+    del old_data
+    _write_index(cache_dir, index)
+
+
+def build_image_cache(image_paths, cache_dir, resize=None, workers=4, verify=False):
+    """
+    decode the images that are not cached yet, or whose source changed, and
+    append them to the cache
+    :param image_paths: list of image paths
+    :param cache_dir: directory of the cache, created if needed
+    :param resize: optional (width, height) the images are resized to; a cache
+        built with another size is rebuilt
+    :param workers: number of decoding threads
+    :param verify: if True, the content hash of every cached image is checked
+    :return: dict with the number of images cached, added, updated and failed
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    resize = list(resize) if resize else None
+    index = _read_index(cache_dir)
+    if (index is None or index['resize'] != resize or
+            not os.path.exists(_data_path(cache_dir, index))):
+        # A new data file, as readers may still use the old one with the old index
+        index = {'resize': resize, 'version': index['version'] + 1 if index else 0,
+                 'entries': {}}
+        open(_data_path(cache_dir, index), 'wb').close()
+    data_path = _data_path(cache_dir, index)
+    entries = index['entries']
+
+    counts = {'cached': 0, 'added': 0, 'updated': 0, 'failed': 0}
+    stale_paths = []
+    for image_path in image_paths:
+        if image_path not in entries:
+            stale_paths.append(image_path)
+        elif not is_fresh(entries[image_path], image_path, verify):
+            stale_paths.append(image_path)
+        else:
+            counts['cached'] += 1
+
+    offset = os.path.getsize(data_path)
+    window = 4 * workers
+    with open(data_path, 'ab') as data_file, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Decoding a window of images at a time bounds the memory used
+        for start in range(0, len(stale_paths), window):
+            chunk = stale_paths[start:start + window]
+            for image_path, result in zip(chunk, executor.map(
+                    _decode_or_error, chunk, [resize] * len(chunk))):
+                if isinstance(result, Exception):
+                    print(f"Skipping {image_path}: {result}")
+                    counts['failed'] += 1
+                    continue
+                image_np, entry = result
+                data_file.write(image_np.tobytes())
+                entry['offset'] = offset
+                offset += image_np.nbytes
+                counts['updated' if image_path in entries else 'added'] += 1
+                # Re-inserted so that the images are in the order they are cached
+                entries.pop(image_path, None)
+                entries[image_path] = entry
+
+    live_bytes = sum(_num_bytes(entry['shape']) for entry in entries.values())
+    if offset > 2 * live_bytes:
+        _compact(cache_dir, index)
+    else:
+        _write_index(cache_dir, index)
+    _remove_stale_data_files(cache_dir, index)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a pre-decoded image cache")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--input', help="directory searched recursively for images")
+    inputs.add_argument('--file_list', help="text file with one image path per line")
+    parser.add_argument('--cache', required=True, help="directory of the cache")
+    parser.add_argument('--resize', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        help="resize the images before caching them")
+    parser.add_argument('--workers', type=int, default=4, help="decoding threads")
+    parser.add_argument('--verify', action='store_true',
+                        help="check the content hash of every cached image")
+    args = parser.parse_args()
+
+    image_paths = list_images(args.input, args.file_list)
+    if not image_paths:
+        print("No images to cache")
+        sys.exit(1)
+    start = time.perf_counter()
+    counts = build_image_cache(image_paths, args.cache, resize=args.resize,
+                               workers=args.workers, verify=args.verify)
+    elapsed = time.perf_counter() - start
+    print(f"{len(image_paths)} images in {elapsed:.1f}s: {counts['cached']} cached, "
+          f"{counts['added']} added, {counts['updated']} updated, {counts['failed']} failed")
+    size = os.path.getsize(_data_path(args.cache, _read_index(args.cache)))
+    print(f"Cache {args.cache}: {size / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
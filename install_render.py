@@ -67,6 +67,18 @@ def test_imports():
         print(f"❌ Import failed: {e}")
         return False
 
+def prefetch_model():
+    """Install the model into the local model store, so startup does not download it"""
+    try:
+        print("\nPrefetching the model...")
+        import model_store
+        model_store.install_model()
+        print("✅ Model installed in the model store")
+        return True
+    except Exception as e:
+        print(f"❌ Model prefetch failed: {e}")
+        return False
+
 def create_gitignore():
     """Create .gitignore for deployment"""
     gitignore_content = """# Python
@@ -94,6 +106,7 @@ wheels/
 # Model files
 *.tar.gz
 faster_rcnn_resnet101_coco_11_06_2017/
+model_store/
 
 # IDE
 .vscode/
@@ -151,6 +164,10 @@ def main():
         print("\n⚠️  Some imports failed, but you can still deploy")
         print("   Render will install dependencies during build")
     
+    # Prefetch the model
+    if not prefetch_model():
+        print("\n⚠️  Model prefetch failed, the API will download the model on first startup")
+    
     print("\n" + "=" * 60)
     print("✅ Render deployment preparation completed!")
     print("=" * 60)
@@ -160,7 +177,7 @@ def main():
     print("3. Create a new Web Service")
     print("4. Connect your GitHub repository")
     print("5. Use the following settings:")
-    print("   - Build Command: pip install -r requirements-render.txt")
+    print("   - Build Command: pip install -r requirements-render.txt && python model_store.py install")
     print("   - Start Command: python main.py")
     print("   - Health Check Path: /health")
     print("\nYour API will be available at: https://your-app-name.onrender.com")
@@ -4,18 +4,18 @@
 ### Import Important Libraries
 import numpy as np
 import os
-import urllib.request
 import tarfile
 import tensorflow as tf
 from PIL import Image
 from os import path
+import model_store
 from utils import label_map_util
 from utils import visualization_utils as vis_util
 import cv2
 import base64
 import io
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Response
+from pydantic import BaseModel, Field
 from typing import Dict, Any, List
 import uvicorn
 
@@ -37,6 +37,15 @@ def detect_red_and_yellow(img, Threshold=0.01):
     :param Threshold:
     :return:
     """
+    return red_and_yellow_ratio(img) > Threshold
+
+### Function To Compute the Fraction of Red and Yellow Pixels
+def red_and_yellow_ratio(img):
+    """
+    fraction of red and yellow pixels of a traffic light crop
+    :param img: RGB crop, PIL image or numpy array
+    :return: ratio in [0, 1]
+    """
     desired_dim = (30, 90)  # width, height
     img = cv2.resize(np.array(img), desired_dim, interpolation=cv2.INTER_LINEAR)
     img_hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
@@ -59,13 +68,8 @@ def detect_red_and_yellow(img, Threshold=0.01):
     # red pixels' mask
     mask = mask0 + mask1 + mask2
 
-    # Compare the percentage of red values
-    rate = np.count_nonzero(mask) / (desired_dim[0] * desired_dim[1])
-
-    if rate > Threshold:
-        return True
-    else:
-        return False
+    # Percentage of red values
+    return np.count_nonzero(mask) / (desired_dim[0] * desired_dim[1])
 
 ### Loading Image Into Numpy Array
 def load_image_into_numpy_array(image):
@@ -100,71 +104,44 @@ class DetectionResponse(BaseModel):
     confidence: float
     message: str
 
+class AnnotatedImageRequest(ImageRequest):
+    format: str = Field("jpeg", description="Output format: jpeg, png or webp")
+    quality: int = Field(85, ge=1, le=100, description="JPEG and WebP quality")
+    compress_level: int = Field(1, ge=0, le=9,
+                                description="PNG compression level, 0 (fastest) to 9 (smallest)")
+    scale: float = Field(1.0, gt=0, le=1, description="Downscale factor of the returned image")
+
+# Content types of the annotated image formats
+ANNOTATED_MEDIA_TYPES = {"jpeg": "image/jpeg", "jpg": "image/jpeg", "png": "image/png",
+                         "webp": "image/webp"}
+
 ### Initialize model function
 def initialize_model():
     global detection_graph, category_index, sess
     
-    MODEL_NAME = 'faster_rcnn_resnet101_coco_11_06_2017'
+    MODEL_NAME = model_store.DEFAULT_MODEL
     MODEL_FILE = MODEL_NAME + '.tar.gz'
-    DOWNLOAD_BASE = 'http://download.tensorflow.org/models/object_detection/'
-    PATH_TO_CKPT = MODEL_NAME + '/frozen_inference_graph.pb'
     PATH_TO_LABELS = 'mscoco_label_map.pbtxt'
     NUM_CLASSES = 90
 
-    # Download and extract model if needed
-    if path.isdir(MODEL_NAME) is False:
-        if not path.exists(MODEL_FILE):
-            print(f"Downloading {MODEL_FILE}...")
-            
-            # Try multiple download URLs
-            download_urls = [
-                DOWNLOAD_BASE + MODEL_FILE,
-                f"https://storage.googleapis.com/download.tensorflow.org/models/object_detection/{MODEL_FILE}",
-                f"https://github.com/tensorflow/models/raw/master/research/object_detection/test_images/{MODEL_FILE}"
-            ]
-            
-            download_success = False
-            for i, url in enumerate(download_urls):
-                try:
-                    print(f"Trying download URL {i+1}: {url}")
-                    urllib.request.urlretrieve(url, MODEL_FILE)
-                    print("Download completed!")
-                    download_success = True
-                    break
-                except Exception as e:
-                    print(f"Download attempt {i+1} failed: {e}")
-                    if i < len(download_urls) - 1:
-                        print("Trying next URL...")
-                    continue
-            
-            if not download_success:
-                print("\n" + "="*60)
-                print("AUTOMATIC DOWNLOAD FAILED")
-                print("="*60)
-                print("Please manually download the model file:")
-                print(f"1. Go to: https://github.com/tensorflow/models")
-                print(f"2. Search for: {MODEL_FILE}")
-                print(f"3. Or try: https://storage.googleapis.com/download.tensorflow.org/models/object_detection/{MODEL_FILE}")
-                print(f"4. Download the file and place it in: {os.getcwd()}")
-                print(f"5. Then restart the API")
-                print("="*60)
-                return False
-        else:
-            print(f"Model file {MODEL_FILE} already exists, skipping download...")
-        
-        # Extract the model
-        print(f"Extracting {MODEL_FILE}...")
+    # Resolve the model in the local store; it is normally installed at build time
+    try:
+        PATH_TO_CKPT = model_store.resolve_model(MODEL_NAME)
+    except RuntimeError as e:
+        print(f"{e}, installing it now...")
         try:
-            tar_file = tarfile.open(MODEL_FILE)
-            for file in tar_file.getmembers():
-                file_name = os.path.basename(file.name)
-                if 'frozen_inference_graph.pb' in file_name:
-                    tar_file.extract(file, os.getcwd())
-            tar_file.close()
-            print("Model extraction completed!")
-        except Exception as e:
-            print(f"Extraction failed: {e}")
-            print("The tar.gz file might be corrupted. Please delete it and try again.")
+            PATH_TO_CKPT = model_store.install_model(
+                MODEL_NAME, archive=MODEL_FILE if path.exists(MODEL_FILE) else None)
+        except (RuntimeError, OSError, tarfile.TarError) as e:
+            print("\n" + "="*60)
+            print("MODEL INSTALLATION FAILED")
+            print("="*60)
+            print(f"Error: {e}")
+            print("Please manually download the model file:")
+            print(f"1. Download: https://storage.googleapis.com/download.tensorflow.org/models/object_detection/{MODEL_FILE}")
+            print(f"2. Run: python model_store.py install {MODEL_NAME} --archive {MODEL_FILE}")
+            print(f"3. Then restart the API")
+            print("="*60)
             return False
 
     # Load the model
@@ -198,64 +175,128 @@ async def root():
 async def health_check():
     return {"status": "healthy", "model_loaded": detection_graph is not None}
 
+### Detection helpers
+def check_model_loaded():
+    if detection_graph is None or category_index is None or sess is None:
+        raise HTTPException(status_code=500, detail="Model not loaded. Please check server logs.")
+
+def decode_base64_image(image_base64):
+    """
+    decode a base64 encoded image
+    :param image_base64: base64 string
+    :return: RGB PIL image
+    """
+    image_data = base64.b64decode(image_base64)
+    image = Image.open(io.BytesIO(image_data))
+
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+def run_detection(image):
+    """
+    run the detector on an image
+    :param image: RGB PIL image
+    :return: boxes [N, 4] in normalized coordinates, scores [N] and int32 classes [N]
+    """
+    # Convert to numpy array
+    image_np = load_image_into_numpy_array(image)
+    image_np_expanded = np.expand_dims(image_np, axis=0)
+
+    # Get model tensors
+    image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
+    detection_boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
+    detection_scores = detection_graph.get_tensor_by_name('detection_scores:0')
+    detection_classes = detection_graph.get_tensor_by_name('detection_classes:0')
+    num_detections = detection_graph.get_tensor_by_name('num_detections:0')
+
+    # Run detection
+    (boxes, scores, classes, num) = sess.run(
+        [detection_boxes, detection_scores, detection_classes, num_detections],
+        feed_dict={image_tensor: image_np_expanded})
+    return np.squeeze(boxes), np.squeeze(scores), np.squeeze(classes).astype(np.int32)
+
+def detection_response(image, boxes, scores, classes):
+    """
+    determine the Go/Stop command of the detections of an image
+    :return: DetectionResponse
+    """
+    # Check for traffic lights
+    stop_flag = read_traffic_lights_object(image, boxes, scores, classes)
+
+    # Determine command
+    if stop_flag:
+        command = "Stop"
+        message = "Red or yellow traffic light detected"
+        confidence = float(np.max(scores))
+    else:
+        command = "Go"
+        message = "No red or yellow traffic light detected"
+        confidence = float(np.max(scores))
+
+    return DetectionResponse(
+        command=command,
+        confidence=confidence,
+        message=message
+    )
+
 @app.post("/detect", response_model=DetectionResponse)
 async def detect_traffic_light(request: ImageRequest):
     """
     Detect traffic light in base64 encoded image and return Go/Stop command
     """
-    global detection_graph, category_index, sess
-    
-    if detection_graph is None or category_index is None or sess is None:
-        raise HTTPException(status_code=500, detail="Model not loaded. Please check server logs.")
+    check_model_loaded()
     
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(request.image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to numpy array
-        image_np = load_image_into_numpy_array(image)
-        image_np_expanded = np.expand_dims(image_np, axis=0)
-        
-        # Get model tensors
-        image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
-        detection_boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
-        detection_scores = detection_graph.get_tensor_by_name('detection_scores:0')
-        detection_classes = detection_graph.get_tensor_by_name('detection_classes:0')
-        num_detections = detection_graph.get_tensor_by_name('num_detections:0')
-        
-        # Run detection
-        (boxes, scores, classes, num) = sess.run(
-            [detection_boxes, detection_scores, detection_classes, num_detections],
-            feed_dict={image_tensor: image_np_expanded})
-        
-        # Check for traffic lights
-        stop_flag = read_traffic_lights_object(image, np.squeeze(boxes), np.squeeze(scores),
-                                               np.squeeze(classes).astype(np.int32))
-        
-        # Determine command
-        if stop_flag:
-            command = "Stop"
-            message = "Red or yellow traffic light detected"
-            confidence = float(np.max(scores))
-        else:
-            command = "Go"
-            message = "No red or yellow traffic light detected"
-            confidence = float(np.max(scores))
-        
-        return DetectionResponse(
-            command=command,
-            confidence=confidence,
-            message=message
-        )
+        image = decode_base64_image(request.image_base64)
+        boxes, scores, classes = run_detection(image)
+        return detection_response(image, boxes, scores, classes)
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
 
+@app.post("/detect/annotated")
+async def detect_traffic_light_annotated(request: AnnotatedImageRequest):
+    """
+    Detect traffic light in base64 encoded image and return the image with the
+    detected traffic lights drawn on it; the Go/Stop command and confidence are
+    returned in the X-Command and X-Confidence headers
+    """
+    check_model_loaded()
+    image_format = request.format.lower()
+    if image_format not in ANNOTATED_MEDIA_TYPES:
+        raise HTTPException(status_code=400,
+                            detail=f"Unsupported format {request.format}, "
+                                   f"should be one of {sorted(ANNOTATED_MEDIA_TYPES)}")
+
+    try:
+        image = decode_base64_image(request.image_base64)
+        boxes, scores, classes = run_detection(image)
+        result = detection_response(image, boxes, scores, classes)
+
+        # Downscale before drawing: boxes are in normalized coordinates, and
+        # drawing and encoding the smaller image is faster
+        if request.scale < 1:
+            im_width, im_height = image.size
+            image = image.resize((max(1, round(im_width * request.scale)),
+                                  max(1, round(im_height * request.scale))), Image.BILINEAR)
+        image_np = np.array(image)
+        vis_util.visualize_boxes_and_labels_on_image_array(
+            image_np, boxes, classes, scores, category_index,
+            use_normalized_coordinates=True,
+            line_thickness=max(1, round(4 * request.scale)))
+        content = vis_util.encode_image_array(image_np, image_format=image_format,
+                                              quality=request.quality,
+                                              compress_level=request.compress_level)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
+
+    return Response(content=content, media_type=ANNOTATED_MEDIA_TYPES[image_format],
+                    headers={"X-Command": result.command,
+                             "X-Confidence": f"{result.confidence:.4f}"})
+
 @app.post("/detect-batch")
 async def detect_traffic_lights_batch(images: List[ImageRequest]):
     """
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Local content-addressed model store
+
+Model files are stored once under the SHA-256 of their content, and a manifest
+per model name records which file it resolves to:
+
+    objects/<sha256>:       the model file, e.g. a frozen_inference_graph.pb
+    models/<name>.json:     name, file, sha256 and size of the model file, and
+                            the source and SHA-256 of the archive it came from
+
+Installing a model downloads its archive (or reads a local one), extracts the
+model file and moves it into place with an atomic rename, followed by the
+manifest, so that a worker never sees a partial file and several workers can
+share the store, set by the MODEL_STORE_DIR environment variable. Models are
+meant to be installed at build time (install_render.py, setup_environment.py
+or this script); at startup resolve_model only reads the manifest and checks
+the size of the file, without network access or archive scanning.
+
+Usage:
+    python model_store.py install
+    python model_store.py install faster_rcnn_resnet101_coco_11_06_2017 --archive model.tar.gz
+    python model_store.py verify
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import urllib.request
+
+DEFAULT_MODEL = 'faster_rcnn_resnet101_coco_11_06_2017'
+MODEL_MEMBER = 'frozen_inference_graph.pb'
+DOWNLOAD_BASES = [
+    'http://download.tensorflow.org/models/object_detection/',
+    'https://storage.googleapis.com/download.tensorflow.org/models/object_detection/',
+]
+STORE_DIR = os.environ.get('MODEL_STORE_DIR',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_store'))
+
+
+### Paths
+def _manifest_path(name, store_dir):
+    return os.path.join(store_dir, 'models', name + '.json')
+
+
+def _object_path(sha256, store_dir):
+    return os.path.join(store_dir, 'objects', sha256)
+
+
+def _temporary_file(directory):
+    # Created in the store, so that it can be renamed into place atomically
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    # Readable by the workers of other users, like files created with open()
+    os.chmod(temporary_path, 0o644)
+    return os.fdopen(fd, 'wb'), temporary_path
+
+
+def _copy_and_hash(source, destination, chunk_size=1 << 20):
+    """
+    copy a file object to another, hashing its content
+    :return: SHA-256 hex digest and number of bytes copied
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: source.read(chunk_size), b''):
+        sha256.update(chunk)
+        destination.write(chunk)
+        size += len(chunk)
+    destination.flush()
+    os.fsync(destination.fileno())
+    return sha256.hexdigest(), size
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+### Lookup
+def read_manifest(name, store_dir=STORE_DIR):
+    """
+    :return: manifest dict of the model, or None if it is not installed
+    """
+    manifest_path = _manifest_path(name, store_dir)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def resolve_model(name=DEFAULT_MODEL, store_dir=STORE_DIR, verify=False):
+    """
+    path of an installed model file, checked against its manifest
+    :param name: name of the model
+    :param verify: if True, the SHA-256 of the file is checked too; otherwise
+        only its size
+    :return: path of the model file
+    :raise RuntimeError: if the model is not installed, or its file is missing
+        or does not match the manifest
+    """
+    manifest = read_manifest(name, store_dir)
+    if manifest is None:
+        raise RuntimeError(f"Model {name} is not installed in {store_dir}, "
+                           f"run: python model_store.py install {name}")
+    object_path = _object_path(manifest['sha256'], store_dir)
+    if not os.path.exists(object_path):
+        raise RuntimeError(f"Model file {object_path} of {name} is missing")
+    if os.path.getsize(object_path) != manifest['size']:
+        raise RuntimeError(f"Model file {object_path} of {name} has the wrong size")
+    if verify and file_sha256(object_path) != manifest['sha256']:
+        raise RuntimeError(f"Model file {object_path} of {name} has the wrong checksum")
+    return object_path
+
+
+### Install
+def download_archive(name, destination):
+    """
+    download the archive of a model into a file object, trying every mirror
+    :return: URL the archive was downloaded from, SHA-256 and size of the archive
+    """
+    errors = []
+    for base in DOWNLOAD_BASES:
+        url = base + name + '.tar.gz'
+        try:
+            print(f"Downloading {url}...")
+            with urllib.request.urlopen(url) as response:
+                destination.seek(0)
+                destination.truncate()
+                sha256, size = _copy_and_hash(response, destination)
+            return url, sha256, size
+        except OSError as e:
+            print(f"Download failed: {e}")
+            errors.append(f"{url}: {e}")
+    raise RuntimeError(f"Could not download {name}: " + '; '.join(errors))
+
+
+def extract_member(archive, member_name, store_dir):
+    """
+    extract a file of a tar archive into the store
+    :param archive: path or file object of the .tar.gz archive
+    :param member_name: file name of the member, in whichever directory
+    :return: SHA-256 and size of the member, and the path of the extracted file
+    """
+    opened = tarfile.open(archive, 'r:gz') if isinstance(archive, str) else \
+        tarfile.open(fileobj=archive, mode='r:gz')
+    with opened as tar_file:
+        for member in tar_file:
+            if member.isfile() and os.path.basename(member.name) == member_name:
+                destination, temporary_path = _temporary_file(os.path.join(store_dir, 'objects'))
+                with destination, tar_file.extractfile(member) as source:
+                    sha256, size = _copy_and_hash(source, destination)
+                return sha256, size, temporary_path
+    raise RuntimeError(f"No {member_name} in the model archive")
+
+
+def _write_manifest(manifest, store_dir):
+    manifest_path = _manifest_path(manifest['name'], store_dir)
+    destination, temporary_path = _temporary_file(os.path.dirname(manifest_path))
+    with destination:
+        destination.write(json.dumps(manifest, indent=2).encode())
+    os.replace(temporary_path, manifest_path)
+
+
+def install_model(name=DEFAULT_MODEL, store_dir=STORE_DIR, archive=None, archive_sha256=None,
+                  member_name=MODEL_MEMBER, force=False):
+    """
+    install a model into the store, unless it is already installed
+    :param name: name of the model, e.g. faster_rcnn_resnet101_coco_11_06_2017
+    :param archive: optional path of the .tar.gz archive; downloaded otherwise
+    :param archive_sha256: optional expected SHA-256 of the archive
+    :param member_name: file name of the model file in the archive
+    :param force: if True, the model is installed again even if it is valid
+    :return: path of the model file
+    """
+    if not force:
+        try:
+            return resolve_model(name, store_dir)
+        except RuntimeError:
+            pass
+
+    temporary_paths = []
+    try:
+        if archive is None:
+            archive_file, archive_path = _temporary_file(os.path.join(store_dir, 'downloads'))
+            temporary_paths.append(archive_path)
+            with archive_file:
+                source, archive_digest, _ = download_archive(name, archive_file)
+            archive = archive_path
+        else:
+            source, archive_digest = os.path.abspath(archive), file_sha256(archive)
+        if archive_sha256 and archive_digest != archive_sha256.lower():
+            raise RuntimeError(f"Checksum mismatch of the {name} archive: "
+                               f"expected {archive_sha256}, got {archive_digest}")
+
+        print(f"Extracting {member_name} from {archive}...")
+        sha256, size, extracted_path = extract_member(archive, member_name, store_dir)
+        temporary_paths.append(extracted_path)
+        # Identical content has the same name, so a concurrent install is harmless
+        os.replace(extracted_path, _object_path(sha256, store_dir))
+        _write_manifest({'name': name, 'file': member_name, 'sha256': sha256, 'size': size,
+                         'archive_sha256': archive_digest, 'source': source}, store_dir)
+    finally:
+        for temporary_path in temporary_paths:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+    print(f"Installed {name} ({sha256[:12]}, {size / 2**20:.1f} MiB) in {store_dir}")
+    return resolve_model(name, store_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local content-addressed model store")
+    parser.add_argument('command', choices=['install', 'verify', 'path'])
+    parser.add_argument('name', nargs='?', default=DEFAULT_MODEL, help="name of the model")
+    parser.add_argument('--store', default=STORE_DIR,
+                        help="directory of the store, defaults to MODEL_STORE_DIR")
+    parser.add_argument('--archive', help="local .tar.gz archive of the model")
+    parser.add_argument('--sha256', help="expected SHA-256 of the archive")
+    parser.add_argument('--force', action='store_true', help="install the model again")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'install':
+            install_model(args.name, args.store, archive=args.archive,
+                          archive_sha256=args.sha256, force=args.force)
+        elif args.command == 'verify':
+            print(f"{args.name}: OK ({resolve_model(args.name, args.store, verify=True)})")
+        else:
+            print(resolve_model(args.name, args.store))
+    except (RuntimeError, OSError, tarfile.TarError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
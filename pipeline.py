@@ -0,0 +1,257 @@
+"""
+Pipelined processing with bounded queues
+
+Every stage runs in its own thread and is connected to the next one by a
+bounded queue, so that decoding, inference, color classification and output
+overlap instead of running one after the other. TensorFlow, OpenCV and most
+NumPy operations release the GIL, so threads are enough to keep the stages busy.
+
+A stage is a function that takes the iterator of items of the previous stage
+(None for the first stage) and yields the items of the next stage; it can
+consume and yield any number of items, e.g. to batch them, and return before
+its input is exhausted, which stops the stages before it. For every stage the
+time spent waiting for input, waiting for room in the output queue and working
+is recorded, which shows the bottleneck of the pipeline:
+
+    stats = run_pipeline([('read', read_items), ('detect', detect), ('write', write)])
+    print_stage_report(stats)
+
+The detection stages run the model of main.py on records, dicts holding the
+RGB numpy 'image' of every item.
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# End of the items of a queue
+_END = object()
+# How long blocked stages wait before checking whether the pipeline stopped
+_POLL_SECONDS = 0.1
+
+
+### Pipeline
+class StageQueue(queue.Queue):
+    """
+    a bounded queue between two stages, which the consuming stage closes when it
+    returns before the end of its input, so that the producing stage stops
+    """
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize=maxsize)
+        self.closed = threading.Event()
+
+
+class Stage(threading.Thread):
+    """
+    a thread running one stage of a pipeline
+    """
+    def __init__(self, name, fn, input_queue, output_queue, stop_event):
+        """
+        :param name: name of the stage, used in reports
+        :param fn: function taking an iterator of input items (None for the first
+            stage) and yielding output items
+        :param input_queue: StageQueue of the input items, None for the first stage
+        :param output_queue: StageQueue of the output items, None for the last stage
+        :param stop_event: threading.Event set when the pipeline must stop
+        """
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stop_event = stop_event
+        self.num_items = 0
+        self.input_wait_seconds = 0.0
+        self.output_wait_seconds = 0.0
+        self.elapsed_seconds = 0.0
+        self.error = None
+        self.input_exhausted = False
+
+    def _inputs(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                item = self.input_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            finally:
+                self.input_wait_seconds += time.perf_counter() - start
+            if item is _END:
+                self.input_exhausted = True
+                return
+            yield item
+
+    def _put(self, item):
+        """
+        :return: False if the item was not put because the pipeline stopped or
+            the next stage closed its input
+        """
+        start = time.perf_counter()
+        try:
+            while not (self.stop_event.is_set() or self.output_queue.closed.is_set()):
+                try:
+                    self.output_queue.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.output_wait_seconds += time.perf_counter() - start
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            inputs = None if self.input_queue is None else self._inputs()
+            for item in self.fn(inputs):
+                self.num_items += 1
+                if self.output_queue is not None and not self._put(item):
+                    break
+                if self.stop_event.is_set():
+                    break
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+        finally:
+            if self.input_queue is not None and not self.input_exhausted:
+                # Otherwise the previous stage would block on the full queue
+                self.input_queue.closed.set()
+            if self.output_queue is not None:
+                self._put(_END)
+            self.elapsed_seconds = time.perf_counter() - start
+
+    def stats(self):
+        """
+        :return: dict with the number of items yielded by the stage, and its
+            wall, busy and waiting times
+        """
+        busy_seconds = max(0.0, self.elapsed_seconds - self.input_wait_seconds -
+                           self.output_wait_seconds)
+        return {
+            'stage': self.name,
+            'items': self.num_items,
+            'elapsed_seconds': self.elapsed_seconds,
+            'busy_seconds': busy_seconds,
+            'input_wait_seconds': self.input_wait_seconds,
+            'output_wait_seconds': self.output_wait_seconds,
+            'utilization': busy_seconds / self.elapsed_seconds if self.elapsed_seconds else 0.0,
+        }
+
+
+def run_pipeline(stages, queue_size=8):
+    """
+    run stages connected by bounded queues until the first stage is exhausted,
+    or a stage returns before the end of its input
+    :param stages: list of (name, fn) tuples, see Stage
+    :param queue_size: maximum number of items waiting between two stages
+    :return: list of the stats of every stage
+    """
+    stop_event = threading.Event()
+    queues = [StageQueue(maxsize=queue_size) for _ in range(len(stages) - 1)]
+    threads = [Stage(name, fn, queues[i - 1] if i > 0 else None,
+                     queues[i] if i < len(queues) else None, stop_event)
+               for i, (name, fn) in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            # Joining with a timeout keeps the main thread responsive to Ctrl+C
+            while thread.is_alive():
+                thread.join(_POLL_SECONDS)
+    except KeyboardInterrupt:
+        stop_event.set()
+        raise
+    for thread in threads:
+        if thread.error is not None:
+            raise RuntimeError(f"Stage {thread.name} failed: {thread.error}") from thread.error
+    return [thread.stats() for thread in threads]
+
+
+def print_stage_report(stats):
+    """
+    print the utilization of every stage; the busiest stage is the bottleneck
+    :param stats: list of stage stats returned by run_pipeline
+    """
+    print("=" * 78)
+    print("Stage utilization")
+    print("=" * 78)
+    print("{:<12} {:>8} {:>10} {:>8} {:>13} {:>14}".format(
+        'stage', 'items', 'busy_s', 'busy', 'input_wait', 'output_wait'))
+    bottleneck = max(stats, key=lambda stage: stage['utilization'])
+    for stage in stats:
+        elapsed = stage['elapsed_seconds'] or 1.0
+        print("{:<12} {:>8d} {:>10.2f} {:>7.1%} {:>13.1%} {:>14.1%}{}".format(
+            stage['stage'], stage['items'], stage['busy_seconds'], stage['utilization'],
+            stage['input_wait_seconds'] / elapsed, stage['output_wait_seconds'] / elapsed,
+            "  <- bottleneck" if stage is bottleneck else ""))
+
+
+### Detection Stages
+def start_detector():
+    """
+    initialize the model of main.py and open a session on its graph
+    :return: tf.compat.v1.Session
+    """
+    # TensorFlow and the API module are only imported by the detection jobs.
+    import tensorflow as tf
+    import main
+
+    if not main.initialize_model():
+        raise RuntimeError("Failed to initialize model")
+    return tf.compat.v1.Session(graph=main.detection_graph)
+
+
+def _batches(records, batch_size):
+    # Images of different sizes cannot be stacked, so they end the batch.
+    batch = []
+    for record in records:
+        if batch and (len(batch) == batch_size or
+                      batch[0]['image'].shape != record['image'].shape):
+            yield batch
+            batch = []
+        batch.append(record)
+    if batch:
+        yield batch
+
+
+def detect_batches(records, sess, batch_size=4):
+    """
+    detection stage: run the detector on batches of consecutive records
+    :param records: iterator of dicts with an RGB uint8 numpy 'image'
+    :param sess: session of start_detector
+    :param batch_size: maximum number of images per inference
+    :return: iterator of the records, with 'boxes', 'scores' and 'classes'
+    """
+    import main
+
+    graph = main.detection_graph
+    image_tensor = graph.get_tensor_by_name('image_tensor:0')
+    fetches = [graph.get_tensor_by_name('detection_boxes:0'),
+               graph.get_tensor_by_name('detection_scores:0'),
+               graph.get_tensor_by_name('detection_classes:0')]
+    for batch in _batches(records, batch_size):
+        boxes, scores, classes = sess.run(
+            fetches, feed_dict={image_tensor: np.stack([record['image'] for record in batch])})
+        for i, record in enumerate(batch):
+            record['boxes'] = boxes[i]
+            record['scores'] = scores[i]
+            record['classes'] = classes[i].astype(np.int32)
+            yield record
+
+
+def classify_records(records):
+    """
+    color classification stage: the Go/Stop decision of main.py for every record
+    :param records: iterator of records of detect_batches
+    :return: iterator of the records, with 'command', 'confidence' and 'message'
+    """
+    import main
+
+    for record in records:
+        result = main.detection_response(Image.fromarray(record['image']), record['boxes'],
+                                         record['scores'], record['classes'])
+        record['command'] = result.command
+        record['confidence'] = result.confidence
+        record['message'] = result.message
+        yield record
@@ -70,6 +70,10 @@ def setup_tensorflow_models():
         print(f"✗ Failed to create directory structure: {e}")
         return False
 
+def prefetch_model():
+    """Install the detection model into the local model store."""
+    return run_command(f'"{sys.executable}" model_store.py install', "Installing the model into the model store")
+
 def main():
     """Main setup function."""
     print("Traffic Light Detection and Color Recognition - Environment Setup")
@@ -97,6 +101,9 @@ def main():
     # Setup TensorFlow models
     setup_tensorflow_models()
     
+    # Download the model at setup time rather than on first startup
+    success &= prefetch_model()
+    
     if success:
         print("\n" + "=" * 60)
         print("✓ Environment setup completed successfully!")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark
+
+Imports every module in a fresh Python interpreter, as a server cold start or
+a worker respawn does, and reports its import time and the dependencies that
+take the longest to import (from python -X importtime).
+
+Usage:
+    python startup_benchmark.py
+    python startup_benchmark.py --modules main utils.visualization_utils --repeats 5
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+DEFAULT_MODULES = ['utils.visualization_utils', 'utils.label_map_util', 'utils.dataset_util',
+                   'main']
+# Heavy dependencies whose presence after the import is reported
+HEAVY_MODULES = ['tensorflow', 'matplotlib', 'cv2', 'fastapi', 'PIL.ImageDraw']
+
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+# Written before the import, to skip the imports of the interpreter startup
+_START_MARKER = '--- import start ---'
+
+
+### Measurement
+def measure_import(module):
+    """
+    import a module in a fresh interpreter
+    :param module: name of the module
+    :return: import time in seconds, dict of the cumulative import time in
+        seconds of every top-level package it imported, and list of the heavy
+        modules loaded
+    """
+    code = (f"import sys, time; sys.stderr.write({_START_MARKER!r} + '\\n'); "
+            f"start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start); "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    seconds, heavy_modules = result.stdout.splitlines()[-2:]
+
+    packages = {}
+    own_package = module.split('.')[0]
+    import_lines = result.stderr.split(_START_MARKER)[-1].splitlines()
+    for line in import_lines:
+        match = _IMPORTTIME_LINE.match(line)
+        # Only top-level packages, at whatever depth they were first imported
+        if match and '.' not in match.group(4) and match.group(4) != own_package:
+            packages[match.group(4)] = int(match.group(2)) / 1e6
+    return float(seconds), packages, [m for m in heavy_modules.split(',') if m]
+
+
+### Output
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the server modules")
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES)
+    parser.add_argument('--repeats', type=int, default=3, help="the fastest run is reported")
+    parser.add_argument('--top', type=int, default=5,
+                        help="number of slowest dependencies reported per module")
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print("Import time (fresh interpreter)")
+    print("=" * 78)
+    for module in args.modules:
+        try:
+            runs = [measure_import(module) for _ in range(args.repeats)]
+        except RuntimeError as e:
+            print(f"{module:<30} failed: {e}")
+            continue
+        seconds, packages, heavy_modules = min(runs, key=lambda run: run[0])
+        print(f"{module:<30} {1000 * seconds:>9.1f} ms   "
+              f"heavy modules loaded: {', '.join(heavy_modules) or 'none'}")
+        slowest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        for package, package_seconds in slowest:
+            print(f"    {package:<26} {1000 * package_seconds:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
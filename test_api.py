@@ -74,6 +74,32 @@ def test_batch_images(api_url, image_paths):
     except Exception as e:
         print(f"❌ Exception: {e}")
 
+def test_annotated_image(api_url, image_path, output_path, image_format="jpeg", scale=0.5):
+    """Test annotated image detection"""
+    print(f"Testing annotated image: {image_path}")
+    
+    payload = {
+        "image_base64": image_to_base64(image_path),
+        "format": image_format,
+        "scale": scale
+    }
+    
+    try:
+        response = requests.post(f"{api_url}/detect/annotated", json=payload)
+        
+        if response.status_code == 200:
+            with open(output_path, "wb") as f:
+                f.write(response.content)
+            print(f"✅ Result: {response.headers['X-Command']}")
+            print(f"   Confidence: {response.headers['X-Confidence']}")
+            print(f"   Saved {len(response.content)} bytes to {output_path}")
+        else:
+            print(f"❌ Error: {response.status_code}")
+            print(f"   {response.text}")
+    
+    except Exception as e:
+        print(f"❌ Exception: {e}")
+
 def test_health_check(api_url):
     """Test API health"""
     try:
@@ -115,6 +141,10 @@ if __name__ == "__main__":
     print("\n3. Testing batch detection...")
     test_batch_images(API_URL, test_images)
     
+    # Test annotated image
+    print("\n4. Testing annotated image...")
+    test_annotated_image(API_URL, test_images[0], "annotated_img_1.jpg")
+    
     print("\n" + "=" * 60)
     print("Test completed!")
     print("=" * 60)
\ No newline at end of file
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests of the pipeline runner (no model needed)
+
+Usage:
+    python -m pytest test_pipeline.py
+"""
+
+import itertools
+import threading
+
+import pytest
+
+from pipeline import run_pipeline
+
+# Longest a test pipeline may run before it is considered deadlocked
+TIMEOUT_SECONDS = 10
+
+
+def run_with_timeout(stages, queue_size=2):
+    """
+    run a pipeline in a thread, failing if it does not finish in time
+    :return: list of the stats of every stage
+    """
+    result = {}
+
+    def target():
+        try:
+            result['stats'] = run_pipeline(stages, queue_size=queue_size)
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT_SECONDS)
+    assert not thread.is_alive(), "pipeline deadlocked"
+    if 'error' in result:
+        raise result['error']
+    return result['stats']
+
+
+def produce(_, num_items=20):
+    yield from range(num_items)
+
+
+def double(items):
+    for item in items:
+        yield 2 * item
+
+
+def test_items_flow_through_all_stages():
+    outputs = []
+
+    def collect(items):
+        for item in items:
+            outputs.append(item)
+            yield item
+
+    stats = run_with_timeout([('produce', produce), ('double', double), ('collect', collect)])
+    assert outputs == [2 * i for i in range(20)]
+    assert [stage['stage'] for stage in stats] == ['produce', 'double', 'collect']
+    assert [stage['items'] for stage in stats] == [20, 20, 20]
+
+
+def test_stage_error_stops_the_pipeline():
+    def fail(items):
+        for item in items:
+            if item == 5:
+                raise ValueError("bad item")
+            yield item
+
+    with pytest.raises(RuntimeError, match="Stage fail failed: bad item"):
+        run_with_timeout([('produce', lambda _: itertools.count()), ('fail', fail),
+                          ('double', double)])
+
+
+def test_stage_returning_early_stops_the_previous_stages():
+    outputs = []
+
+    def take_three(items):
+        yield from itertools.islice(items, 3)
+
+    def collect(items):
+        for item in items:
+            outputs.append(item)
+            yield item
+
+    # The first stage never ends by itself
+    stats = run_with_timeout([('produce', lambda _: itertools.count()), ('double', double),
+                              ('take', take_three), ('collect', collect)])
+    assert outputs == [0, 2, 4]
+    assert stats[-1]['items'] == 3
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Threshold sweep for the Go/Stop decision
+
+Runs the detector and computes the red and yellow ratio of every traffic light
+crop once over a labeled image set, caches them, and then evaluates every
+combination of min_score_thresh and max_boxes_to_draw (read_traffic_lights_object)
+and Threshold (detect_red_and_yellow) with vectorized comparisons.
+
+Reports accuracy, stop recall and false stop rate for every combination, and
+the Pareto front of stop recall against false stop rate.
+
+The labels file is a CSV with an image column (path relative to --images) and a
+command column (Go or Stop):
+
+    image,command
+    frame_0001.jpg,Stop
+    frame_0002.jpg,Go
+
+Usage:
+    python threshold_sweep.py --images data/ --labels data/labels.csv
+    python threshold_sweep.py --images data/ --labels data/labels.csv \\
+        --score_thresholds 0.3 0.5 0.7 --max_boxes 5 20 --ratios 0.01 0.05 \\
+        --output sweep.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+TRAFFIC_LIGHT_LABEL = 10
+
+
+### Labeled Set
+def load_labels(labels_path, images_dir):
+    """
+    read the labeled set
+    :param labels_path: CSV file with image and command columns
+    :param images_dir: directory the image paths are relative to
+    :return: list of image paths, boolean numpy array, True for Stop
+    """
+    image_paths = []
+    is_stop = []
+    with open(labels_path, newline='') as f:
+        for row in csv.DictReader(f):
+            command = row['command'].strip().lower()
+            if command not in ('go', 'stop'):
+                raise ValueError(f"Unknown command {row['command']!r} for {row['image']}")
+            image_paths.append(os.path.join(images_dir, row['image']))
+            is_stop.append(command == 'stop')
+    return image_paths, np.array(is_stop, dtype=bool)
+
+
+### Detection Pass
+def collect_detections(image_paths, traffic_ligth_label=TRAFFIC_LIGHT_LABEL):
+    """
+    run the detector once per image and compute the red and yellow ratio of
+    every traffic light box, whatever its score
+    :param image_paths: list of image paths
+    :param traffic_ligth_label: class of traffic lights
+    :return: scores and ratios, float arrays of shape [num_images, num_boxes];
+        ratios are NaN for boxes of other classes
+    """
+    # The detector is only needed when the cache is missing.
+    import tensorflow as tf
+    import main
+
+    if not main.initialize_model():
+        raise RuntimeError("Failed to initialize model")
+    graph = main.detection_graph
+    image_tensor = graph.get_tensor_by_name('image_tensor:0')
+    fetches = [graph.get_tensor_by_name('detection_boxes:0'),
+               graph.get_tensor_by_name('detection_scores:0'),
+               graph.get_tensor_by_name('detection_classes:0')]
+
+    all_scores = []
+    all_ratios = []
+    with tf.compat.v1.Session(graph=graph) as sess:
+        for i, image_path in enumerate(image_paths):
+            image = Image.open(image_path)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image_np = main.load_image_into_numpy_array(image)
+            boxes, scores, classes = sess.run(
+                fetches, feed_dict={image_tensor: np.expand_dims(image_np, axis=0)})
+            boxes, scores = np.squeeze(boxes, axis=0), np.squeeze(scores, axis=0)
+            classes = np.squeeze(classes, axis=0).astype(np.int32)
+
+            im_width, im_height = image.size
+            ratios = np.full(scores.shape, np.nan)
+            for k in np.flatnonzero(classes == traffic_ligth_label):
+                ymin, xmin, ymax, xmax = tuple(boxes[k].tolist())
+                crop_img = image.crop((xmin * im_width, ymin * im_height,
+                                       xmax * im_width, ymax * im_height))
+                ratios[k] = main.red_and_yellow_ratio(crop_img)
+            all_scores.append(scores)
+            all_ratios.append(ratios)
+            print(f"Detected {i + 1}/{len(image_paths)}: {image_path}")
+    return np.stack(all_scores), np.stack(all_ratios)
+
+
+def load_or_collect_detections(image_paths, cache_path):
+    """
+    load the detection pass from cache_path, or run it and save it there
+    :return: scores and ratios, as returned by collect_detections
+    """
+    if cache_path and os.path.exists(cache_path):
+        cache = np.load(cache_path)
+        if cache['image_paths'].tolist() == list(image_paths):
+            print(f"Using cached detections from {cache_path}")
+            return cache['scores'], cache['ratios']
+        print(f"Cache {cache_path} is for a different image set, recomputing...")
+    scores, ratios = collect_detections(image_paths)
+    if cache_path:
+        np.savez(cache_path, image_paths=np.array(image_paths), scores=scores,
+                 ratios=ratios)
+    return scores, ratios
+
+
+### Vectorized Sweep
+def sweep(scores, ratios, is_stop, score_thresholds, max_boxes_values, ratio_thresholds):
+    """
+    evaluate the Go/Stop decision for every combination of thresholds
+    :param scores: float array [num_images, num_boxes], in decreasing order per image
+    :param ratios: float array [num_images, num_boxes], NaN for non traffic lights
+    :param is_stop: boolean array [num_images] of labels
+    :param score_thresholds: values of min_score_thresh
+    :param max_boxes_values: values of max_boxes_to_draw
+    :param ratio_thresholds: values of Threshold in detect_red_and_yellow
+    :return: dict of arrays of shape [S, M, T] with keys accuracy, stop_recall
+        and false_stop_rate
+    """
+    score_thresholds = np.asarray(score_thresholds, dtype=float)
+    max_boxes_values = np.asarray(max_boxes_values, dtype=int)
+    ratio_thresholds = np.asarray(ratio_thresholds, dtype=float)
+
+    # [S, T, N, K]: box k of image n makes the image a Stop
+    with np.errstate(invalid='ignore'):
+        is_stop_box = ((scores > score_thresholds[:, None, None, None]) &
+                       (ratios > ratio_thresholds[None, :, None, None]))
+    # The decision only depends on the first such box: image n is a Stop iff
+    # it is among the first max_boxes_to_draw boxes.
+    first_stop_box = np.where(is_stop_box.any(axis=-1),
+                              is_stop_box.argmax(axis=-1), np.iinfo(np.int64).max)
+    # [S, M, T, N]
+    predicted_stop = (first_stop_box[:, None, :, :] <
+                      max_boxes_values[None, :, None, None])
+
+    num_stop = np.count_nonzero(is_stop)
+    num_go = is_stop.size - num_stop
+    true_stops = np.count_nonzero(predicted_stop & is_stop, axis=-1)
+    false_stops = np.count_nonzero(predicted_stop & ~is_stop, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'accuracy': (true_stops + num_go - false_stops) / is_stop.size,
+            'stop_recall': true_stops / num_stop,
+            'false_stop_rate': false_stops / num_go,
+        }
+
+
+def pareto_front(stop_recall, false_stop_rate):
+    """
+    indices of the combinations that no other beats on both stop recall
+    (higher is better) and false stop rate (lower is better); ties are reported once
+    :param stop_recall: 1-d float array
+    :param false_stop_rate: 1-d float array
+    :return: integer array of indices, by increasing false stop rate
+    """
+    order = np.lexsort((-stop_recall, false_stop_rate))
+    sorted_recall = stop_recall[order]
+    best_previous_recall = np.concatenate(
+        [[-np.inf], np.maximum.accumulate(sorted_recall)[:-1]])
+    return order[sorted_recall > best_previous_recall]
+
+
+### Output
+COLUMNS = ['min_score_thresh', 'max_boxes_to_draw', 'threshold',
+           'accuracy', 'stop_recall', 'false_stop_rate']
+
+
+def sweep_table(results, score_thresholds, max_boxes_values, ratio_thresholds):
+    """
+    flatten the sweep results into rows of COLUMNS
+    :return: list of tuples
+    """
+    grid = np.meshgrid(score_thresholds, max_boxes_values, ratio_thresholds,
+                       indexing='ij')
+    return list(zip(grid[0].ravel().tolist(), grid[1].ravel().tolist(),
+                    grid[2].ravel().tolist(),
+                    results['accuracy'].ravel().tolist(),
+                    results['stop_recall'].ravel().tolist(),
+                    results['false_stop_rate'].ravel().tolist()))
+
+
+def print_table(rows, title):
+    print("=" * 78)
+    print(title)
+    print("=" * 78)
+    print("{:>16} {:>17} {:>9} {:>9} {:>11} {:>15}".format(*COLUMNS))
+    for row in rows:
+        print("{:>16.3f} {:>17d} {:>9.4f} {:>9.4f} {:>11.4f} {:>15.4f}".format(*row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Go/Stop threshold sweep")
+    parser.add_argument('--images', required=True, help="directory of the labeled images")
+    parser.add_argument('--labels', required=True, help="CSV file with image and command columns")
+    parser.add_argument('--cache', default='threshold_sweep_cache.npz',
+                        help="detection pass cache, reused when the image set matches")
+    parser.add_argument('--score_thresholds', type=float, nargs='+',
+                        default=np.round(np.arange(0.1, 0.96, 0.05), 2).tolist())
+    parser.add_argument('--max_boxes', type=int, nargs='+', default=[1, 2, 3, 5, 10, 20, 50, 100])
+    parser.add_argument('--ratios', type=float, nargs='+',
+                        default=[0.0, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2])
+    parser.add_argument('--top', type=int, default=20, help="number of rows printed by accuracy")
+    parser.add_argument('--output', help="optional CSV file with every combination")
+    args = parser.parse_args()
+
+    image_paths, is_stop = load_labels(args.labels, args.images)
+    if not image_paths:
+        print("No labeled images")
+        sys.exit(1)
+    scores, ratios = load_or_collect_detections(image_paths, args.cache)
+    results = sweep(scores, ratios, is_stop, args.score_thresholds, args.max_boxes,
+                    args.ratios)
+    rows = sweep_table(results, args.score_thresholds, args.max_boxes, args.ratios)
+
+    print(f"{len(image_paths)} images, {np.count_nonzero(is_stop)} Stop, "
+          f"{len(rows)} combinations")
+    by_accuracy = sorted(rows, key=lambda row: -row[3])
+    print_table(by_accuracy[:args.top], f"Top {args.top} by accuracy")
+    front = pareto_front(results['stop_recall'].ravel(), results['false_stop_rate'].ravel())
+    print_table([rows[i] for i in front], "Pareto front (stop recall vs false stop rate)")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} combinations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
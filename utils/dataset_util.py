@@ -15,7 +15,10 @@
 
 """Utility functions for creating TFRecord data sets."""
 
-import tensorflow as tf
+from . import file_io
+from . import lazy_import
+
+tf = lazy_import.LazyModule('tensorflow')
 
 
 def int64_feature(value):
@@ -55,7 +58,7 @@ def read_examples_list(path):
   Returns:
     list of example identifiers (strings).
   """
-  with tf.gfile.GFile(path) as fid:
+  with file_io.GFile(path) as fid:
     lines = fid.readlines()
   return [line.strip().split(' ')[0] for line in lines]
 
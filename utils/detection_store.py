@@ -0,0 +1,227 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Columnar on-disk store of raw detections for re-evaluation.
+
+Detections are written once, after inference, and can then be evaluated any
+number of times with different settings, e.g.:
+
+  with detection_store.DetectionStoreWriter(directory) as writer:
+    for image_id, detections_dict in run_inference(...):
+      writer.add_single_detected_image_info(image_id, detections_dict)
+
+  evaluator = object_detection_evaluation.PascalDetectionEvaluator(
+      categories, matching_iou_threshold=0.75)
+  ... add groundtruth ...
+  evaluator.add_detections_from_store(
+      detection_store.DetectionStore(directory))
+  metrics = evaluator.evaluate()
+
+The store is a directory of segments. Every segment holds the detections of
+consecutive images in one .npy file per field, with the rows of all images
+concatenated, plus the image ids and an offsets array of shape
+[num_images + 1]: the detections of image i are the rows
+offsets[i]:offsets[i + 1], as in np_box_list.BatchedBoxList. Segments are
+memory-mapped when read, so only the pages of the detections being evaluated
+are loaded. An index file lists the complete segments; it is rewritten
+atomically after every segment so that readers never see partial segments.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from object_detection.core import standard_fields
+
+_INDEX_FILENAME = 'index.json'
+_OFFSETS = 'offsets'
+_IMAGE_IDS = 'image_ids'
+
+# Stored detection fields and their on-disk dtypes.
+DETECTION_FIELDS = (
+    (standard_fields.DetectionResultFields.detection_boxes, np.float32),
+    (standard_fields.DetectionResultFields.detection_scores, np.float32),
+    (standard_fields.DetectionResultFields.detection_classes, np.int64),
+)
+
+
+def _segment_path(directory, segment_name, field):
+  return os.path.join(directory, '{}.{}.npy'.format(segment_name, field))
+
+
+def _read_index(directory):
+  index_path = os.path.join(directory, _INDEX_FILENAME)
+  if not os.path.exists(index_path):
+    return []
+  with open(index_path, 'r') as fid:
+    return json.load(fid)['segments']
+
+
+def _write_index(directory, segments):
+  index_path = os.path.join(directory, _INDEX_FILENAME)
+  with open(index_path + '.tmp', 'w') as fid:
+    json.dump({'segments': segments}, fid)
+  os.replace(index_path + '.tmp', index_path)
+
+
+class DetectionStoreWriter(object):
+  """Appends the detections of images to a detection store."""
+
+  def __init__(self, directory, images_per_segment=10000):
+    """Constructor.
+
+    Args:
+      directory: directory of the store. It is created if needed; detections
+        are appended to an existing store.
+      images_per_segment: number of images buffered in memory before they are
+        written as a segment.
+
+    Raises:
+      ValueError: if images_per_segment is not positive.
+    """
+    if images_per_segment < 1:
+      raise ValueError('images_per_segment must be positive.')
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self._directory = directory
+    self._images_per_segment = images_per_segment
+    self._segments = _read_index(directory)
+    self._clear_buffer()
+
+  def _clear_buffer(self):
+    self._image_ids = []
+    self._buffers = dict((field, []) for field, _ in DETECTION_FIELDS)
+
+  def add_single_detected_image_info(self, image_id, detections_dict):
+    """Adds detections for a single image to the store.
+
+    Args:
+      image_id: A unique string/integer identifier for the image.
+      detections_dict: A dictionary containing -
+        standard_fields.DetectionResultFields.detection_boxes: float32 numpy
+          array of shape [num_boxes, 4] containing `num_boxes` detection boxes
+          of the format [ymin, xmin, ymax, xmax] in absolute image coordinates.
+        standard_fields.DetectionResultFields.detection_scores: float32 numpy
+          array of shape [num_boxes] containing detection scores for the boxes.
+        standard_fields.DetectionResultFields.detection_classes: integer numpy
+          array of shape [num_boxes] containing 1-indexed detection classes for
+          the boxes.
+
+    Raises:
+      ValueError: if the fields have different numbers of detections.
+    """
+    num_boxes = [len(detections_dict[field]) for field, _ in DETECTION_FIELDS]
+    if len(set(num_boxes)) != 1:
+      raise ValueError('Detection fields should all have same lengths. Got '
+                       '{}'.format(num_boxes))
+    self._image_ids.append(image_id)
+    for field, dtype in DETECTION_FIELDS:
+      self._buffers[field].append(
+          np.asarray(detections_dict[field], dtype=dtype))
+    if len(self._image_ids) >= self._images_per_segment:
+      self.flush()
+
+  def flush(self):
+    """Writes the buffered images as a new segment."""
+    if not self._image_ids:
+      return
+    segment_name = 'segment-{:05d}'.format(len(self._segments))
+    num_boxes = [len(scores) for scores in self._buffers[
+        standard_fields.DetectionResultFields.detection_scores]]
+    np.save(_segment_path(self._directory, segment_name, _OFFSETS),
+            np.cumsum([0] + num_boxes).astype(np.int64))
+    np.save(_segment_path(self._directory, segment_name, _IMAGE_IDS),
+            np.array(self._image_ids))
+    for field, _ in DETECTION_FIELDS:
+      np.save(_segment_path(self._directory, segment_name, field),
+              np.concatenate(self._buffers[field]))
+    self._segments.append({'name': segment_name,
+                           'num_images': len(self._image_ids),
+                           'num_detections': int(sum(num_boxes))})
+    _write_index(self._directory, self._segments)
+    self._clear_buffer()
+
+  def close(self):
+    self.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+class DetectionStore(object):
+  """Reads the detections of a detection store.
+
+  Iterating over the store yields (image_id, detections_dict) tuples in the
+  order the images were written, where the arrays of detections_dict are
+  read-only views of the memory-mapped segments.
+  """
+
+  def __init__(self, directory):
+    """Constructor.
+
+    Args:
+      directory: directory of the store.
+
+    Raises:
+      ValueError: if the directory holds no detection store.
+    """
+    if not os.path.exists(os.path.join(directory, _INDEX_FILENAME)):
+      raise ValueError('No detection store in {}.'.format(directory))
+    self._directory = directory
+    self._segments = _read_index(directory)
+
+  def __len__(self):
+    return sum(segment['num_images'] for segment in self._segments)
+
+  @property
+  def num_detections(self):
+    return sum(segment['num_detections'] for segment in self._segments)
+
+  def __iter__(self):
+    return self.iter_detections()
+
+  def _load_segment(self, segment_name, field):
+    return np.load(_segment_path(self._directory, segment_name, field),
+                   mmap_mode='r')
+
+  def iter_detections(self, min_score_threshold=None):
+    """Yields the detections of every image.
+
+    Args:
+      min_score_threshold: if not None, only detections with scores of at
+        least min_score_threshold are returned.
+
+    Yields:
+      (image_id, detections_dict) tuples, with the fields of DETECTION_FIELDS.
+    """
+    scores_field = standard_fields.DetectionResultFields.detection_scores
+    for segment in self._segments:
+      offsets = self._load_segment(segment['name'], _OFFSETS)
+      image_ids = self._load_segment(segment['name'], _IMAGE_IDS).tolist()
+      columns = [(field, self._load_segment(segment['name'], field))
+                 for field, _ in DETECTION_FIELDS]
+      for image_index, image_id in enumerate(image_ids):
+        rows = slice(offsets[image_index], offsets[image_index + 1])
+        detections_dict = dict((field, column[rows])
+                               for field, column in columns)
+        if min_score_threshold is not None:
+          is_kept = detections_dict[scores_field] >= min_score_threshold
+          detections_dict = dict((field, values[is_kept])
+                                 for field, values in detections_dict.items())
+        yield image_id, detections_dict
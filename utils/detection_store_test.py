@@ -0,0 +1,137 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for object_detection.utils.detection_store."""
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from object_detection.core import standard_fields
+from object_detection.utils import detection_store
+from object_detection.utils import object_detection_evaluation
+
+_BOXES = standard_fields.DetectionResultFields.detection_boxes
+_SCORES = standard_fields.DetectionResultFields.detection_scores
+_CLASSES = standard_fields.DetectionResultFields.detection_classes
+
+
+class DetectionStoreTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.categories = [{'id': 1, 'name': 'cat'}, {'id': 2, 'name': 'dog'}]
+    self.groundtruth = []
+    self.detections = []
+    for image_index in range(25):
+      num_groundtruth = np.random.randint(1, 4)
+      corners = np.random.uniform(0, 10, size=[num_groundtruth, 2])
+      groundtruth_boxes = np.hstack([corners, corners + 2])
+      groundtruth_classes = np.random.randint(1, 3, size=[num_groundtruth])
+      # Every box is detected up to twice; some images have no detections.
+      num_repeats = np.random.randint(0, 3)
+      num_detections = num_repeats * num_groundtruth
+      detection_boxes = np.tile(groundtruth_boxes, [num_repeats, 1]) + (
+          np.random.uniform(-0.5, 0.5, size=[num_detections, 4]))
+      self.groundtruth.append(('img%d' % image_index, {
+          standard_fields.InputDataFields.groundtruth_boxes: groundtruth_boxes,
+          standard_fields.InputDataFields.groundtruth_classes:
+              groundtruth_classes
+      }))
+      self.detections.append(('img%d' % image_index, {
+          _BOXES: detection_boxes.astype(np.float32),
+          _SCORES: np.random.uniform(size=[num_detections]).astype(np.float32),
+          _CLASSES: np.tile(groundtruth_classes, num_repeats)
+      }))
+    self.directory = os.path.join(self.get_temp_dir(), 'detections')
+    with detection_store.DetectionStoreWriter(
+        self.directory, images_per_segment=10) as writer:
+      for image_id, detections_dict in self.detections:
+        writer.add_single_detected_image_info(image_id, detections_dict)
+
+  def evaluate(self, matching_iou_threshold, detections):
+    evaluator = object_detection_evaluation.PascalDetectionEvaluator(
+        self.categories, matching_iou_threshold=matching_iou_threshold)
+    for image_id, groundtruth_dict in self.groundtruth:
+      evaluator.add_single_ground_truth_image_info(
+          image_id, dict((key, value.copy())
+                         for key, value in groundtruth_dict.items()))
+    if isinstance(detections, detection_store.DetectionStore):
+      evaluator.add_detections_from_store(detections)
+    else:
+      for image_id, detections_dict in detections:
+        evaluator.add_single_detected_image_info(image_id, detections_dict)
+    return evaluator.evaluate()
+
+  def test_round_trip(self):
+    store = detection_store.DetectionStore(self.directory)
+    self.assertEqual(len(self.detections), len(store))
+    self.assertEqual(
+        sum(len(detections_dict[_SCORES])
+            for _, detections_dict in self.detections), store.num_detections)
+    for (expected_image_id, expected_detections), (image_id, detections) in (
+        zip(self.detections, store)):
+      self.assertEqual(expected_image_id, image_id)
+      for field in [_BOXES, _SCORES, _CLASSES]:
+        self.assertAllEqual(expected_detections[field], detections[field])
+
+  def test_min_score_threshold(self):
+    store = detection_store.DetectionStore(self.directory)
+    for (_, expected_detections), (_, detections) in zip(
+        self.detections, store.iter_detections(min_score_threshold=0.5)):
+      is_kept = expected_detections[_SCORES] >= 0.5
+      for field in [_BOXES, _SCORES, _CLASSES]:
+        self.assertAllEqual(expected_detections[field][is_kept],
+                            detections[field])
+
+  def test_reevaluate_from_store(self):
+    for matching_iou_threshold in [0.5, 0.75]:
+      expected_metrics = self.evaluate(matching_iou_threshold, self.detections)
+      metrics = self.evaluate(matching_iou_threshold,
+                              detection_store.DetectionStore(self.directory))
+      self.assertEqual(sorted(expected_metrics.keys()), sorted(metrics.keys()))
+      for key in expected_metrics:
+        self.assertAlmostEqual(expected_metrics[key], metrics[key])
+
+  def test_append_to_existing_store(self):
+    with detection_store.DetectionStoreWriter(self.directory) as writer:
+      writer.add_single_detected_image_info(7, {
+          _BOXES: np.zeros([1, 4]), _SCORES: np.ones(1),
+          _CLASSES: np.ones(1, dtype=int)})
+    store = detection_store.DetectionStore(self.directory)
+    self.assertEqual(len(self.detections) + 1, len(store))
+    self.assertEqual(7, list(store)[-1][0])
+
+  def test_flush_twice_and_reopen(self):
+    directory = os.path.join(self.get_temp_dir(), 'flushed_twice')
+    writer = detection_store.DetectionStoreWriter(directory)
+    for image_id, detections_dict in self.detections[:10]:
+      writer.add_single_detected_image_info(image_id, detections_dict)
+    writer.flush()
+    for image_id, detections_dict in self.detections[10:]:
+      writer.add_single_detected_image_info(image_id, detections_dict)
+    writer.flush()
+    store = detection_store.DetectionStore(directory)
+    self.assertEqual([image_id for image_id, _ in self.detections],
+                     [image_id for image_id, _ in store])
+
+  def test_missing_store(self):
+    with self.assertRaises(ValueError):
+      detection_store.DetectionStore(os.path.join(self.get_temp_dir(), 'none'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,102 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""File I/O functions with the interface of tf.gfile.
+
+Local files are read and written with plain Python, so that reading a label
+map or a list of examples does not import TensorFlow. Paths with a scheme,
+such as gs:// or hdfs://, are handled by tf.gfile, and TensorFlow is only
+imported for them.
+"""
+
+import collections
+import io
+import os
+import sys
+
+from . import lazy_import
+
+tf = lazy_import.LazyModule('tensorflow')
+
+# The fields of tf.gfile.Stat used by the utils.
+FileStatistics = collections.namedtuple('FileStatistics',
+                                        ['length', 'mtime_nsec', 'is_directory'])
+
+
+def _is_local(path):
+  return '://' not in path
+
+
+def io_errors():
+  """Returns the exception types raised by the functions of this module.
+
+  Usage: `except file_io.io_errors():`. TensorFlow errors are only included if
+  TensorFlow was imported, since they cannot be raised otherwise.
+  """
+  if 'tensorflow' in sys.modules:
+    return (IOError, OSError, tf.errors.OpError)
+  return (IOError, OSError)
+
+
+def GFile(path, mode='r'):  # pylint: disable=invalid-name
+  """Opens a file like tf.gfile.GFile; text is read and written as UTF-8."""
+  if not _is_local(path):
+    return tf.gfile.GFile(path, mode)
+  if 'b' in mode:
+    return io.open(path, mode)
+  return io.open(path, mode, encoding='utf-8')
+
+
+Open = GFile  # pylint: disable=invalid-name
+
+
+def Exists(path):  # pylint: disable=invalid-name
+  if not _is_local(path):
+    return tf.gfile.Exists(path)
+  return os.path.exists(path)
+
+
+def Stat(path):  # pylint: disable=invalid-name
+  """Returns the FileStatistics of a file, like tf.gfile.Stat."""
+  if not _is_local(path):
+    stat = tf.gfile.Stat(path)
+    return FileStatistics(stat.length, stat.mtime_nsec, stat.is_directory)
+  stat = os.stat(path)
+  mtime_nsec = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1e9))
+  return FileStatistics(stat.st_size, mtime_nsec, os.path.isdir(path))
+
+
+def Rename(oldname, newname, overwrite=False):  # pylint: disable=invalid-name
+  if not _is_local(oldname) or not _is_local(newname):
+    tf.gfile.Rename(oldname, newname, overwrite=overwrite)
+    return
+  if not overwrite and os.path.exists(newname):
+    raise OSError('File {} already exists'.format(newname))
+  # os.rename does not overwrite files on Windows.
+  getattr(os, 'replace', os.rename)(oldname, newname)
+
+
+def MakeDirs(path):  # pylint: disable=invalid-name
+  if not _is_local(path):
+    tf.gfile.MakeDirs(path)
+  elif not os.path.isdir(path):
+    os.makedirs(path)
+
+
+def Remove(path):  # pylint: disable=invalid-name
+  if not _is_local(path):
+    tf.gfile.Remove(path)
+    return
+  os.remove(path)
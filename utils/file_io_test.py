@@ -0,0 +1,64 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for object_detection.utils.file_io."""
+
+import os
+
+import tensorflow as tf
+
+from object_detection.utils import file_io
+
+
+class FileIoTest(tf.test.TestCase):
+
+  def test_read_and_write_local_files(self):
+    path = os.path.join(self.get_temp_dir(), 'file_io_test.txt')
+    with file_io.GFile(path, 'w') as fid:
+      fid.write(u'label_map\n')
+    self.assertTrue(file_io.Exists(path))
+    with file_io.GFile(path, 'r') as fid:
+      self.assertEqual(u'label_map\n', fid.read())
+    with file_io.Open(path, 'rb') as fid:
+      self.assertEqual(b'label_map\n', fid.read())
+    stat = file_io.Stat(path)
+    self.assertEqual(10, stat.length)
+    self.assertEqual(int(os.stat(path).st_mtime), stat.mtime_nsec // 10**9)
+    self.assertFalse(stat.is_directory)
+
+  def test_rename(self):
+    directory = os.path.join(self.get_temp_dir(), 'file_io_rename')
+    file_io.MakeDirs(directory)
+    old_path = os.path.join(directory, 'old')
+    new_path = os.path.join(directory, 'new')
+    for path in [old_path, new_path]:
+      with file_io.GFile(path, 'w') as fid:
+        fid.write(path)
+    with self.assertRaises(file_io.io_errors()):
+      file_io.Rename(old_path, new_path)
+    file_io.Rename(old_path, new_path, overwrite=True)
+    self.assertFalse(file_io.Exists(old_path))
+    with file_io.GFile(new_path) as fid:
+      self.assertEqual(old_path, fid.read())
+    file_io.Remove(new_path)
+    self.assertFalse(file_io.Exists(new_path))
+
+  def test_missing_file_raises_io_error(self):
+    with self.assertRaises(file_io.io_errors()):
+      file_io.Stat(os.path.join(self.get_temp_dir(), 'missing'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
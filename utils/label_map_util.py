@@ -16,13 +16,28 @@
 """Label map utility functions."""
 
 import logging
+import struct
+import time
 
-import tensorflow as tf
+from google.protobuf import message
 from google.protobuf import text_format
 # from object_detection.protos import string_int_label_map_pb2
 
+from . import file_io
 from . import string_int_label_map_pb2
 
+# Parsed label maps keyed by path, with the size and modification time of the
+# file they were parsed from.
+_LABEL_MAP_CACHE = {}
+# The binary-serialized label map is cached next to the text file, after a
+# header holding the size and modification time of the text file.
+_BINARY_CACHE_SUFFIX = '.binarypb'
+_BINARY_CACHE_HEADER = struct.Struct('<4sqq')
+_BINARY_CACHE_MAGIC = b'LMC1'
+# Files modified more recently are not cached: on file systems with coarse
+# modification times, a rewrite of the same size could go unnoticed.
+_MIN_CACHED_LABEL_MAP_AGE_SECONDS = 2.0
+
 
 def _validate_label_map(label_map):
   """Checks if a label map is valid.
@@ -83,7 +98,7 @@ def convert_label_map_to_categories(label_map,
     categories: a list of dictionaries representing all possible categories.
   """
   categories = []
-  list_of_ids_already_added = []
+  ids_already_added = set()
   if not label_map:
     label_id_offset = 1
     for class_id in range(max_num_classes):
@@ -101,21 +116,15 @@ def convert_label_map_to_categories(label_map,
       name = item.display_name
     else:
       name = item.name
-    if item.id not in list_of_ids_already_added:
-      list_of_ids_already_added.append(item.id)
+    if item.id not in ids_already_added:
+      ids_already_added.add(item.id)
       categories.append({'id': item.id, 'name': name})
   return categories
 
 
-def load_labelmap(path):
-  """Loads label map proto.
-
-  Args:
-    path: path to StringIntLabelMap proto text file.
-  Returns:
-    a StringIntLabelMapProto
-  """
-  with tf.gfile.GFile(path, 'r') as fid:
+def _parse_labelmap(path):
+  """Parses and validates a label map proto text file."""
+  with file_io.GFile(path, 'r') as fid:
     label_map_string = fid.read()
     label_map = string_int_label_map_pb2.StringIntLabelMap()
     try:
@@ -126,6 +135,86 @@ def load_labelmap(path):
   return label_map
 
 
+def _read_binary_cache(path, header):
+  """Returns the label map cached for the header of path, or None."""
+  cache_path = path + _BINARY_CACHE_SUFFIX
+  try:
+    if not file_io.Exists(cache_path):
+      return None
+    with file_io.GFile(cache_path, 'rb') as fid:
+      cached = fid.read()
+  except file_io.io_errors():
+    return None
+  if cached[:_BINARY_CACHE_HEADER.size] != header:
+    return None
+  label_map = string_int_label_map_pb2.StringIntLabelMap()
+  try:
+    label_map.ParseFromString(cached[_BINARY_CACHE_HEADER.size:])
+  except message.DecodeError:
+    return None
+  return label_map
+
+
+def _write_binary_cache(path, header, label_map):
+  """Caches the binary-serialized label map, if the directory is writable."""
+  cache_path = path + _BINARY_CACHE_SUFFIX
+  try:
+    with file_io.GFile(cache_path + '.tmp', 'wb') as fid:
+      fid.write(header + label_map.SerializeToString())
+    file_io.Rename(cache_path + '.tmp', cache_path, overwrite=True)
+  except file_io.io_errors() as e:
+    logging.info('Could not cache label map %s: %s', path, e)
+
+
+def _load_cached_labelmap(path):
+  """Loads a label map proto, parsing the file only when it changed.
+
+  The returned proto is shared by all callers and must not be modified.
+
+  Args:
+    path: path to StringIntLabelMap proto text file.
+  Returns:
+    a StringIntLabelMapProto
+  """
+  stat = file_io.Stat(path)
+  key = (stat.length, stat.mtime_nsec)
+  cached = _LABEL_MAP_CACHE.get(path)
+  if cached is not None and cached[0] == key:
+    return cached[1]
+  if time.time() - stat.mtime_nsec / 1e9 < _MIN_CACHED_LABEL_MAP_AGE_SECONDS:
+    return _parse_labelmap(path)
+  header = _BINARY_CACHE_HEADER.pack(_BINARY_CACHE_MAGIC, stat.length,
+                                     stat.mtime_nsec)
+  label_map = _read_binary_cache(path, header)
+  if label_map is None:
+    label_map = _parse_labelmap(path)
+    _write_binary_cache(path, header, label_map)
+  _LABEL_MAP_CACHE[path] = (key, label_map)
+  return label_map
+
+
+def load_labelmap(path, use_cache=True):
+  """Loads label map proto.
+
+  Label maps are parsed once per version of the file: the parsed proto is
+  kept in memory, keyed by path, size and modification time, and its binary
+  serialization is cached on disk next to the file, which is much faster to
+  parse than the text format.
+
+  Args:
+    path: path to StringIntLabelMap proto text file.
+    use_cache: whether to use the cached label map. If False, the file is
+      always parsed.
+  Returns:
+    a StringIntLabelMapProto
+  """
+  if not use_cache:
+    return _parse_labelmap(path)
+  label_map = string_int_label_map_pb2.StringIntLabelMap()
+  label_map.CopyFrom(_load_cached_labelmap(path))
+  return label_map
+
+
 def get_label_map_dict(label_map_path, use_display_name=False):
   """Reads a label map and returns a dictionary of label names to id.
 
@@ -136,14 +225,10 @@ def get_label_map_dict(label_map_path, use_display_name=False):
   Returns:
     A dictionary mapping label names to id.
   """
-  label_map = load_labelmap(label_map_path)
-  label_map_dict = {}
-  for item in label_map.item:
-    if use_display_name:
-      label_map_dict[item.display_name] = item.id
-    else:
-      label_map_dict[item.name] = item.id
-  return label_map_dict
+  label_map = _load_cached_labelmap(label_map_path)
+  if use_display_name:
+    return {item.display_name: item.id for item in label_map.item}
+  return {item.name: item.id for item in label_map.item}
 
 
 def create_category_index_from_labelmap(label_map_path):
@@ -157,7 +242,7 @@ def create_category_index_from_labelmap(label_map_path):
     containing categories, e.g.
     {1: {'id': 1, 'name': 'dog'}, 2: {'id': 2, 'name': 'cat'}, ...}
   """
-  label_map = load_labelmap(label_map_path)
+  label_map = _load_cached_labelmap(label_map_path)
   max_num_classes = max(item.id for item in label_map.item)
   categories = convert_label_map_to_categories(label_map, max_num_classes)
   return create_category_index(categories)
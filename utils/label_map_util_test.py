@@ -213,5 +213,65 @@ class LabelMapUtilTest(tf.test.TestCase):
     }, category_index)
 
 
+  def _write_label_map(self, label_map_path, label_map, mtime):
+    with tf.gfile.Open(label_map_path, 'wb') as f:
+      f.write(text_format.MessageToString(label_map))
+    os.utime(label_map_path, (mtime, mtime))
+
+  def test_load_labelmap_is_cached_until_modified(self):
+    label_map_path = os.path.join(self.get_temp_dir(), 'cached_map.pbtxt')
+    self._write_label_map(label_map_path, self._generate_label_map(3),
+                          mtime=1000000000)
+    label_map = label_map_util.load_labelmap(label_map_path)
+    self.assertEqual(self._generate_label_map(3), label_map)
+    self.assertTrue(tf.gfile.Exists(label_map_path + '.binarypb'))
+    # Modifying the returned label map does not modify the cached one.
+    label_map.item.add(id=4, name='label_4')
+    self.assertEqual(self._generate_label_map(3),
+                     label_map_util.load_labelmap(label_map_path))
+
+    # The binary cache is used once the label map is not in memory anymore.
+    label_map_util._LABEL_MAP_CACHE.clear()
+    self.assertEqual(self._generate_label_map(3),
+                     label_map_util.load_labelmap(label_map_path))
+
+    self._write_label_map(label_map_path, self._generate_label_map(5),
+                          mtime=1000000100)
+    self.assertEqual(self._generate_label_map(5),
+                     label_map_util.load_labelmap(label_map_path))
+    self.assertEqual(
+        5, len(label_map_util.get_label_map_dict(label_map_path)))
+    self.assertEqual(
+        5, len(label_map_util.create_category_index_from_labelmap(
+            label_map_path)))
+
+  def test_corrupted_binary_cache_is_rewritten(self):
+    label_map_path = os.path.join(self.get_temp_dir(), 'corrupted_map.pbtxt')
+    cache_path = label_map_path + '.binarypb'
+    self._write_label_map(label_map_path, self._generate_label_map(3),
+                          mtime=1000000000)
+    label_map_util.load_labelmap(label_map_path)
+    with tf.gfile.Open(cache_path, 'rb') as f:
+      cached = f.read()
+    header_size = label_map_util._BINARY_CACHE_HEADER.size
+    with tf.gfile.Open(cache_path, 'wb') as f:
+      f.write(cached[:header_size] + b'\xff\xff\xff')
+
+    label_map_util._LABEL_MAP_CACHE.clear()
+    self.assertEqual(self._generate_label_map(3),
+                     label_map_util.load_labelmap(label_map_path))
+    with tf.gfile.Open(cache_path, 'rb') as f:
+      self.assertEqual(cached, f.read())
+
+  def test_recently_modified_label_map_is_not_cached(self):
+    label_map_path = os.path.join(self.get_temp_dir(), 'recent_map.pbtxt')
+    with tf.gfile.Open(label_map_path, 'wb') as f:
+      f.write(text_format.MessageToString(self._generate_label_map(2)))
+    self.assertEqual(self._generate_label_map(2),
+                     label_map_util.load_labelmap(label_map_path))
+    self.assertNotIn(label_map_path, label_map_util._LABEL_MAP_CACHE)
+    self.assertFalse(tf.gfile.Exists(label_map_path + '.binarypb'))
+
+
 if __name__ == '__main__':
   tf.test.main()
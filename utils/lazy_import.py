@@ -0,0 +1,58 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Lazily imported modules.
+
+Heavy dependencies such as TensorFlow and matplotlib take seconds to import.
+Modules that only need them in some functions bind them to a LazyModule, e.g.
+
+  tf = lazy_import.LazyModule('tensorflow')
+
+which imports the module the first time one of its attributes is used, so that
+importing the dependent module stays fast.
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+  """A module that is imported on first attribute access."""
+
+  def __init__(self, name):
+    """Constructor.
+
+    Args:
+      name: absolute name of the module, e.g. 'matplotlib.pyplot'.
+    """
+    super(LazyModule, self).__init__(name)
+    self.__dict__['_module'] = None
+
+  def _load(self):
+    if self._module is None:
+      self.__dict__['_module'] = importlib.import_module(self.__name__)
+    return self._module
+
+  @property
+  def is_loaded(self):
+    """Whether the module was imported, by this or any other module."""
+    return self._module is not None or self.__name__ in sys.modules
+
+  def __getattr__(self, attribute):
+    return getattr(self._load(), attribute)
+
+  def __dir__(self):
+    return dir(self._load())
@@ -0,0 +1,43 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for object_detection.utils.lazy_import."""
+
+import sys
+
+import tensorflow as tf
+
+from object_detection.utils import lazy_import
+
+
+class LazyImportTest(tf.test.TestCase):
+
+  def test_module_is_imported_on_first_attribute_access(self):
+    sys.modules.pop('colorsys', None)
+    colorsys = lazy_import.LazyModule('colorsys')
+    self.assertNotIn('colorsys', sys.modules)
+    self.assertFalse(colorsys.is_loaded)
+    self.assertEqual((0.0, 1.0, 1.0), colorsys.rgb_to_hsv(1.0, 0.0, 0.0))
+    self.assertTrue(colorsys.is_loaded)
+    self.assertIs(sys.modules['colorsys'].rgb_to_hsv, colorsys.rgb_to_hsv)
+
+  def test_missing_module_raises_on_first_use(self):
+    missing = lazy_import.LazyModule('module_that_does_not_exist')
+    with self.assertRaises(ImportError):
+      missing.attribute
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -19,13 +19,18 @@ from __future__ import division
 import numpy as np
 
 
-def compute_precision_recall(scores, labels, num_gt):
+def compute_precision_recall(scores, labels, num_gt, scores_sorted=False,
+                             validate=True):
   """Compute precision and recall.
 
   Args:
     scores: A float numpy array representing detection score
     labels: A boolean numpy array representing true/false positive labels
     num_gt: Number of ground truth instances
+    scores_sorted: If True, scores are already sorted in decreasing order and
+      labels are not reordered.
+    validate: If False, the inputs are not checked. Intended for internal
+      callers whose inputs are valid by construction.
 
   Raises:
     ValueError: if the input is not of the correct format
@@ -37,37 +42,39 @@ def compute_precision_recall(scores, labels, num_gt):
       This value is None if no ground truth labels are present.
 
   """
-  if not isinstance(
-      labels, np.ndarray) or labels.dtype != np.bool or len(labels.shape) != 1:
-    raise ValueError("labels must be single dimension bool numpy array")
+  if validate:
+    if not isinstance(
+        labels, np.ndarray) or labels.dtype != np.bool or len(labels.shape) != 1:
+      raise ValueError("labels must be single dimension bool numpy array")
 
-  if not isinstance(
-      scores, np.ndarray) or len(scores.shape) != 1:
-    raise ValueError("scores must be single dimension numpy array")
+    if not isinstance(
+        scores, np.ndarray) or len(scores.shape) != 1:
+      raise ValueError("scores must be single dimension numpy array")
 
-  if num_gt < np.sum(labels):
-    raise ValueError("Number of true positives must be smaller than num_gt.")
+    if num_gt < np.count_nonzero(labels):
+      raise ValueError("Number of true positives must be smaller than num_gt.")
 
-  if len(scores) != len(labels):
-    raise ValueError("scores and labels must be of the same size.")
+    if len(scores) != len(labels):
+      raise ValueError("scores and labels must be of the same size.")
 
   if num_gt == 0:
     return None, None
 
-  sorted_indices = np.argsort(scores)
-  sorted_indices = sorted_indices[::-1]
-  labels = labels.astype(int)
-  true_positive_labels = labels[sorted_indices]
-  false_positive_labels = 1 - true_positive_labels
-  cum_true_positives = np.cumsum(true_positive_labels)
-  cum_false_positives = np.cumsum(false_positive_labels)
-  precision = cum_true_positives.astype(float) / (
-      cum_true_positives + cum_false_positives)
+  if scores_sorted:
+    true_positive_labels = labels
+  else:
+    sorted_indices = np.argsort(scores)
+    sorted_indices = sorted_indices[::-1]
+    true_positive_labels = labels[sorted_indices]
+  cum_true_positives = np.cumsum(true_positive_labels, dtype=int)
+  # The number of detections so far is the sum of true and false positives.
+  num_detections = np.arange(1, len(true_positive_labels) + 1)
+  precision = cum_true_positives.astype(float) / num_detections
   recall = cum_true_positives.astype(float) / num_gt
   return precision, recall
 
 
-def compute_average_precision(precision, recall):
+def compute_average_precision(precision, recall, validate=True):
   """Compute Average Precision according to the definition in VOCdevkit.
 
   Precision is modified to ensure that it does not decrease as recall
@@ -76,6 +83,8 @@ def compute_average_precision(precision, recall):
   Args:
     precision: A float [N, 1] numpy array of precisions
     recall: A float [N, 1] numpy array of recalls
+    validate: If False, the inputs are not checked. Intended for internal
+      callers whose inputs are valid by construction.
 
   Raises:
     ValueError: if the input is not of the correct format
@@ -90,28 +99,30 @@ def compute_average_precision(precision, recall):
       raise ValueError("If precision is None, recall must also be None")
     return np.NAN
 
-  if not isinstance(precision, np.ndarray) or not isinstance(recall,
-                                                             np.ndarray):
-    raise ValueError("precision and recall must be numpy array")
-  if precision.dtype != np.float or recall.dtype != np.float:
-    raise ValueError("input must be float numpy array.")
-  if len(precision) != len(recall):
-    raise ValueError("precision and recall must be of the same size.")
+  if validate:
+    if not isinstance(precision, np.ndarray) or not isinstance(recall,
+                                                               np.ndarray):
+      raise ValueError("precision and recall must be numpy array")
+    if precision.dtype != np.float or recall.dtype != np.float:
+      raise ValueError("input must be float numpy array.")
+    if len(precision) != len(recall):
+      raise ValueError("precision and recall must be of the same size.")
   if not precision.size:
     return 0.0
-  if np.amin(precision) < 0 or np.amax(precision) > 1:
-    raise ValueError("Precision must be in the range of [0, 1].")
-  if np.amin(recall) < 0 or np.amax(recall) > 1:
-    raise ValueError("recall must be in the range of [0, 1].")
-  if not all(recall[i] <= recall[i + 1] for i in range(len(recall) - 1)):
-    raise ValueError("recall must be a non-decreasing array")
+  if validate:
+    if np.amin(precision) < 0 or np.amax(precision) > 1:
+      raise ValueError("Precision must be in the range of [0, 1].")
+    if np.amin(recall) < 0 or np.amax(recall) > 1:
+      raise ValueError("recall must be in the range of [0, 1].")
+    if not np.all(recall[1:] >= recall[:-1]):
+      raise ValueError("recall must be a non-decreasing array")
 
   recall = np.concatenate([[0], recall, [1]])
   precision = np.concatenate([[0], precision, [0]])
 
-  # Preprocess precision to be a non-decreasing array
-  for i in range(len(precision) - 2, -1, -1):
-    precision[i] = np.maximum(precision[i], precision[i + 1])
+  # Preprocess precision to be a non-increasing array, i.e. replace every
+  # precision by the maximum precision at the same or a larger recall.
+  precision = np.maximum.accumulate(precision[::-1])[::-1]
 
   indices = np.where(recall[1:] != recall[:-1])[0] + 1
   average_precision = np.sum(
@@ -0,0 +1,109 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmarks for the precision, recall and average precision metrics.
+
+Times compute_precision_recall and compute_average_precision with and without
+input validation, and with presorted scores, on random detections, e.g.:
+
+  python -m object_detection.utils.metrics_benchmark \
+      --num_detections 10000 100000 1000000 10000000
+"""
+
+import argparse
+import functools
+import timeit
+
+import numpy as np
+
+from object_detection.utils import metrics
+
+
+def create_detections(num_detections, true_positive_rate=0.3, seed=0):
+  """Creates random detection scores and true positive labels.
+
+  Args:
+    num_detections: number of detections to create.
+    true_positive_rate: fraction of detections labeled as true positives.
+    seed: random seed.
+
+  Returns:
+    scores: a float numpy array of shape [num_detections].
+    labels: a boolean numpy array of shape [num_detections].
+    num_gt: number of ground truth instances.
+  """
+  random_state = np.random.RandomState(seed)
+  scores = random_state.uniform(size=num_detections)
+  # Higher scores are more likely to be true positives.
+  labels = random_state.uniform(size=num_detections) < (
+      2 * true_positive_rate * scores)
+  num_gt = int(np.count_nonzero(labels) / 0.8) + 1
+  return scores, labels, num_gt
+
+
+def run_benchmarks(num_detections_list, repeats):
+  """Times every metric for each number of detections.
+
+  Args:
+    num_detections_list: list of detection counts to benchmark.
+    repeats: number of timed runs per metric; the best one is reported.
+
+  Returns:
+    a list of (num_detections, metric name, seconds) tuples.
+  """
+  results = []
+  for num_detections in num_detections_list:
+    scores, labels, num_gt = create_detections(num_detections)
+    sorted_indices = np.argsort(scores)[::-1]
+    sorted_scores = scores[sorted_indices]
+    sorted_labels = labels[sorted_indices]
+    precision, recall = metrics.compute_precision_recall(scores, labels,
+                                                         num_gt)
+    benchmarks = [
+        ('precision_recall',
+         functools.partial(metrics.compute_precision_recall, scores, labels,
+                           num_gt)),
+        ('precision_recall_sorted',
+         functools.partial(metrics.compute_precision_recall, sorted_scores,
+                           sorted_labels, num_gt, scores_sorted=True,
+                           validate=False)),
+        ('average_precision',
+         functools.partial(metrics.compute_average_precision, precision,
+                           recall)),
+        ('average_precision_trusted',
+         functools.partial(metrics.compute_average_precision, precision,
+                           recall, validate=False)),
+    ]
+    for name, benchmark in benchmarks:
+      seconds = min(timeit.repeat(benchmark, number=1, repeat=repeats))
+      results.append((num_detections, name, seconds))
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--num_detections', type=int, nargs='+',
+                      default=[10**4, 10**5, 10**6, 10**7])
+  parser.add_argument('--repeats', type=int, default=3)
+  args = parser.parse_args()
+  print('{:>10} {:<26} {:>10}'.format('detections', 'metric', 'ms'))
+  for num_detections, name, seconds in run_benchmarks(args.num_detections,
+                                                      args.repeats):
+    print('{:>10} {:<26} {:>10.1f}'.format(num_detections, name,
+                                           1000 * seconds))
+
+
+if __name__ == '__main__':
+  main()
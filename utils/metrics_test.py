@@ -74,6 +74,44 @@ class MetricsTest(tf.test.TestCase):
     ap = metrics.compute_average_precision(precision, recall)
     self.assertTrue(np.isnan(ap))
 
+  def test_compute_precision_recall_with_sorted_scores(self):
+    num_gt = 10
+    scores = np.array([0.4, 0.3, 0.6, 0.2, 0.7, 0.1], dtype=float)
+    labels = np.array([0, 1, 1, 0, 0, 1], dtype=bool)
+    expected_precision, expected_recall = metrics.compute_precision_recall(
+        scores, labels, num_gt)
+    sorted_indices = np.argsort(scores)[::-1]
+    precision, recall = metrics.compute_precision_recall(
+        scores[sorted_indices], labels[sorted_indices], num_gt,
+        scores_sorted=True, validate=False)
+    self.assertAllClose(precision, expected_precision)
+    self.assertAllClose(recall, expected_recall)
+
+  def test_compute_average_precision_matches_sequential_envelope(self):
+    np.random.seed(0)
+    labels = np.random.uniform(size=10000) < 0.3
+    precision, recall = metrics.compute_precision_recall(
+        np.random.uniform(size=10000), labels, 5000)
+    envelope = np.concatenate([[0], precision, [0]])
+    for i in range(len(envelope) - 2, -1, -1):
+      envelope[i] = max(envelope[i], envelope[i + 1])
+    padded_recall = np.concatenate([[0], recall, [1]])
+    indices = np.where(padded_recall[1:] != padded_recall[:-1])[0] + 1
+    expected_ap = np.sum(
+        (padded_recall[indices] - padded_recall[indices - 1]) *
+        envelope[indices])
+    self.assertAlmostEqual(
+        expected_ap, metrics.compute_average_precision(precision, recall))
+    self.assertAlmostEqual(
+        expected_ap,
+        metrics.compute_average_precision(precision, recall, validate=False))
+
+  def test_compute_average_precision_decreasing_recall(self):
+    precision = np.array([0.5, 0.5, 0.5], dtype=float)
+    recall = np.array([0.1, 0.3, 0.2], dtype=float)
+    with self.assertRaises(ValueError):
+      metrics.compute_average_precision(precision, recall)
+
 
 if __name__ == '__main__':
   tf.test.main()
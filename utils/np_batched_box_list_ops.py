@@ -0,0 +1,303 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Bounding Box List operations for Numpy BatchedBoxLists.
+
+These ops mirror the ones in np_box_list_ops but act on all images of a
+BatchedBoxList at once; per-image parameters (scales, windows) are broadcast
+to the boxes through the image index of every box.
+
+Example box operations that are supported:
+  * Areas: compute bounding box areas
+  * NMS: per-image non maximum suppression
+"""
+
+import numpy as np
+
+from object_detection.utils import np_box_list
+from object_detection.utils import np_box_ops
+
+
+def batch(boxlists, fields=None):
+  """Packs a list of BoxLists into a BatchedBoxList.
+
+  Args:
+    boxlists: list of BoxList objects, one per image.
+    fields: optional list of fields to also pack.  By default, all fields from
+      the first BoxList in the list are included.
+
+  Returns:
+    a BatchedBoxList with boxlists[i] as image i.
+
+  Raises:
+    ValueError: if boxlists is invalid (i.e., is not a list, is empty, or
+      contains non BoxList objects), or if requested fields are not contained in
+      all boxlists
+  """
+  if not isinstance(boxlists, list):
+    raise ValueError('boxlists should be a list')
+  if not boxlists:
+    raise ValueError('boxlists should have nonzero length')
+  for boxlist in boxlists:
+    if not isinstance(boxlist, np_box_list.BoxList):
+      raise ValueError('all elements of boxlists should be BoxList objects')
+  offsets = np.zeros(len(boxlists) + 1, dtype=np.int64)
+  offsets[1:] = np.cumsum([boxlist.num_boxes() for boxlist in boxlists])
+  batched = np_box_list.BatchedBoxList(
+      np.vstack([boxlist.get() for boxlist in boxlists]), offsets)
+  if fields is None:
+    fields = boxlists[0].get_extra_fields()
+  for field in fields:
+    for boxlist in boxlists:
+      if not boxlist.has_field(field):
+        raise ValueError('boxlist must contain all requested fields')
+    batched.add_field(field, np.concatenate(
+        [boxlist.get_field(field) for boxlist in boxlists], axis=0))
+  return batched
+
+
+def unbatch(batched):
+  """Splits a BatchedBoxList into per-image BoxLists.
+
+  Args:
+    batched: BatchedBoxList holding boxes of num_images images.
+
+  Returns:
+    a list of num_images BoxLists whose arrays are views into batched.
+  """
+  return [batched.get_image(i) for i in range(batched.num_images())]
+
+
+def area(batched):
+  """Computes area of boxes.
+
+  Args:
+    batched: BatchedBoxList holding N boxes
+
+  Returns:
+    a numpy array with shape [N] representing box areas
+  """
+  return np_box_ops.area(batched.get())
+
+
+def scale(batched, y_scale, x_scale):
+  """Scale box coordinates in x and y dimensions.
+
+  Args:
+    batched: BatchedBoxList holding N boxes
+    y_scale: float, or a numpy array of shape [num_images] with one scale per
+      image.
+    x_scale: float, or a numpy array of shape [num_images] with one scale per
+      image.
+
+  Returns:
+    batched: BatchedBoxList holding N boxes
+  """
+  y_scale, x_scale = np.broadcast_arrays(_per_box(batched, y_scale),
+                                         _per_box(batched, x_scale))
+  scales = np.stack([y_scale, x_scale, y_scale, x_scale], axis=-1)
+  scaled = np_box_list.BatchedBoxList(batched.get() * scales, batched.offsets)
+  return _copy_extra_fields(scaled, batched)
+
+
+def clip_to_window(batched, window):
+  """Clip bounding boxes to a window.
+
+  This op clips input bounding boxes to a window and removes boxes that end
+  up with zero area, i.e. that do not overlap the window at all.
+
+  Args:
+    batched: BatchedBoxList holding N_in boxes
+    window: a numpy array of shape [4] representing the
+            [y_min, x_min, y_max, x_max] window shared by all images, or of
+            shape [num_images, 4] with one window per image.
+
+  Returns:
+    a BatchedBoxList holding N_out boxes where N_out <= N_in
+  """
+  window = np.asarray(window)
+  if len(window.shape) == 2:
+    window = window[batched.image_ids()]
+  boxes = batched.get()
+  win_min = window[..., [0, 1, 0, 1]]
+  win_max = window[..., [2, 3, 2, 3]]
+  clipped_boxes = np.fmax(np.fmin(boxes, win_max), win_min)
+  clipped = np_box_list.BatchedBoxList(clipped_boxes, batched.offsets)
+  clipped = _copy_extra_fields(clipped, batched)
+  return boolean_mask(clipped, np.greater(area(clipped), 0.0))
+
+
+def filter_scores_greater_than(batched, thresh):
+  """Filter to keep only boxes with score exceeding a given threshold.
+
+  Args:
+    batched: BatchedBoxList holding N boxes.  Must contain a 'scores' field
+      representing detection scores.
+    thresh: scalar threshold, or a numpy array of shape [num_images] with one
+      threshold per image.
+
+  Returns:
+    a BatchedBoxList holding M boxes where M <= N
+
+  Raises:
+    ValueError: if batched is not a BatchedBoxList object or if it does not
+      have a scores field
+  """
+  if not isinstance(batched, np_box_list.BatchedBoxList):
+    raise ValueError('batched must be a BatchedBoxList')
+  if not batched.has_field('scores'):
+    raise ValueError('input batched must have \'scores\' field')
+  scores = batched.get_field('scores')
+  if len(scores.shape) > 2:
+    raise ValueError('Scores should have rank 1 or 2')
+  if len(scores.shape) == 2 and scores.shape[1] != 1:
+    raise ValueError('Scores should have rank 1 or have shape '
+                     'consistent with [None, 1]')
+  scores = np.reshape(scores, [-1])
+  return boolean_mask(batched, np.greater(scores, _per_box(batched, thresh)))
+
+
+def boolean_mask(batched, mask):
+  """Keeps the boxes (and fields) selected by a boolean mask.
+
+  Args:
+    batched: BatchedBoxList holding N boxes.
+    mask: a boolean numpy array of shape [N].
+
+  Returns:
+    a BatchedBoxList holding the selected boxes, in the same order.
+
+  Raises:
+    ValueError: if mask does not have shape [N].
+  """
+  if mask.shape != (batched.num_boxes(),):
+    raise ValueError('mask must have shape [num_boxes].')
+  num_kept = np.bincount(batched.image_ids()[mask],
+                         minlength=batched.num_images())
+  offsets = np.zeros(batched.num_images() + 1, dtype=np.int64)
+  offsets[1:] = np.cumsum(num_kept)
+  return _gather(batched, mask, offsets)
+
+
+def sort_by_field(batched, field):
+  """Sorts the boxes of every image by decreasing value of a scalar field.
+
+  Args:
+    batched: BatchedBoxList holding N boxes.
+    field: A BatchedBoxList field for sorting and reordering the boxes.
+
+  Returns:
+    a BatchedBoxList in which the boxes of every image are sorted in
+    descending order of the field.
+
+  Raises:
+    ValueError: if specified field does not exist or is not of single dimension.
+  """
+  if not batched.has_field(field):
+    raise ValueError('Field ' + field + ' does not exist')
+  field_to_sort = batched.get_field(field)
+  if len(field_to_sort.shape) != 1:
+    raise ValueError('Field ' + field + 'should be single dimension.')
+  sorted_indices = np.lexsort((-field_to_sort, batched.image_ids()))
+  return _gather(batched, sorted_indices, batched.offsets)
+
+
+def non_max_suppression(batched,
+                        max_output_size=10000,
+                        iou_threshold=1.0,
+                        score_threshold=-10.0):
+  """Per-image non maximum suppression.
+
+  Applies np_box_list_ops.non_max_suppression to every image of the batch.
+  Boxes are sorted by image and score once and visited in a single pass;
+  each selected box is only compared against the remaining boxes of its own
+  image.
+
+  Args:
+    batched: BatchedBoxList holding N boxes.  Must contain a 'scores' field
+      representing detection scores.
+    max_output_size: maximum number of retained boxes per image
+    iou_threshold: intersection over union threshold.
+    score_threshold: minimum score threshold. Remove the boxes with scores
+                     less than this value.
+
+  Returns:
+    a BatchedBoxList holding at most max_output_size boxes per image, sorted
+    by decreasing score within every image.
+  Raises:
+    ValueError: if 'scores' field does not exist
+    ValueError: if threshold is not in [0, 1]
+    ValueError: if max_output_size < 0
+  """
+  if not batched.has_field('scores'):
+    raise ValueError('Field scores does not exist')
+  if iou_threshold < 0. or iou_threshold > 1.0:
+    raise ValueError('IOU threshold must be in [0, 1]')
+  if max_output_size < 0:
+    raise ValueError('max_output_size must be bigger than 0.')
+
+  batched = filter_scores_greater_than(batched, score_threshold)
+  batched = sort_by_field(batched, 'scores')
+  image_ids = batched.image_ids()
+  rank_in_image = np.arange(batched.num_boxes()) - batched.offsets[image_ids]
+
+  # Prevent further computation if NMS is disabled.
+  if iou_threshold == 1.0:
+    return boolean_mask(batched, rank_in_image < max_output_size)
+
+  boxes = batched.get()
+  image_ends = batched.offsets[1:][image_ids]
+  is_index_valid = np.ones(batched.num_boxes(), dtype=bool)
+  is_selected = np.zeros(batched.num_boxes(), dtype=bool)
+  num_output = np.zeros(batched.num_images(), dtype=int)
+  for i in range(batched.num_boxes()):
+    if not is_index_valid[i]:
+      continue
+    image_id = image_ids[i]
+    if num_output[image_id] >= max_output_size:
+      is_index_valid[i:image_ends[i]] = False
+      continue
+    num_output[image_id] += 1
+    is_selected[i] = True
+    candidates = i + 1 + np.nonzero(is_index_valid[i + 1:image_ends[i]])[0]
+    if candidates.size:
+      intersect_over_union = np_box_ops.iou(boxes[i:i + 1, :],
+                                            boxes[candidates, :])[0]
+      is_index_valid[candidates[intersect_over_union > iou_threshold]] = False
+  return boolean_mask(batched, is_selected)
+
+
+def _per_box(batched, value):
+  """Broadcasts a scalar or per-image value to a [N] per-box array."""
+  value = np.asarray(value)
+  if len(value.shape) == 1:
+    return value[batched.image_ids()]
+  return value
+
+
+def _gather(batched, indices, offsets):
+  """Gathers boxes and fields; offsets must describe the gathered layout."""
+  gathered = np_box_list.BatchedBoxList(batched.get()[indices, :], offsets)
+  for field in batched.get_extra_fields():
+    gathered.add_field(field, batched.get_field(field)[indices, ...])
+  return gathered
+
+
+def _copy_extra_fields(batched_to_copy_to, batched_to_copy_from):
+  """Copies the extra fields of batched_to_copy_from to batched_to_copy_to."""
+  for field in batched_to_copy_from.get_extra_fields():
+    batched_to_copy_to.add_field(field,
+                                 batched_to_copy_from.get_field(field))
+  return batched_to_copy_to
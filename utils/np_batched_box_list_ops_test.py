@@ -0,0 +1,143 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for object_detection.utils.np_batched_box_list_ops."""
+
+import numpy as np
+import tensorflow as tf
+
+from object_detection.utils import np_batched_box_list_ops
+from object_detection.utils import np_box_list
+from object_detection.utils import np_box_list_ops
+
+
+class BatchedBoxListOpsTest(tf.test.TestCase):
+
+  def setUp(self):
+    boxes1 = np.array([[0, 0, 1, 1],
+                       [0, 0.1, 1, 1.1],
+                       [0, -0.1, 1, 0.9],
+                       [0, 10, 1, 11]],
+                      dtype=float)
+    boxes2 = np.array([[0, 10.1, 1, 11.1],
+                       [0, 100, 1, 101],
+                       [0, 100.2, 1, 101.2]],
+                      dtype=float)
+    self.boxlist1 = np_box_list.BoxList(boxes1)
+    self.boxlist1.add_field('scores', np.array([.9, .75, .6, .95]))
+    self.boxlist2 = np_box_list.BoxList(np.zeros([0, 4], dtype=float))
+    self.boxlist2.add_field('scores', np.zeros([0], dtype=float))
+    self.boxlist3 = np_box_list.BoxList(boxes2)
+    self.boxlist3.add_field('scores', np.array([.2, .3, .8]))
+    self.boxlists = [self.boxlist1, self.boxlist2, self.boxlist3]
+    self.batched = np_batched_box_list_ops.batch(self.boxlists)
+
+  def assert_matches_per_image(self, batched, boxlists):
+    self.assertEqual(batched.num_images(), len(boxlists))
+    for boxlist, unbatched in zip(
+        boxlists, np_batched_box_list_ops.unbatch(batched)):
+      self.assertAllClose(boxlist.get(), unbatched.get())
+      for field in boxlist.get_extra_fields():
+        self.assertAllClose(boxlist.get_field(field),
+                            unbatched.get_field(field))
+
+  def test_batch(self):
+    self.assertAllEqual(self.batched.offsets, [0, 4, 4, 7])
+    self.assertAllEqual(self.batched.image_ids(), [0, 0, 0, 0, 2, 2, 2])
+    self.assertAllEqual(self.batched.num_boxes_per_image(), [4, 0, 3])
+    self.assert_matches_per_image(self.batched, self.boxlists)
+
+  def test_invalid_offsets(self):
+    with self.assertRaises(ValueError):
+      np_box_list.BatchedBoxList(self.boxlist1.get(), np.array([0, 3]))
+    with self.assertRaises(ValueError):
+      np_box_list.BatchedBoxList(self.boxlist1.get(), np.array([0, 3, 2, 4]))
+
+  def test_area(self):
+    expected_areas = np.concatenate(
+        [np_box_list_ops.area(boxlist) for boxlist in self.boxlists])
+    self.assertAllClose(np_batched_box_list_ops.area(self.batched),
+                        expected_areas)
+
+  def test_scale_per_image(self):
+    y_scales = np.array([2.0, 3.0, 4.0])
+    x_scales = np.array([0.5, 1.0, 1.5])
+    scaled = np_batched_box_list_ops.scale(self.batched, y_scales, x_scales)
+    expected = [np_box_list_ops.scale(boxlist, y_scale, x_scale)
+                for boxlist, y_scale, x_scale
+                in zip(self.boxlists, y_scales, x_scales)]
+    self.assert_matches_per_image(scaled, expected)
+
+  def test_scale_per_image_and_scalar(self):
+    y_scales = np.array([2.0, 3.0, 4.0])
+    scaled = np_batched_box_list_ops.scale(self.batched, y_scales, 0.5)
+    expected = [np_box_list_ops.scale(boxlist, y_scale, 0.5)
+                for boxlist, y_scale in zip(self.boxlists, y_scales)]
+    self.assert_matches_per_image(scaled, expected)
+    scaled = np_batched_box_list_ops.scale(self.batched, 0.5, y_scales)
+    expected = [np_box_list_ops.scale(boxlist, 0.5, x_scale)
+                for boxlist, x_scale in zip(self.boxlists, y_scales)]
+    self.assert_matches_per_image(scaled, expected)
+
+  def test_clip_to_window(self):
+    window = np.array([0, 0, 1, 100.5])
+    clipped = np_batched_box_list_ops.clip_to_window(self.batched, window)
+    expected = [np_box_list_ops.clip_to_window(boxlist, window)
+                for boxlist in self.boxlists]
+    self.assert_matches_per_image(clipped, expected)
+
+  def test_clip_to_window_per_image(self):
+    windows = np.array([[0, 0, 1, 0.5], [0, 0, 1, 1], [0, 0, 1, 200]])
+    clipped = np_batched_box_list_ops.clip_to_window(self.batched, windows)
+    expected = [np_box_list_ops.clip_to_window(boxlist, window)
+                for boxlist, window in zip(self.boxlists, windows)]
+    self.assert_matches_per_image(clipped, expected)
+
+  def test_filter_scores_greater_than(self):
+    filtered = np_batched_box_list_ops.filter_scores_greater_than(
+        self.batched, 0.5)
+    expected = [np_box_list_ops.filter_scores_greater_than(boxlist, 0.5)
+                for boxlist in self.boxlists]
+    self.assertAllEqual(filtered.offsets, [0, 4, 4, 5])
+    self.assert_matches_per_image(filtered, expected)
+
+  def test_non_max_suppression(self):
+    for iou_threshold in [0.5, 1.0]:
+      for max_output_size in [1, 2, 10]:
+        nms = np_batched_box_list_ops.non_max_suppression(
+            self.batched, max_output_size, iou_threshold)
+        expected = [np_box_list_ops.non_max_suppression(
+            boxlist, max_output_size, iou_threshold)
+                    for boxlist in self.boxlists]
+        self.assert_matches_per_image(nms, expected)
+
+  def test_non_max_suppression_matches_per_image_on_random_boxes(self):
+    np.random.seed(0)
+    boxlists = []
+    for num_boxes in [50, 0, 1, 80]:
+      corners = np.random.uniform(0, 10, size=[num_boxes, 2])
+      sizes = np.random.uniform(1, 4, size=[num_boxes, 2])
+      boxlist = np_box_list.BoxList(np.hstack([corners, corners + sizes]))
+      boxlist.add_field('scores', np.random.uniform(size=[num_boxes]))
+      boxlists.append(boxlist)
+    batched = np_batched_box_list_ops.batch(boxlists)
+    nms = np_batched_box_list_ops.non_max_suppression(batched, 20, 0.3)
+    expected = [np_box_list_ops.non_max_suppression(boxlist, 20, 0.3)
+                for boxlist in boxlists]
+    self.assert_matches_per_image(nms, expected)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -28,13 +28,21 @@ class BoxList(object):
 
   Optionally, users can add additional related fields (such as
   objectness/classification scores).
+
+  When constructed with lazy_fields=True, ops that select a subset of boxes
+  (gather, sort_by_field, filter_scores_greater_than, ...) record the selected
+  indices for each extra field as a FieldSelection instead of copying the
+  field data.  Chained selections are composed into a single index array (or
+  slice) and rows are only copied the first time get_field is called.
   """
 
-  def __init__(self, data):
+  def __init__(self, data, lazy_fields=False):
     """Constructs box collection.
 
     Args:
       data: a numpy array of shape [N, 4] representing box coordinates
+      lazy_fields: (optional) whether ops producing new BoxLists from this one
+          should defer copying extra fields until they are accessed.
 
     Raises:
       ValueError: if bbox data is not a numpy array
@@ -50,6 +58,7 @@ class BoxList(object):
       raise ValueError('Invalid box data. data must be a numpy array of '
                        'N*[y_min, x_min, y_max, x_max]')
     self.data = {'boxes': data}
+    self.lazy_fields = lazy_fields
 
   def num_boxes(self):
     """Return number of boxes held in collections."""
@@ -68,7 +77,7 @@ class BoxList(object):
     Args:
       field: a string parameter used to speficy a related field to be accessed.
       field_data: a numpy array of [N, ...] representing the data associated
-          with the field.
+          with the field, or a FieldSelection producing such an array.
     Raises:
       ValueError: if the field is already exist or the dimension of the field
           data does not matches the number of boxes.
@@ -101,7 +110,33 @@ class BoxList(object):
     """
     if not self.has_field(field):
       raise ValueError('field {} does not exist'.format(field))
-    return self.data[field]
+    field_data = self.data[field]
+    if isinstance(field_data, FieldSelection):
+      field_data = field_data.materialize()
+      self.data[field] = field_data
+    return field_data
+
+  def select_field(self, field, indices):
+    """Selects rows of a field without copying its data.
+
+    Args:
+      field: a string parameter used to speficy a related field to be accessed.
+      indices: a 1-d numpy array of type int_ or a slice, indexing into the
+          first dimension of the field.
+
+    Returns:
+      a FieldSelection of the field rows at indices.  If the field is itself
+      an unmaterialized selection, the two selections are composed.
+
+    Raises:
+      ValueError: if invalid field
+    """
+    if not self.has_field(field):
+      raise ValueError('field {} does not exist'.format(field))
+    field_data = self.data[field]
+    if not isinstance(field_data, FieldSelection):
+      field_data = FieldSelection(field_data, slice(None))
+    return field_data.select(indices_to_slice(indices))
 
   def get_coordinates(self):
     """Get corner coordinates of boxes.
@@ -131,3 +166,367 @@ class BoxList(object):
         if data[i, 0] > data[i, 2] or data[i, 1] > data[i, 3]:
           return False
     return True
+
+
+class FieldSelection(object):
+  """Deferred selection of rows from a field array.
+
+  Holds the source array together with a slice or 1-d integer index array
+  into its first dimension.  Slices are materialized as numpy views, index
+  arrays as a single fancy-indexing copy.
+  """
+
+  def __init__(self, source, indices):
+    """Constructs a field selection.
+
+    Args:
+      source: a numpy array of shape [N, ...].
+      indices: a slice or 1-d numpy array of type int_ indexing into the first
+          dimension of source.
+    """
+    self.source = source
+    self.indices = indices
+    if isinstance(indices, slice):
+      num_rows = len(range(source.shape[0])[indices])
+    else:
+      num_rows = indices.shape[0]
+    self.shape = (num_rows,) + source.shape[1:]
+
+  def select(self, indices):
+    """Returns a FieldSelection of rows of this selection.
+
+    Args:
+      indices: a slice or 1-d numpy array of type int_ indexing into the rows
+          of this selection.
+
+    Returns:
+      a FieldSelection on the same source array.
+    """
+    return FieldSelection(
+        self.source,
+        _compose_indices(self.indices, indices, self.source.shape[0]))
+
+  def materialize(self):
+    """Returns the selected rows as a numpy array."""
+    return self.source[self.indices, ...]
+
+
+def indices_to_slice(indices):
+  """Converts evenly spaced indices to an equivalent slice.
+
+  Args:
+    indices: a slice or numpy array of indices.
+
+  Returns:
+    a slice if indices is a 1-d integer array with a constant nonzero stride
+    (or is already a slice), else indices unchanged.
+  """
+  if isinstance(indices, slice):
+    return indices
+  if (not isinstance(indices, np.ndarray) or len(indices.shape) != 1 or
+      not np.issubdtype(indices.dtype, np.integer)):
+    return indices
+  if not indices.size:
+    return slice(0, 0)
+  start = int(indices[0])
+  if start < 0:
+    return indices
+  if indices.size == 1:
+    return slice(start, start + 1)
+  step = int(indices[1]) - start
+  if step == 0 or np.any(np.diff(indices) != step):
+    return indices
+  stop = int(indices[-1]) + step
+  if stop < 0:
+    stop = None
+  return slice(start, stop, step)
+
+
+def _compose_indices(first, second, length):
+  """Composes two row selections into one.
+
+  Args:
+    first: a slice or 1-d index array selecting from an axis of size length.
+    second: a slice or 1-d index array selecting from the result of first.
+    length: size of the axis first selects from.
+
+  Returns:
+    a slice or 1-d index array equivalent to applying first, then second.
+  """
+  if isinstance(first, slice) and first == slice(None):
+    return second
+  if isinstance(first, slice) and isinstance(second, slice):
+    selected = range(length)[first][second]
+    if not selected:
+      return slice(0, 0)
+    stop = selected.stop if selected.stop >= 0 else None
+    return slice(selected.start, stop, selected.step)
+  if isinstance(first, slice):
+    first = np.arange(length)[first]
+  return first[second]
+
+
+class BatchedBoxList(object):
+  """Box collection for a batch of images.
+
+  BatchedBoxList packs the boxes of several images into a single numpy array
+  of shape [N, 4] (rows are [y_min, x_min, y_max, x_max]) together with an
+  offsets array of shape [num_images + 1]: the boxes of image i are the rows
+  offsets[i]:offsets[i + 1].  Additional fields are packed the same way, so
+  batched ops can run over all images at once instead of per image.
+  """
+
+  def __init__(self, data, offsets):
+    """Constructs batched box collection.
+
+    Args:
+      data: a numpy array of shape [N, 4] representing box coordinates
+      offsets: a 1-d integer numpy array of shape [num_images + 1] with
+          offsets[0] == 0, offsets[-1] == N and non-decreasing values.
+
+    Raises:
+      ValueError: if bbox data is not a numpy array
+      ValueError: if invalid dimensions for bbox data
+      ValueError: if offsets are invalid
+    """
+    if not isinstance(data, np.ndarray):
+      raise ValueError('data must be a numpy array.')
+    if len(data.shape) != 2 or data.shape[1] != 4:
+      raise ValueError('Invalid dimensions for box data.')
+    if data.dtype != np.float32 and data.dtype != np.float64:
+      raise ValueError('Invalid data type for box data: float is required.')
+    if np.any(data[:, 0] > data[:, 2]) or np.any(data[:, 1] > data[:, 3]):
+      raise ValueError('Invalid box data. data must be a numpy array of '
+                       'N*[y_min, x_min, y_max, x_max]')
+    offsets = np.asarray(offsets)
+    if (len(offsets.shape) != 1 or not offsets.size or
+        not np.issubdtype(offsets.dtype, np.integer)):
+      raise ValueError('offsets must be a 1-d integer numpy array.')
+    if (offsets[0] != 0 or offsets[-1] != data.shape[0] or
+        np.any(np.diff(offsets) < 0)):
+      raise ValueError('offsets must be non-decreasing from 0 to num_boxes.')
+    self.data = {'boxes': data}
+    self.offsets = offsets
+    self._image_ids = None
+
+  def num_images(self):
+    """Return number of images in the batch."""
+    return self.offsets.shape[0] - 1
+
+  def num_boxes(self):
+    """Return number of boxes held in collections, summed over images."""
+    return self.data['boxes'].shape[0]
+
+  def num_boxes_per_image(self):
+    """Return a [num_images] numpy array with the number of boxes per image."""
+    return np.diff(self.offsets)
+
+  def image_ids(self):
+    """Return a [N] numpy array with the image index of every box."""
+    if self._image_ids is None:
+      self._image_ids = np.repeat(
+          np.arange(self.num_images()), self.num_boxes_per_image())
+    return self._image_ids
+
+  def get_extra_fields(self):
+    """Return all non-box fields."""
+    return [k for k in self.data.keys() if k != 'boxes']
+
+  def has_field(self, field):
+    return field in self.data
+
+  def add_field(self, field, field_data):
+    """Add data to a specified field.
+
+    Args:
+      field: a string parameter used to speficy a related field to be accessed.
+      field_data: a numpy array of [N, ...] representing the data associated
+          with the field, packed in the same order as the boxes.
+    Raises:
+      ValueError: if the field is already exist or the dimension of the field
+          data does not matches the number of boxes.
+    """
+    if self.has_field(field):
+      raise ValueError('Field ' + field + 'already exists')
+    if len(field_data.shape) < 1 or field_data.shape[0] != self.num_boxes():
+      raise ValueError('Invalid dimensions for field data')
+    self.data[field] = field_data
+
+  def get(self):
+    """Convenience function for accesssing box coordinates.
+
+    Returns:
+      a numpy array of shape [N, 4] representing box corners of all images
+    """
+    return self.get_field('boxes')
+
+  def get_field(self, field):
+    """Accesses data associated with the specified field in the box collection.
+
+    Args:
+      field: a string parameter used to speficy a related field to be accessed.
+
+    Returns:
+      a numpy array of shape [N, ...] representing data of an associated field
+
+    Raises:
+      ValueError: if invalid field
+    """
+    if not self.has_field(field):
+      raise ValueError('field {} does not exist'.format(field))
+    return self.data[field]
+
+  def get_coordinates(self):
+    """Get corner coordinates of boxes.
+
+    Returns:
+     a list of 4 1-d numpy arrays [y_min, x_min, y_max, x_max]
+    """
+    box_coordinates = self.get()
+    y_min = box_coordinates[:, 0]
+    x_min = box_coordinates[:, 1]
+    y_max = box_coordinates[:, 2]
+    x_max = box_coordinates[:, 3]
+    return [y_min, x_min, y_max, x_max]
+
+  def get_image(self, image_index):
+    """Returns the boxes and fields of a single image.
+
+    Args:
+      image_index: index of the image in the batch.
+
+    Returns:
+      a BoxList whose box and field arrays are views into this collection.
+    """
+    rows = slice(self.offsets[image_index], self.offsets[image_index + 1])
+    boxlist = BoxList(self.get()[rows, :])
+    for field in self.get_extra_fields():
+      boxlist.add_field(field, self.get_field(field)[rows, ...])
+    return boxlist
+
+
+class BoxListBuilder(object):
+  """Incrementally builds a BoxList from other BoxLists.
+
+  Boxes and fields are copied into preallocated buffers whose capacity doubles
+  when full, so appending many small BoxLists costs amortized O(1) copies per
+  box instead of keeping a list of arrays around and stacking them at the end.
+  finalize() returns a BoxList whose arrays are views into the buffers.
+
+  Example usage:
+    builder = BoxListBuilder()
+    for boxlist in per_class_results:
+      builder.append(boxlist)
+    merged = builder.finalize()
+  """
+
+  def __init__(self, initial_capacity=64, fields=None, lazy_fields=False):
+    """Constructs an empty builder.
+
+    Args:
+      initial_capacity: number of boxes the buffers initially hold.
+      fields: optional list of fields to collect.  By default, all fields of
+        the first appended BoxList are collected.
+      lazy_fields: lazy_fields value of the BoxLists returned by finalize.
+
+    Raises:
+      ValueError: if initial_capacity is not positive.
+    """
+    if initial_capacity < 1:
+      raise ValueError('initial_capacity must be positive.')
+    self._capacity = initial_capacity
+    self._num_boxes = 0
+    self._boxes = None
+    self._fields = None
+    self._field_names = fields
+    self._lazy_fields = lazy_fields
+
+  def num_boxes(self):
+    """Return number of boxes appended so far."""
+    return self._num_boxes
+
+  def append(self, boxlist):
+    """Copies the boxes and fields of a BoxList into the buffers.
+
+    Args:
+      boxlist: a BoxList containing all collected fields, with the same
+        field shapes (except for the first dimension) as previous BoxLists.
+
+    Raises:
+      ValueError: if boxlist is not a BoxList, lacks a collected field, or if
+        a field shape does not match.
+    """
+    if not isinstance(boxlist, BoxList):
+      raise ValueError('boxlist must be a BoxList')
+    if self._boxes is None:
+      self._allocate(boxlist)
+    for field in self._fields:
+      if not boxlist.has_field(field):
+        raise ValueError('boxlist must contain all requested fields')
+      if boxlist.get_field(field).shape[1:] != self._fields[field].shape[1:]:
+        raise ValueError('field %s must have same shape for all boxlists '
+                         'except for the 0th dimension.' % field)
+    num_new_boxes = boxlist.num_boxes()
+    self._reserve(self._num_boxes + num_new_boxes)
+    rows = slice(self._num_boxes, self._num_boxes + num_new_boxes)
+    self._boxes[rows] = boxlist.get()
+    for field, buffer in self._fields.items():
+      buffer[rows] = boxlist.get_field(field)
+    self._num_boxes += num_new_boxes
+
+  def extend(self, boxlists):
+    """Appends every BoxList of an iterable.
+
+    Args:
+      boxlists: an iterable of BoxLists, see append.
+    """
+    for boxlist in boxlists:
+      self.append(boxlist)
+
+  def finalize(self):
+    """Returns the collected boxes and fields as a BoxList.
+
+    The returned BoxList holds views into the builder buffers; boxes appended
+    afterwards do not show up in it.
+
+    Returns:
+      a BoxList holding num_boxes() boxes.
+
+    Raises:
+      ValueError: if nothing was appended.
+    """
+    if self._boxes is None:
+      raise ValueError('BoxListBuilder is empty; append a BoxList first')
+    rows = slice(0, self._num_boxes)
+    boxlist = BoxList(self._boxes[rows], lazy_fields=self._lazy_fields)
+    for field, buffer in self._fields.items():
+      boxlist.add_field(field, buffer[rows])
+    return boxlist
+
+  def _allocate(self, boxlist):
+    """Allocates buffers matching the dtypes and shapes of boxlist."""
+    field_names = self._field_names
+    if field_names is None:
+      field_names = boxlist.get_extra_fields()
+    self._capacity = max(self._capacity, boxlist.num_boxes())
+    self._boxes = np.empty([self._capacity, 4], dtype=boxlist.get().dtype)
+    self._fields = {}
+    for field in field_names:
+      field_data = boxlist.get_field(field)
+      self._fields[field] = np.empty(
+          (self._capacity,) + field_data.shape[1:], dtype=field_data.dtype)
+
+  def _reserve(self, num_boxes):
+    """Grows all buffers geometrically to hold at least num_boxes boxes."""
+    if num_boxes <= self._capacity:
+      return
+    while self._capacity < num_boxes:
+      self._capacity *= 2
+    self._boxes = self._grow(self._boxes)
+    for field in self._fields:
+      self._fields[field] = self._grow(self._fields[field])
+
+  def _grow(self, buffer):
+    grown = np.empty((self._capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:self._num_boxes] = buffer[:self._num_boxes]
+    return grown
@@ -20,6 +20,9 @@ Example box operations that are supported:
   * IOU: pairwise intersection-over-union scores
 """
 
+import collections
+import time
+
 import numpy as np
 
 from object_detection.utils import np_box_list
@@ -37,6 +40,38 @@ class SortOrder(object):
   DESCEND = 2
 
 
+class PipelineStage(object):
+  """Enum class for the stages of a PostprocessingPipeline.
+
+  Attributes:
+    FILTER_SCORES_GREATER_THAN: see filter_scores_greater_than; takes `thresh`.
+    CLIP_TO_WINDOW: see clip_to_window; takes `window`.
+    PRUNE_OUTSIDE_WINDOW: see prune_outside_window; takes `window`.
+    CHANGE_COORDINATE_FRAME: see change_coordinate_frame; takes `window`.
+    SCALE: see scale; takes `y_scale` and `x_scale`.
+    NON_MAX_SUPPRESSION: see non_max_suppression; takes `max_output_size`,
+      `iou_threshold` and `score_threshold`, all optional.
+  """
+  FILTER_SCORES_GREATER_THAN = 'filter_scores_greater_than'
+  CLIP_TO_WINDOW = 'clip_to_window'
+  PRUNE_OUTSIDE_WINDOW = 'prune_outside_window'
+  CHANGE_COORDINATE_FRAME = 'change_coordinate_frame'
+  SCALE = 'scale'
+  NON_MAX_SUPPRESSION = 'non_max_suppression'
+
+
+class SoftNmsMethod(object):
+  """Enum class for the score decay of soft_non_max_suppression.
+
+  Attributes:
+    LINEAR: scores of boxes overlapping a selected box by more than the IOU
+      threshold are multiplied by (1 - iou).
+    GAUSSIAN: scores of all boxes are multiplied by exp(-iou^2 / sigma).
+  """
+  LINEAR = 1
+  GAUSSIAN = 2
+
+
 def area(boxlist):
   """Computes area of boxes.
 
@@ -108,6 +143,10 @@ def gather(boxlist, indices, fields=None):
         all fields are gathered from.  Pass an empty fields list to only gather
         the box coordinates.
 
+  If boxlist was constructed with lazy_fields=True, the extra fields of the
+  returned BoxList are deferred selections that are only copied on access;
+  evenly spaced indices are turned into slices so that they become views.
+
   Returns:
     subboxlist: a BoxList corresponding to the subset of the input BoxList
         specified by indices
@@ -119,12 +158,18 @@ def gather(boxlist, indices, fields=None):
   if indices.size:
     if np.amax(indices) >= boxlist.num_boxes() or np.amin(indices) < 0:
       raise ValueError('indices are out of valid range.')
-  subboxlist = np_box_list.BoxList(boxlist.get()[indices, :])
+  if boxlist.lazy_fields:
+    indices = np_box_list.indices_to_slice(indices)
+  subboxlist = np_box_list.BoxList(boxlist.get()[indices, :],
+                                   lazy_fields=boxlist.lazy_fields)
   if fields is None:
     fields = boxlist.get_extra_fields()
   for field in fields:
-    extra_field_data = boxlist.get_field(field)
-    subboxlist.add_field(field, extra_field_data[indices, ...])
+    if boxlist.lazy_fields:
+      subboxlist.add_field(field, boxlist.select_field(field, indices))
+    else:
+      extra_field_data = boxlist.get_field(field)
+      subboxlist.add_field(field, extra_field_data[indices, ...])
   return subboxlist
 
 
@@ -214,7 +259,7 @@ def non_max_suppression(boxlist,
   is_index_valid = np.full(num_boxes, 1, dtype=bool)
   selected_indices = []
   num_output = 0
-  for i in xrange(num_boxes):
+  for i in range(num_boxes):
     if num_output < max_output_size:
       if is_index_valid[i]:
         num_output += 1
@@ -233,6 +278,175 @@ def non_max_suppression(boxlist,
   return gather(boxlist, np.array(selected_indices))
 
 
+def soft_non_max_suppression(boxlist,
+                             max_output_size=10000,
+                             iou_threshold=0.3,
+                             sigma=0.5,
+                             score_threshold=0.001,
+                             method=SoftNmsMethod.GAUSSIAN):
+  """Soft non maximum suppression.
+
+  Like non_max_suppression this op greedily selects the box with the highest
+  score, but instead of discarding the boxes overlapping it, it decays their
+  scores as a function of the IOU (Bodla et al., "Soft-NMS -- Improving
+  Object Detection With One Line of Code", 2017).  Boxes whose decayed score
+  falls to score_threshold or below are dropped.
+
+  Scores are updated in place: after each selection only the IOUs between the
+  selected box and the boxes that are still active are computed, and the
+  active set shrinks as boxes are selected or decayed away.
+
+  Args:
+    boxlist: BoxList holding N boxes.  Must contain a 'scores' field
+      representing detection scores. All scores belong to the same class.
+    max_output_size: maximum number of retained boxes
+    iou_threshold: intersection over union threshold above which the linear
+      method decays scores.  Unused by the gaussian method.
+    sigma: spread of the gaussian decay.
+    score_threshold: boxes with (decayed) scores less than or equal to this
+      value are removed.
+    method: a SoftNmsMethod value.
+
+  Returns:
+    a BoxList holding M <= max_output_size boxes in the order they were
+    selected, with the 'scores' field holding the decayed scores.
+  Raises:
+    ValueError: if 'scores' field does not exist
+    ValueError: if threshold is not in [0, 1]
+    ValueError: if max_output_size < 0, sigma <= 0 or method is invalid
+  """
+  if not boxlist.has_field('scores'):
+    raise ValueError('Field scores does not exist')
+  if iou_threshold < 0. or iou_threshold > 1.0:
+    raise ValueError('IOU threshold must be in [0, 1]')
+  if max_output_size < 0:
+    raise ValueError('max_output_size must be bigger than 0.')
+  if sigma <= 0:
+    raise ValueError('sigma must be positive.')
+  if method != SoftNmsMethod.LINEAR and method != SoftNmsMethod.GAUSSIAN:
+    raise ValueError('Invalid soft NMS method')
+
+  boxes = boxlist.get()
+  scores = np.array(np.reshape(boxlist.get_field('scores'), [-1]), dtype=float)
+  active_indices = np.nonzero(scores > score_threshold)[0]
+  selected_indices = []
+  while active_indices.size and len(selected_indices) < max_output_size:
+    best = np.argmax(scores[active_indices])
+    selected_index = active_indices[best]
+    selected_indices.append(selected_index)
+    active_indices = np.delete(active_indices, best)
+    if not active_indices.size:
+      break
+    intersect_over_union = np_box_ops.iou(
+        boxes[selected_index:selected_index + 1, :],
+        boxes[active_indices, :])[0]
+    if method == SoftNmsMethod.LINEAR:
+      decay = np.where(intersect_over_union > iou_threshold,
+                       1.0 - intersect_over_union, 1.0)
+    else:
+      decay = np.exp(-np.square(intersect_over_union) / sigma)
+    scores[active_indices] *= decay
+    active_indices = active_indices[scores[active_indices] > score_threshold]
+
+  selected_indices = np.array(selected_indices, dtype=int)
+  fields = [f for f in boxlist.get_extra_fields() if f != 'scores']
+  selected = gather(boxlist, selected_indices, fields)
+  selected.add_field('scores', scores[selected_indices])
+  return selected
+
+
+def weighted_box_fusion(boxlist,
+                        iou_threshold=0.55,
+                        score_threshold=0.0,
+                        num_models=1):
+  """Weighted box fusion.
+
+  Instead of keeping only the highest scoring box of a cluster of overlapping
+  boxes, each cluster is fused into the score-weighted average of its boxes
+  (Solovyev et al., "Weighted boxes fusion: Ensembling boxes from different
+  object detection models", 2019).  Boxes are visited in order of decreasing
+  score and added to the cluster whose fused box overlaps them most, if by
+  more than iou_threshold, or start a new cluster.
+
+  Clusters are kept as running sums of score-weighted coordinates, so adding
+  a box to a cluster updates its fused box in constant time and every box is
+  only compared against the current fused boxes.
+
+  Args:
+    boxlist: BoxList holding N boxes.  Must contain a 'scores' field
+      representing detection scores. All scores belong to the same class.
+    iou_threshold: minimum intersection over union with a fused box for a box
+      to be added to its cluster.
+    score_threshold: boxes with scores less than or equal to this value are
+      ignored.
+    num_models: number of models (or tiles, or test time augmentations) that
+      produced the boxes.  The fused score is the mean score of the cluster
+      times min(cluster size, num_models) / num_models.
+
+  Returns:
+    a BoxList holding one fused box per cluster, sorted by decreasing fused
+    score.  The 'scores' field holds the fused scores and a 'num_fused' field
+    the cluster sizes; other fields are taken from the highest scoring box of
+    each cluster.
+  Raises:
+    ValueError: if 'scores' field does not exist
+    ValueError: if threshold is not in [0, 1]
+    ValueError: if num_models < 1
+  """
+  if not boxlist.has_field('scores'):
+    raise ValueError('Field scores does not exist')
+  if iou_threshold < 0. or iou_threshold > 1.0:
+    raise ValueError('IOU threshold must be in [0, 1]')
+  if num_models < 1:
+    raise ValueError('num_models must be at least 1.')
+
+  boxlist = filter_scores_greater_than(boxlist, score_threshold)
+  boxlist = sort_by_field(boxlist, 'scores')
+  boxes = boxlist.get()
+  scores = np.reshape(boxlist.get_field('scores'), [-1])
+  num_boxes = boxlist.num_boxes()
+
+  fused_boxes = np.zeros([num_boxes, 4], dtype=float)
+  weighted_box_sums = np.zeros([num_boxes, 4], dtype=float)
+  score_sums = np.zeros(num_boxes, dtype=float)
+  cluster_sizes = np.zeros(num_boxes, dtype=int)
+  representatives = np.zeros(num_boxes, dtype=int)
+  num_clusters = 0
+  for i in range(num_boxes):
+    cluster = -1
+    if num_clusters:
+      intersect_over_union = np_box_ops.iou(boxes[i:i + 1, :],
+                                            fused_boxes[:num_clusters, :])[0]
+      best_cluster = np.argmax(intersect_over_union)
+      if intersect_over_union[best_cluster] > iou_threshold:
+        cluster = best_cluster
+    if cluster < 0:
+      cluster = num_clusters
+      representatives[cluster] = i
+      num_clusters += 1
+    weighted_box_sums[cluster] += scores[i] * boxes[i]
+    score_sums[cluster] += scores[i]
+    cluster_sizes[cluster] += 1
+    if score_sums[cluster] > 0:
+      fused_boxes[cluster] = weighted_box_sums[cluster] / score_sums[cluster]
+    else:
+      fused_boxes[cluster] = boxes[i]
+
+  cluster_sizes = cluster_sizes[:num_clusters]
+  fused_scores = (score_sums[:num_clusters] / np.maximum(cluster_sizes, 1) *
+                  np.minimum(cluster_sizes, num_models) / num_models)
+  fused = np_box_list.BoxList(
+      fused_boxes[:num_clusters].astype(boxes.dtype),
+      lazy_fields=boxlist.lazy_fields)
+  for field in boxlist.get_extra_fields():
+    if field != 'scores':
+      fused.add_field(
+          field, boxlist.get_field(field)[representatives[:num_clusters], ...])
+  fused.add_field('scores', fused_scores)
+  fused.add_field('num_fused', cluster_sizes)
+  return sort_by_field(fused, 'scores')
+
+
 def multi_class_non_max_suppression(boxlist, score_thresh, iou_thresh,
                                     max_output_size):
   """Multi-class version of non maximum suppression.
@@ -287,9 +501,11 @@ def multi_class_non_max_suppression(boxlist, score_thresh, iou_thresh,
   if num_boxes != num_scores:
     raise ValueError('Incorrect scores field length: actual vs expected.')
 
-  selected_boxes_list = []
+  selected_boxes_builder = np_box_list.BoxListBuilder(
+      fields=['scores', 'classes'], lazy_fields=boxlist.lazy_fields)
   for class_idx in range(num_classes):
-    boxlist_and_class_scores = np_box_list.BoxList(boxlist.get())
+    boxlist_and_class_scores = np_box_list.BoxList(
+        boxlist.get(), lazy_fields=boxlist.lazy_fields)
     class_scores = np.reshape(scores[0:num_scores, class_idx], [-1])
     boxlist_and_class_scores.add_field('scores', class_scores)
     boxlist_filt = filter_scores_greater_than(boxlist_and_class_scores,
@@ -300,8 +516,8 @@ def multi_class_non_max_suppression(boxlist, score_thresh, iou_thresh,
                                      score_threshold=score_thresh)
     nms_result.add_field(
         'classes', np.zeros_like(nms_result.get_field('scores')) + class_idx)
-    selected_boxes_list.append(nms_result)
-  selected_boxes = concatenate(selected_boxes_list)
+    selected_boxes_builder.append(nms_result)
+  selected_boxes = selected_boxes_builder.finalize()
   sorted_boxes = sort_by_field(selected_boxes, 'scores')
   return sorted_boxes
 
@@ -322,14 +538,9 @@ def scale(boxlist, y_scale, x_scale):
   y_max = y_scale * y_max
   x_min = x_scale * x_min
   x_max = x_scale * x_max
-  scaled_boxlist = np_box_list.BoxList(np.hstack([y_min, x_min, y_max, x_max]))
-
-  fields = boxlist.get_extra_fields()
-  for field in fields:
-    extra_field_data = boxlist.get_field(field)
-    scaled_boxlist.add_field(field, extra_field_data)
-
-  return scaled_boxlist
+  scaled_boxlist = np_box_list.BoxList(np.hstack([y_min, x_min, y_max, x_max]),
+                                       lazy_fields=boxlist.lazy_fields)
+  return _copy_extra_fields(scaled_boxlist, boxlist)
 
 
 def clip_to_window(boxlist, window):
@@ -358,7 +569,8 @@ def clip_to_window(boxlist, window):
   x_min_clipped = np.fmax(np.fmin(x_min, win_x_max), win_x_min)
   x_max_clipped = np.fmax(np.fmin(x_max, win_x_max), win_x_min)
   clipped = np_box_list.BoxList(
-      np.hstack([y_min_clipped, x_min_clipped, y_max_clipped, x_max_clipped]))
+      np.hstack([y_min_clipped, x_min_clipped, y_max_clipped, x_max_clipped]),
+      lazy_fields=boxlist.lazy_fields)
   clipped = _copy_extra_fields(clipped, boxlist)
   areas = area(clipped)
   nonzero_area_indices = np.reshape(np.nonzero(np.greater(areas, 0.0)),
@@ -451,7 +663,8 @@ def concatenate(boxlists, fields=None):
     if not isinstance(boxlist, np_box_list.BoxList):
       raise ValueError('all elements of boxlists should be BoxList objects')
   concatenated = np_box_list.BoxList(
-      np.vstack([boxlist.get() for boxlist in boxlists]))
+      np.vstack([boxlist.get() for boxlist in boxlists]),
+      lazy_fields=boxlists[0].lazy_fields)
   if fields is None:
     fields = boxlists[0].get_extra_fields()
   for field in fields:
@@ -527,16 +740,186 @@ def change_coordinate_frame(boxlist, window):
   win_width = window[3] - window[1]
   boxlist_new = scale(
       np_box_list.BoxList(boxlist.get() -
-                          [window[0], window[1], window[0], window[1]]),
+                          [window[0], window[1], window[0], window[1]],
+                          lazy_fields=boxlist.lazy_fields),
       1.0 / win_height, 1.0 / win_width)
   _copy_extra_fields(boxlist_new, boxlist)
 
   return boxlist_new
 
 
+class PostprocessingPipeline(object):
+  """Fused chain of box postprocessing ops.
+
+  Running the stages one after another through the ops of this module
+  validates the input, allocates a new BoxList and copies every field at each
+  stage.  A PostprocessingPipeline validates its stages once at construction
+  and the input BoxList once per call.  It then applies all elementwise stages
+  in place to a single preallocated copy of the box coordinates, tracking the
+  surviving boxes in a boolean mask, and gathers boxes and fields a single
+  time before running non maximum suppression (which must be the last stage,
+  if present).  The result is the same as chaining the corresponding ops.
+
+  Example usage:
+    pipeline = PostprocessingPipeline([
+        (PipelineStage.FILTER_SCORES_GREATER_THAN, {'thresh': 0.5}),
+        (PipelineStage.CLIP_TO_WINDOW, {'window': window}),
+        (PipelineStage.NON_MAX_SUPPRESSION, {'iou_threshold': 0.6})])
+    boxlist = pipeline.run(boxlist)
+  """
+
+  _STAGE_ARGS = {
+      PipelineStage.FILTER_SCORES_GREATER_THAN: (['thresh'], []),
+      PipelineStage.CLIP_TO_WINDOW: (['window'], []),
+      PipelineStage.PRUNE_OUTSIDE_WINDOW: (['window'], []),
+      PipelineStage.CHANGE_COORDINATE_FRAME: (['window'], []),
+      PipelineStage.SCALE: (['y_scale', 'x_scale'], []),
+      PipelineStage.NON_MAX_SUPPRESSION: (
+          [], ['max_output_size', 'iou_threshold', 'score_threshold']),
+  }
+
+  def __init__(self, stages, profile=False):
+    """Constructs and validates a pipeline.
+
+    Args:
+      stages: an ordered list of (stage, kwargs) tuples, where stage is one of
+        the PipelineStage values and kwargs a dict of the arguments of the
+        corresponding op (apart from the boxlist).
+      profile: (optional) whether to record the time spent in every stage of
+        each run in `stage_timings`.
+
+    Raises:
+      ValueError: if a stage is unknown, has missing or unexpected arguments,
+        invalid argument values, or if non_max_suppression is not last.
+    """
+    self._stages = []
+    self._nms_kwargs = None
+    self._requires_scores = False
+    for stage_index, (stage, kwargs) in enumerate(stages):
+      if stage not in self._STAGE_ARGS:
+        raise ValueError('Unknown pipeline stage: {}'.format(stage))
+      required_args, optional_args = self._STAGE_ARGS[stage]
+      missing_args = set(required_args) - set(kwargs)
+      unexpected_args = set(kwargs) - set(required_args) - set(optional_args)
+      if missing_args or unexpected_args:
+        raise ValueError('Invalid arguments for stage {}: missing {}, '
+                         'unexpected {}'.format(stage, sorted(missing_args),
+                                                sorted(unexpected_args)))
+      if stage == PipelineStage.NON_MAX_SUPPRESSION:
+        if stage_index != len(stages) - 1:
+          raise ValueError('non_max_suppression must be the last stage')
+        iou_threshold = kwargs.get('iou_threshold', 1.0)
+        if iou_threshold < 0. or iou_threshold > 1.0:
+          raise ValueError('IOU threshold must be in [0, 1]')
+        if kwargs.get('max_output_size', 0) < 0:
+          raise ValueError('max_output_size must be bigger than 0.')
+        self._nms_kwargs = dict(kwargs)
+        self._requires_scores = True
+        continue
+      if stage == PipelineStage.FILTER_SCORES_GREATER_THAN:
+        self._requires_scores = True
+        stage_args = (kwargs['thresh'],)
+      elif stage == PipelineStage.SCALE:
+        stage_args = (np.array([kwargs['y_scale'], kwargs['x_scale'],
+                                kwargs['y_scale'], kwargs['x_scale']]),)
+      else:
+        window = np.asarray(kwargs['window'])
+        if window.shape != (4,):
+          raise ValueError('window for stage {} must have shape [4]'.format(
+              stage))
+        if stage == PipelineStage.CHANGE_COORDINATE_FRAME:
+          win_height = window[2] - window[0]
+          win_width = window[3] - window[1]
+          stage_args = (window[[0, 1, 0, 1]],
+                        np.array([1.0 / win_height, 1.0 / win_width,
+                                  1.0 / win_height, 1.0 / win_width]))
+        else:
+          stage_args = (window[[0, 1, 0, 1]], window[[2, 3, 2, 3]])
+      self._stages.append((stage, stage_args))
+    self.profile = profile
+    self.stage_timings = collections.OrderedDict()
+
+  def run(self, boxlist):
+    """Applies all stages to a BoxList.
+
+    Args:
+      boxlist: BoxList holding N boxes.  Must contain a rank 1 (or [N, 1])
+        'scores' field if the pipeline filters on scores or runs NMS.
+
+    Returns:
+      a BoxList holding the M <= N boxes (and all their fields) that survive
+      the pipeline.
+
+    Raises:
+      ValueError: if boxlist not a BoxList object or if it does not have a
+        required scores field
+    """
+    if not isinstance(boxlist, np_box_list.BoxList):
+      raise ValueError('boxlist must be a BoxList')
+    scores = None
+    if self._requires_scores:
+      if not boxlist.has_field('scores'):
+        raise ValueError('input boxlist must have \'scores\' field')
+      scores = boxlist.get_field('scores')
+      if len(scores.shape) > 2 or (len(scores.shape) == 2 and
+                                   scores.shape[1] != 1):
+        raise ValueError('Scores should have rank 1 or have shape '
+                         'consistent with [None, 1]')
+      scores = np.reshape(scores, [-1])
+    if self.profile:
+      self.stage_timings = collections.OrderedDict()
+
+    boxes = np.array(boxlist.get())
+    keep = np.ones(boxlist.num_boxes(), dtype=bool)
+    for stage, stage_args in self._stages:
+      start_time = time.time()
+      if stage == PipelineStage.FILTER_SCORES_GREATER_THAN:
+        keep &= np.greater(scores, stage_args[0])
+      elif stage == PipelineStage.CLIP_TO_WINDOW:
+        np.fmin(boxes, stage_args[1], out=boxes)
+        np.fmax(boxes, stage_args[0], out=boxes)
+        keep &= np.greater(np_box_ops.area(boxes), 0.0)
+      elif stage == PipelineStage.PRUNE_OUTSIDE_WINDOW:
+        keep &= np.all(boxes[:, :2] >= stage_args[0][:2], axis=1)
+        keep &= np.all(boxes[:, 2:] <= stage_args[1][2:], axis=1)
+      elif stage == PipelineStage.CHANGE_COORDINATE_FRAME:
+        boxes -= stage_args[0]
+        boxes *= stage_args[1]
+      elif stage == PipelineStage.SCALE:
+        boxes *= stage_args[0]
+      if self.profile:
+        self.stage_timings[stage] = (
+            self.stage_timings.get(stage, 0.0) + time.time() - start_time)
+
+    start_time = time.time()
+    indices = np.nonzero(keep)[0]
+    if boxlist.lazy_fields:
+      indices = np_box_list.indices_to_slice(indices)
+    result = np_box_list.BoxList(boxes[indices, :],
+                                 lazy_fields=boxlist.lazy_fields)
+    for field in boxlist.get_extra_fields():
+      if boxlist.lazy_fields:
+        result.add_field(field, boxlist.select_field(field, indices))
+      else:
+        result.add_field(field, boxlist.get_field(field)[indices, ...])
+    if self.profile:
+      self.stage_timings['gather'] = time.time() - start_time
+
+    if self._nms_kwargs is not None:
+      start_time = time.time()
+      result = non_max_suppression(result, **self._nms_kwargs)
+      if self.profile:
+        self.stage_timings[PipelineStage.NON_MAX_SUPPRESSION] = (
+            time.time() - start_time)
+    return result
+
+
 def _copy_extra_fields(boxlist_to_copy_to, boxlist_to_copy_from):
   """Copies the extra fields of boxlist_to_copy_from to boxlist_to_copy_to.
 
+  Unmaterialized field selections of a lazy boxlist_to_copy_from are passed
+  on as they are rather than being materialized.
+
   Args:
     boxlist_to_copy_to: BoxList to which extra fields are copied.
     boxlist_to_copy_from: BoxList from which fields are copied.
@@ -545,7 +928,11 @@ def _copy_extra_fields(boxlist_to_copy_to, boxlist_to_copy_from):
     boxlist_to_copy_to with extra fields.
   """
   for field in boxlist_to_copy_from.get_extra_fields():
-    boxlist_to_copy_to.add_field(field, boxlist_to_copy_from.get_field(field))
+    if boxlist_to_copy_from.lazy_fields:
+      field_data = boxlist_to_copy_from.select_field(field, slice(None))
+    else:
+      field_data = boxlist_to_copy_from.get_field(field)
+    boxlist_to_copy_to.add_field(field, field_data)
   return boxlist_to_copy_to
 
 
@@ -0,0 +1,110 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmarks for the suppression ops of np_box_list_ops.
+
+Times non_max_suppression, soft_non_max_suppression (linear and gaussian)
+and weighted_box_fusion on random clustered boxes, e.g.:
+
+  python -m object_detection.utils.np_box_list_ops_benchmark \
+      --num_boxes 1000 2000 5000 10000
+"""
+
+import argparse
+import functools
+import timeit
+
+import numpy as np
+
+from object_detection.utils import np_box_list
+from object_detection.utils import np_box_list_ops
+
+
+def create_clustered_boxlist(num_boxes, num_clusters=100, seed=0):
+  """Creates a BoxList of jittered copies of num_clusters random boxes.
+
+  Args:
+    num_boxes: number of boxes to create.
+    num_clusters: number of distinct objects the boxes are jittered around,
+      mimicking overlapping detections from tiles or model ensembles.
+    seed: random seed.
+
+  Returns:
+    a BoxList with a 'scores' field.
+  """
+  random_state = np.random.RandomState(seed)
+  centers = random_state.uniform(0, 1000, size=[num_clusters, 2])
+  sizes = random_state.uniform(10, 60, size=[num_clusters, 2])
+  assignments = random_state.randint(num_clusters, size=num_boxes)
+  jitter = random_state.normal(scale=3.0, size=[num_boxes, 4])
+  corners = np.hstack([centers[assignments] - sizes[assignments] / 2,
+                       centers[assignments] + sizes[assignments] / 2])
+  boxes = corners + jitter
+  boxes[:, 2:] = np.maximum(boxes[:, 2:], boxes[:, :2] + 1.0)
+  boxlist = np_box_list.BoxList(boxes)
+  boxlist.add_field('scores', random_state.uniform(size=num_boxes))
+  return boxlist
+
+
+def run_benchmarks(num_boxes_list, repeats):
+  """Times every op for each number of boxes.
+
+  Args:
+    num_boxes_list: list of box counts to benchmark.
+    repeats: number of timed runs per op; the best one is reported.
+
+  Returns:
+    a list of (num_boxes, op name, seconds, num output boxes) tuples.
+  """
+  ops = [
+      ('non_max_suppression',
+       functools.partial(np_box_list_ops.non_max_suppression,
+                         iou_threshold=0.5)),
+      ('soft_nms_linear',
+       functools.partial(np_box_list_ops.soft_non_max_suppression,
+                         iou_threshold=0.5,
+                         method=np_box_list_ops.SoftNmsMethod.LINEAR)),
+      ('soft_nms_gaussian',
+       functools.partial(np_box_list_ops.soft_non_max_suppression,
+                         method=np_box_list_ops.SoftNmsMethod.GAUSSIAN)),
+      ('weighted_box_fusion',
+       functools.partial(np_box_list_ops.weighted_box_fusion,
+                         iou_threshold=0.55)),
+  ]
+  results = []
+  for num_boxes in num_boxes_list:
+    boxlist = create_clustered_boxlist(num_boxes)
+    for name, op in ops:
+      seconds = min(timeit.repeat(functools.partial(op, boxlist),
+                                  number=1, repeat=repeats))
+      results.append((num_boxes, name, seconds, op(boxlist).num_boxes()))
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--num_boxes', type=int, nargs='+',
+                      default=[1000, 2000, 5000, 10000])
+  parser.add_argument('--repeats', type=int, default=3)
+  args = parser.parse_args()
+  print('{:>9} {:<22} {:>10} {:>9}'.format('boxes', 'op', 'ms', 'output'))
+  for num_boxes, name, seconds, num_output in run_benchmarks(args.num_boxes,
+                                                             args.repeats):
+    print('{:>9} {:<22} {:>10.1f} {:>9}'.format(num_boxes, name,
+                                               1000 * seconds, num_output))
+
+
+if __name__ == '__main__':
+  main()
@@ -410,5 +410,212 @@ class NonMaximumSuppressionTest(tf.test.TestCase):
     self.assertAllClose(boxes, expected_boxes)
 
 
+class LazyFieldsOpsTest(tf.test.TestCase):
+
+  def setUp(self):
+    boxes = np.array([[0, 0, 1, 1],
+                      [0, 0.1, 1, 1.1],
+                      [0, -0.1, 1, 0.9],
+                      [0, 10, 1, 11],
+                      [0, 10.1, 1, 11.1],
+                      [0, 100, 1, 101]],
+                     dtype=float)
+    scores = np.array([.9, .75, .6, .95, .2, .3], dtype=float)
+    self.labels = np.arange(6 * 3, dtype=int).reshape([6, 3])
+    self.eager_boxlist = np_box_list.BoxList(boxes)
+    self.eager_boxlist.add_field('scores', scores)
+    self.eager_boxlist.add_field('labels', self.labels)
+    self.lazy_boxlist = np_box_list.BoxList(boxes, lazy_fields=True)
+    self.lazy_boxlist.add_field('scores', scores)
+    self.lazy_boxlist.add_field('labels', self.labels)
+
+  def test_gather_defers_fields(self):
+    subboxlist = np_box_list_ops.gather(self.lazy_boxlist,
+                                        np.array([4, 2, 0], dtype=int))
+    self.assertTrue(subboxlist.lazy_fields)
+    selection = subboxlist.data['labels']
+    self.assertTrue(isinstance(selection, np_box_list.FieldSelection))
+    self.assertTrue(np.shares_memory(subboxlist.get_field('labels'),
+                                     self.labels))
+    self.assertAllEqual(subboxlist.get_field('labels'), self.labels[4::-2])
+
+  def test_postprocessing_chain_matches_eager(self):
+    def chain(boxlist):
+      boxlist = np_box_list_ops.filter_scores_greater_than(boxlist, 0.25)
+      boxlist = np_box_list_ops.clip_to_window(boxlist,
+                                               np.array([0, 0, 1, 50.0]))
+      boxlist = np_box_list_ops.sort_by_field(boxlist, 'scores')
+      return np_box_list_ops.non_max_suppression(boxlist, 10, 0.5)
+
+    eager = chain(self.eager_boxlist)
+    lazy = chain(self.lazy_boxlist)
+    self.assertTrue(lazy.data['labels'].source is self.labels)
+    self.assertAllClose(eager.get(), lazy.get())
+    self.assertAllClose(eager.get_field('scores'), lazy.get_field('scores'))
+    self.assertAllEqual(eager.get_field('labels'), lazy.get_field('labels'))
+
+
+class PostprocessingPipelineTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    corners = np.random.uniform(-5, 50, size=[200, 2])
+    sizes = np.random.uniform(1, 10, size=[200, 2])
+    self.boxlist = np_box_list.BoxList(np.hstack([corners, corners + sizes]))
+    self.boxlist.add_field('scores', np.random.uniform(size=[200]))
+    self.boxlist.add_field('labels', np.arange(200))
+
+  def test_matches_chained_ops(self):
+    window = np.array([0, 0, 40, 40], dtype=float)
+    pipeline = np_box_list_ops.PostprocessingPipeline([
+        (np_box_list_ops.PipelineStage.FILTER_SCORES_GREATER_THAN,
+         {'thresh': 0.3}),
+        (np_box_list_ops.PipelineStage.CLIP_TO_WINDOW, {'window': window}),
+        (np_box_list_ops.PipelineStage.CHANGE_COORDINATE_FRAME,
+         {'window': window}),
+        (np_box_list_ops.PipelineStage.PRUNE_OUTSIDE_WINDOW,
+         {'window': [0, 0, 0.9, 1.0]}),
+        (np_box_list_ops.PipelineStage.SCALE,
+         {'y_scale': 480, 'x_scale': 640}),
+        (np_box_list_ops.PipelineStage.NON_MAX_SUPPRESSION,
+         {'max_output_size': 20, 'iou_threshold': 0.5})])
+    fused = pipeline.run(self.boxlist)
+
+    expected = np_box_list_ops.filter_scores_greater_than(self.boxlist, 0.3)
+    expected = np_box_list_ops.clip_to_window(expected, window)
+    expected = np_box_list_ops.change_coordinate_frame(expected, window)
+    expected, _ = np_box_list_ops.prune_outside_window(
+        expected, [0, 0, 0.9, 1.0])
+    expected = np_box_list_ops.scale(expected, 480, 640)
+    expected = np_box_list_ops.non_max_suppression(expected, 20, 0.5)
+
+    self.assertAllEqual(fused.get(), expected.get())
+    self.assertAllEqual(fused.get_field('scores'),
+                        expected.get_field('scores'))
+    self.assertAllEqual(fused.get_field('labels'),
+                        expected.get_field('labels'))
+
+  def test_profiling_records_stage_timings(self):
+    pipeline = np_box_list_ops.PostprocessingPipeline(
+        [(np_box_list_ops.PipelineStage.FILTER_SCORES_GREATER_THAN,
+          {'thresh': 0.3}),
+         (np_box_list_ops.PipelineStage.NON_MAX_SUPPRESSION, {})],
+        profile=True)
+    pipeline.run(self.boxlist)
+    self.assertEqual(list(pipeline.stage_timings.keys()),
+                     ['filter_scores_greater_than', 'gather',
+                      'non_max_suppression'])
+
+  def test_invalid_stages(self):
+    with self.assertRaises(ValueError):
+      np_box_list_ops.PostprocessingPipeline([('rotate', {})])
+    with self.assertRaises(ValueError):
+      np_box_list_ops.PostprocessingPipeline(
+          [(np_box_list_ops.PipelineStage.SCALE, {'y_scale': 2.0})])
+    with self.assertRaises(ValueError):
+      np_box_list_ops.PostprocessingPipeline(
+          [(np_box_list_ops.PipelineStage.NON_MAX_SUPPRESSION, {}),
+           (np_box_list_ops.PipelineStage.SCALE,
+            {'y_scale': 2.0, 'x_scale': 2.0})])
+    with self.assertRaises(ValueError):
+      np_box_list_ops.PostprocessingPipeline(
+          [(np_box_list_ops.PipelineStage.CLIP_TO_WINDOW,
+            {'window': [0, 0, 1]})])
+
+  def test_requires_scores(self):
+    pipeline = np_box_list_ops.PostprocessingPipeline(
+        [(np_box_list_ops.PipelineStage.NON_MAX_SUPPRESSION, {})])
+    with self.assertRaises(ValueError):
+      pipeline.run(np_box_list.BoxList(self.boxlist.get()))
+
+
+class SoftNonMaximumSuppressionTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._boxes = np.array([[0, 0, 1, 1],
+                            [0, 0.1, 1, 1.1],
+                            [0, 10, 1, 11],
+                            [0, 100, 1, 101]],
+                           dtype=float)
+    self._scores = np.array([.9, .75, .95, .3], dtype=float)
+
+  def _boxlist(self):
+    boxlist = np_box_list.BoxList(self._boxes)
+    boxlist.add_field('scores', self._scores)
+    boxlist.add_field('labels', np.array([1, 2, 3, 4]))
+    return boxlist
+
+  def test_linear_decay(self):
+    nms_boxlist = np_box_list_ops.soft_non_max_suppression(
+        self._boxlist(), iou_threshold=0.5,
+        method=np_box_list_ops.SoftNmsMethod.LINEAR)
+    iou = 0.9 / 1.1
+    self.assertAllClose(nms_boxlist.get_field('scores'),
+                        [.95, .9, .3, .75 * (1 - iou)])
+    self.assertAllEqual(nms_boxlist.get_field('labels'), [3, 1, 4, 2])
+
+  def test_gaussian_decay(self):
+    nms_boxlist = np_box_list_ops.soft_non_max_suppression(
+        self._boxlist(), sigma=0.5, score_threshold=0.2)
+    iou = 0.9 / 1.1
+    decayed_score = .75 * np.exp(-iou * iou / 0.5)
+    self.assertAllClose(nms_boxlist.get_field('scores'), [.95, .9, .3])
+    self.assertTrue(decayed_score < 0.2)
+    self.assertAllEqual(nms_boxlist.get_field('labels'), [3, 1, 4])
+
+  def test_max_output_size(self):
+    nms_boxlist = np_box_list_ops.soft_non_max_suppression(
+        self._boxlist(), max_output_size=2)
+    self.assertAllClose(nms_boxlist.get(), self._boxes[[2, 0]])
+
+  def test_linear_decay_with_score_threshold_matches_hard_nms(self):
+    boxlist = self._boxlist()
+    soft = np_box_list_ops.soft_non_max_suppression(
+        boxlist, iou_threshold=0.5, score_threshold=0.5,
+        method=np_box_list_ops.SoftNmsMethod.LINEAR)
+    hard = np_box_list_ops.non_max_suppression(boxlist, iou_threshold=0.5)
+    self.assertAllClose(soft.get(), hard.get()[:soft.num_boxes()])
+
+
+class WeightedBoxFusionTest(tf.test.TestCase):
+
+  def test_fuses_overlapping_boxes(self):
+    boxlist = np_box_list.BoxList(
+        np.array([[0, 0, 10, 10], [0, 1, 10, 11], [50, 50, 60, 60]],
+                 dtype=float))
+    boxlist.add_field('scores', np.array([0.8, 0.4, 0.6]))
+    boxlist.add_field('labels', np.array([7, 8, 9]))
+    fused = np_box_list_ops.weighted_box_fusion(boxlist, iou_threshold=0.5,
+                                                num_models=2)
+    expected_boxes = np.array([[0, 1. / 3., 10, 10 + 1. / 3.],
+                               [50, 50, 60, 60]], dtype=float)
+    self.assertAllClose(fused.get(), expected_boxes)
+    self.assertAllClose(fused.get_field('scores'), [0.6, 0.3])
+    self.assertAllEqual(fused.get_field('num_fused'), [2, 1])
+    self.assertAllEqual(fused.get_field('labels'), [7, 9])
+
+  def test_adds_box_to_most_overlapping_cluster(self):
+    # The last box overlaps both clusters by more than iou_threshold, the
+    # second one most.
+    boxlist = np_box_list.BoxList(
+        np.array([[0, 0, 10, 10], [0, 6, 10, 16], [0, 4, 10, 14]],
+                 dtype=float))
+    boxlist.add_field('scores', np.array([0.9, 0.8, 0.7]))
+    fused = np_box_list_ops.weighted_box_fusion(boxlist, iou_threshold=0.3)
+    expected_boxes = np.array([[0, 0, 10, 10],
+                               [0, 7.6 / 1.5, 10, 22.6 / 1.5]], dtype=float)
+    self.assertAllClose(fused.get(), expected_boxes)
+    self.assertAllClose(fused.get_field('scores'), [0.9, 0.75])
+    self.assertAllEqual(fused.get_field('num_fused'), [1, 2])
+
+  def test_score_threshold(self):
+    boxlist = np_box_list.BoxList(
+        np.array([[0, 0, 10, 10], [0, 1, 10, 11]], dtype=float))
+    boxlist.add_field('scores', np.array([0.8, 0.1]))
+    fused = np_box_list_ops.weighted_box_fusion(boxlist, score_threshold=0.2)
+    self.assertAllClose(fused.get(), [[0, 0, 10, 10]])
+    self.assertAllClose(fused.get_field('scores'), [0.8])
+
+
 if __name__ == '__main__':
   tf.test.main()
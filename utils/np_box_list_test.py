@@ -131,5 +131,116 @@ class AddExtraFieldTest(tf.test.TestCase):
     self.assertEquals(boxlist.num_boxes(), expected_num_boxes)
 
 
+class LazyFieldsTest(tf.test.TestCase):
+
+  def setUp(self):
+    boxes = np.array([[3.0, 4.0, 6.0, 8.0], [14.0, 14.0, 15.0, 15.0],
+                      [0.0, 0.0, 20.0, 20.0], [1.0, 1.0, 2.0, 2.0]],
+                     dtype=float)
+    self.boxlist = np_box_list.BoxList(boxes, lazy_fields=True)
+    self.scores = np.array([0.5, 0.7, 0.9, 0.1], dtype=float)
+    self.boxlist.add_field('scores', self.scores)
+
+  def test_select_field_is_deferred(self):
+    selection = self.boxlist.select_field('scores', np.array([3, 0]))
+    self.assertTrue(isinstance(selection, np_box_list.FieldSelection))
+    self.assertEqual(selection.shape, (2,))
+    self.assertAllClose(selection.materialize(), [0.1, 0.5])
+
+  def test_get_field_materializes_selection(self):
+    boxlist = np_box_list.BoxList(self.boxlist.get()[[3, 0], :])
+    boxlist.add_field('scores',
+                      self.boxlist.select_field('scores', np.array([3, 0])))
+    self.assertTrue(
+        isinstance(boxlist.data['scores'], np_box_list.FieldSelection))
+    self.assertAllClose(boxlist.get_field('scores'), [0.1, 0.5])
+    self.assertFalse(
+        isinstance(boxlist.data['scores'], np_box_list.FieldSelection))
+
+  def test_evenly_spaced_selection_is_a_view(self):
+    selection = self.boxlist.select_field('scores', np.array([0, 2]))
+    self.assertEqual(selection.indices, slice(0, 4, 2))
+    self.assertTrue(np.shares_memory(selection.materialize(), self.scores))
+
+  def test_chained_selections_are_composed(self):
+    selection = self.boxlist.select_field('scores', np.array([3, 1, 2]))
+    selection = selection.select(np.array([2, 0]))
+    selection = selection.select(slice(None, None, -1))
+    self.assertTrue(selection.source is self.scores)
+    self.assertAllEqual(selection.indices, [3, 2])
+    self.assertAllClose(selection.materialize(), [0.1, 0.9])
+
+  def test_composed_slices_stay_slices(self):
+    selection = self.boxlist.select_field('scores', slice(None, None, -1))
+    selection = selection.select(slice(1, 3))
+    self.assertEqual(selection.indices, slice(2, 0, -1))
+    self.assertAllClose(selection.materialize(), [0.9, 0.7])
+    self.assertEqual(selection.select(slice(5, 6)).shape, (0,))
+
+  def test_indices_to_slice(self):
+    self.assertEqual(np_box_list.indices_to_slice(np.array([], dtype=int)),
+                     slice(0, 0))
+    self.assertEqual(np_box_list.indices_to_slice(np.array([2, 1, 0])),
+                     slice(2, None, -1))
+    self.assertEqual(np_box_list.indices_to_slice(np.array([1, 3, 5])),
+                     slice(1, 7, 2))
+    self.assertAllEqual(np_box_list.indices_to_slice(np.array([0, 1, 3])),
+                        [0, 1, 3])
+
+
+class BoxListBuilderTest(tf.test.TestCase):
+
+  def _boxlist(self, num_boxes, offset):
+    boxes = np.tile(np.array([[0.0, 0.0, 1.0, 1.0]]), [num_boxes, 1]) + offset
+    boxlist = np_box_list.BoxList(boxes)
+    boxlist.add_field('scores', np.arange(num_boxes, dtype=float) + offset)
+    boxlist.add_field('labels', np.ones([num_boxes, 3], dtype=int) * offset)
+    return boxlist
+
+  def test_append_grows_buffers(self):
+    builder = np_box_list.BoxListBuilder(initial_capacity=2)
+    boxlists = [self._boxlist(3, 0), self._boxlist(0, 1), self._boxlist(4, 2)]
+    builder.append(boxlists[0])
+    builder.extend(boxlists[1:])
+    self.assertEqual(builder.num_boxes(), 7)
+    boxlist = builder.finalize()
+    self.assertAllClose(boxlist.get(),
+                        np.vstack([b.get() for b in boxlists]))
+    self.assertSameElements(boxlist.get_extra_fields(), ['scores', 'labels'])
+    self.assertAllClose(
+        boxlist.get_field('scores'),
+        np.concatenate([b.get_field('scores') for b in boxlists]))
+    self.assertAllEqual(
+        boxlist.get_field('labels'),
+        np.concatenate([b.get_field('labels') for b in boxlists]))
+
+  def test_finalize_returns_views(self):
+    builder = np_box_list.BoxListBuilder(initial_capacity=8)
+    builder.append(self._boxlist(3, 0))
+    boxlist = builder.finalize()
+    builder.append(self._boxlist(2, 1))
+    self.assertEqual(boxlist.num_boxes(), 3)
+    self.assertEqual(builder.finalize().num_boxes(), 5)
+    self.assertTrue(np.shares_memory(boxlist.get(), builder.finalize().get()))
+
+  def test_selected_fields(self):
+    builder = np_box_list.BoxListBuilder(fields=['scores'])
+    builder.append(self._boxlist(2, 0))
+    self.assertEqual(builder.finalize().get_extra_fields(), ['scores'])
+
+  def test_invalid_appends(self):
+    builder = np_box_list.BoxListBuilder()
+    with self.assertRaises(ValueError):
+      builder.finalize()
+    builder.append(self._boxlist(2, 0))
+    with self.assertRaises(ValueError):
+      builder.append(np_box_list.BoxList(np.zeros([1, 4])))
+    boxlist = np_box_list.BoxList(np.zeros([1, 4]))
+    boxlist.add_field('scores', np.zeros([1]))
+    boxlist.add_field('labels', np.zeros([1, 2]))
+    with self.assertRaises(ValueError):
+      builder.append(boxlist)
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -31,6 +31,8 @@ from abc import ABCMeta
 from abc import abstractmethod
 import collections
 import logging
+import multiprocessing
+
 import numpy as np
 
 from object_detection.core import standard_fields
@@ -38,6 +40,10 @@ from object_detection.utils import label_map_util
 from object_detection.utils import metrics
 from object_detection.utils import per_image_evaluation
 
+# IOU thresholds of the COCO detection challenge.
+COCO_MATCHING_IOU_THRESHOLDS = (0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85,
+                                0.9, 0.95)
+
 
 class DetectionEvaluator(object):
   """Interface for object detection evalution classes.
@@ -90,6 +96,22 @@ class DetectionEvaluator(object):
     """
     pass
 
+  def add_detections_from_store(self, detection_store,
+                                min_score_threshold=None):
+    """Adds the detections of every image of a detection store.
+
+    Args:
+      detection_store: A detection_store.DetectionStore, or any iterable of
+        (image_id, detections_dict) tuples.
+      min_score_threshold: (optional) if not None, only detections with scores
+        of at least min_score_threshold are added. Requires a DetectionStore.
+    """
+    if min_score_threshold is not None:
+      detection_store = detection_store.iter_detections(
+          min_score_threshold=min_score_threshold)
+    for image_id, detections_dict in detection_store:
+      self.add_single_detected_image_info(image_id, detections_dict)
+
   @abstractmethod
   def evaluate(self):
     """Evaluates detections and returns a dictionary of metrics."""
@@ -131,11 +153,7 @@ class ObjectDetectionEvaluator(DetectionEvaluator):
     self._matching_iou_threshold = matching_iou_threshold
     self._use_weighted_mean_ap = use_weighted_mean_ap
     self._label_id_offset = 1
-    self._evaluation = ObjectDetectionEvaluation(
-        self._num_classes,
-        matching_iou_threshold=self._matching_iou_threshold,
-        use_weighted_mean_ap=self._use_weighted_mean_ap,
-        label_id_offset=self._label_id_offset)
+    self._evaluation = self._create_evaluation()
     self._image_ids = set([])
     self._evaluate_corlocs = evaluate_corlocs
     self._metric_prefix = (metric_prefix + '/') if metric_prefix else ''
@@ -204,8 +222,8 @@ class ObjectDetectionEvaluator(DetectionEvaluator):
           the boxes.
     """
     detection_classes = detections_dict[
-        standard_fields.DetectionResultFields.detection_classes]
-    detection_classes -= self._label_id_offset
+        standard_fields.DetectionResultFields.detection_classes] - (
+            self._label_id_offset)
     self._evaluation.add_single_detected_image_info(
         image_id,
         detections_dict[standard_fields.DetectionResultFields.detection_boxes],
@@ -256,12 +274,15 @@ class ObjectDetectionEvaluator(DetectionEvaluator):
 
   def clear(self):
     """Clears the state to prepare for a fresh evaluation."""
-    self._evaluation = ObjectDetectionEvaluation(
+    self._evaluation = self._create_evaluation()
+    self._image_ids.clear()
+
+  def _create_evaluation(self):
+    return ObjectDetectionEvaluation(
         self._num_classes,
         matching_iou_threshold=self._matching_iou_threshold,
         use_weighted_mean_ap=self._use_weighted_mean_ap,
         label_id_offset=self._label_id_offset)
-    self._image_ids.clear()
 
 
 class PascalDetectionEvaluator(ObjectDetectionEvaluator):
@@ -375,12 +396,122 @@ class OpenImagesDetectionEvaluator(ObjectDetectionEvaluator):
     self._image_ids.update([image_id])
 
 
+class MultiThresholdDetectionEvaluator(ObjectDetectionEvaluator):
+  """A class to evaluate detections at several IOU thresholds in one pass.
+
+  Reports the mean average precision at every threshold and, as in the COCO
+  challenge, its average over the thresholds, by default 0.5:0.05:0.95.
+  Detections are matched to groundtruth with the greedy Pascal rule of
+  ObjectDetectionEvaluation at every threshold, so the averaged metric follows
+  the Pascal definitions of matching and average precision rather than those
+  of the official COCO evaluation.
+  """
+
+  def __init__(self,
+               categories,
+               matching_iou_thresholds=COCO_MATCHING_IOU_THRESHOLDS,
+               metric_prefix=None,
+               use_weighted_mean_ap=False):
+    """Constructor.
+
+    Args:
+      categories: A list of dicts, each of which has the following keys -
+        'id': (required) an integer id uniquely identifying this category.
+        'name': (required) string representing category name e.g., 'cat', 'dog'.
+      matching_iou_thresholds: A sequence of IOU thresholds to use for matching
+        groundtruth boxes to detection boxes.
+      metric_prefix: (optional) string prefix for metric name; if None, no
+        prefix is used.
+      use_weighted_mean_ap: (optional) boolean which determines if the mean
+        average precision is computed directly from the scores and tp_fp_labels
+        of all classes.
+    """
+    self._matching_iou_thresholds = [float(threshold)
+                                     for threshold in matching_iou_thresholds]
+    super(MultiThresholdDetectionEvaluator, self).__init__(
+        categories,
+        matching_iou_threshold=self._matching_iou_thresholds[0],
+        evaluate_corlocs=False,
+        metric_prefix=metric_prefix,
+        use_weighted_mean_ap=use_weighted_mean_ap)
+
+  def _create_evaluation(self):
+    return MultiThresholdObjectDetectionEvaluation(
+        self._num_classes,
+        matching_iou_thresholds=self._matching_iou_thresholds,
+        use_weighted_mean_ap=self._use_weighted_mean_ap,
+        label_id_offset=self._label_id_offset)
+
+  def evaluate(self):
+    """Compute evaluation result.
+
+    Returns:
+      A dictionary of metrics with the following fields -
+
+      1. summary_metrics:
+        'Precision/mAP@[<min_threshold>:<max_threshold>]IOU': mean average
+        precision averaged over the IOU thresholds.
+        'Precision/mAP@<matching_iou_threshold>IOU': mean average precision at
+        every IOU threshold.
+
+      2. per_category_ap: category specific results, averaged over the IOU
+        thresholds, with keys of the form
+        'PerformanceByCategory/AP@[<min_threshold>:<max_threshold>]IOU/category'.
+    """
+    eval_metrics = self._evaluation.evaluate()
+    thresholds_name = '[{}:{}]'.format(min(self._matching_iou_thresholds),
+                                       max(self._matching_iou_thresholds))
+    pascal_metrics = {
+        self._metric_prefix + 'Precision/mAP@{}IOU'.format(thresholds_name):
+            eval_metrics.mean_ap
+    }
+    for threshold, threshold_metrics in zip(
+        self._matching_iou_thresholds, eval_metrics.metrics_per_threshold):
+      pascal_metrics[self._metric_prefix + 'Precision/mAP@{}IOU'.format(
+          threshold)] = threshold_metrics.mean_ap
+    category_index = label_map_util.create_category_index(self._categories)
+    for idx in range(eval_metrics.average_precisions.size):
+      if idx + self._label_id_offset in category_index:
+        display_name = (
+            self._metric_prefix + 'PerformanceByCategory/AP@{}IOU/{}'.format(
+                thresholds_name,
+                category_index[idx + self._label_id_offset]['name']))
+        pascal_metrics[display_name] = eval_metrics.average_precisions[idx]
+    return pascal_metrics
+
+
 ObjectDetectionEvalMetrics = collections.namedtuple(
     'ObjectDetectionEvalMetrics', [
         'average_precisions', 'mean_ap', 'precisions', 'recalls', 'corlocs',
         'mean_corloc'
     ])
 
+# Mergeable accumulated state of an ObjectDetectionEvaluation. Scores and
+# tp_fp_labels hold one array per class.
+ObjectDetectionEvalState = collections.namedtuple(
+    'ObjectDetectionEvalState', [
+        'num_gt_instances_per_class', 'num_gt_imgs_per_class',
+        'num_images_correctly_detected_per_class', 'scores_per_class',
+        'tp_fp_labels_per_class', 'detection_keys'
+    ])
+
+# Mergeable accumulated state of a StreamingObjectDetectionEvaluation. The
+# histograms have shape [num_classes, num_score_bins].
+StreamingObjectDetectionEvalState = collections.namedtuple(
+    'StreamingObjectDetectionEvalState', [
+        'num_gt_instances_per_class', 'num_gt_imgs_per_class',
+        'num_images_correctly_detected_per_class', 'tp_histogram_per_class',
+        'fp_histogram_per_class', 'score_range', 'detection_keys'
+    ])
+
+# Metrics of a MultiThresholdObjectDetectionEvaluation: the per-class average
+# precisions and the mean average precision averaged over the IOU thresholds,
+# and the ObjectDetectionEvalMetrics of every threshold.
+MultiThresholdObjectDetectionEvalMetrics = collections.namedtuple(
+    'MultiThresholdObjectDetectionEvalMetrics', [
+        'average_precisions', 'mean_ap', 'metrics_per_threshold'
+    ])
+
 
 class ObjectDetectionEvaluation(object):
   """Internal implementation of Pascal object detection metrics."""
@@ -391,7 +522,26 @@ class ObjectDetectionEvaluation(object):
                nms_iou_threshold=1.0,
                nms_max_output_boxes=10000,
                use_weighted_mean_ap=False,
-               label_id_offset=0):
+               label_id_offset=0,
+               incremental=False):
+    """Constructor.
+
+    Args:
+      num_groundtruth_classes: Number of ground truth object classes.
+      matching_iou_threshold: IOU threshold to use for matching groundtruth
+        boxes to detection boxes.
+      nms_iou_threshold: IOU threshold used in Non Maximum Suppression.
+      nms_max_output_boxes: Number of maximum output boxes in NMS.
+      use_weighted_mean_ap: boolean which determines if the mean average
+        precision is computed directly from the scores and tp_fp_labels of all
+        classes.
+      label_id_offset: Offset of the class labels, used in logs.
+      incremental: If True, evaluate() keeps the detections of every class
+        sorted by score between calls, only merges the detections added since
+        the previous call and only recomputes the average precision of the
+        classes that changed. Detections with tied scores are then ranked in
+        insertion order.
+    """
     self.per_image_eval = per_image_evaluation.PerImageEvaluation(
         num_groundtruth_classes, matching_iou_threshold, nms_iou_threshold,
         nms_max_output_boxes)
@@ -416,9 +566,11 @@ class ObjectDetectionEvaluation(object):
     self.corloc_per_class = np.ones(self.num_class, dtype=float)
 
     self.use_weighted_mean_ap = use_weighted_mean_ap
+    self.incremental = incremental
+    self._clear_incremental_state()
 
   def clear_detections(self):
-    self.detection_keys = {}
+    self.detection_keys = set()
     self.scores_per_class = [[] for _ in range(self.num_class)]
     self.tp_fp_labels_per_class = [[] for _ in range(self.num_class)]
     self.num_images_correctly_detected_per_class = np.zeros(self.num_class)
@@ -426,6 +578,14 @@ class ObjectDetectionEvaluation(object):
     self.precisions_per_class = []
     self.recalls_per_class = []
     self.corloc_per_class = np.ones(self.num_class, dtype=float)
+    self._clear_incremental_state()
+
+  def _clear_incremental_state(self):
+    # Number of sorted arrays at the head of scores_per_class (0 or 1) and the
+    # (num_gt_instances, precision, recall, average_precision) computed from
+    # them, per class.
+    self._num_sorted_arrays_per_class = np.zeros(self.num_class, dtype=int)
+    self._class_results = [None] * self.num_class
 
   def add_single_ground_truth_image_info(self,
                                          image_key,
@@ -517,12 +677,35 @@ class ObjectDetectionEvaluation(object):
       groundtruth_class_labels = np.array([], dtype=int)
       groundtruth_is_difficult_list = np.array([], dtype=bool)
       groundtruth_is_group_of_list = np.array([], dtype=bool)
+    self._evaluate_image(detected_boxes, detected_scores,
+                         detected_class_labels, groundtruth_boxes,
+                         groundtruth_class_labels,
+                         groundtruth_is_difficult_list,
+                         groundtruth_is_group_of_list)
+
+  def _evaluate_image(self, detected_boxes, detected_scores,
+                      detected_class_labels, groundtruth_boxes,
+                      groundtruth_class_labels, groundtruth_is_difficult_list,
+                      groundtruth_is_group_of_list):
+    """Matches the detections of a single image and accumulates the results."""
     scores, tp_fp_labels, is_class_correctly_detected_in_image = (
         self.per_image_eval.compute_object_detection_metrics(
             detected_boxes, detected_scores, detected_class_labels,
             groundtruth_boxes, groundtruth_class_labels,
             groundtruth_is_difficult_list, groundtruth_is_group_of_list))
+    self._add_image_results(scores, tp_fp_labels,
+                            is_class_correctly_detected_in_image)
 
+  def _add_image_results(self, scores, tp_fp_labels,
+                         is_class_correctly_detected_in_image):
+    """Accumulates the per-class results of a single image.
+
+    Args:
+      scores: A list of C float numpy arrays of detection scores.
+      tp_fp_labels: A list of C boolean numpy arrays of true positive labels.
+      is_class_correctly_detected_in_image: an integer numpy array of shape
+        [C].
+    """
     for i in range(self.num_class):
       if scores[i].shape[0] > 0:
         self.scores_per_class[i].append(scores[i])
@@ -530,9 +713,82 @@ class ObjectDetectionEvaluation(object):
     (self.num_images_correctly_detected_per_class
     ) += is_class_correctly_detected_in_image
 
+  def add_ground_truth_batch(self,
+                             image_keys,
+                             groundtruth_boxes,
+                             groundtruth_class_labels,
+                             offsets,
+                             groundtruth_is_difficult_list=None,
+                             groundtruth_is_group_of_list=None):
+    """Adds groundtruth for many images packed in flat arrays.
+
+    Equivalent to calling add_single_ground_truth_image_info for every image,
+    but the ground truth statistics are updated in a single call. The boxes of
+    image i are the rows offsets[i]:offsets[i + 1] of the packed arrays, as in
+    np_box_list.BatchedBoxList, and are stored as views of them.
+
+    Args:
+      image_keys: A list of N unique string/integer identifiers for the images.
+      groundtruth_boxes: float32 numpy array of shape [num_boxes, 4]
+        containing the groundtruth boxes of all images, of the format
+        [ymin, xmin, ymax, xmax] in absolute image coordinates.
+      groundtruth_class_labels: integer numpy array of shape [num_boxes]
+        containing 0-indexed groundtruth classes for the boxes.
+      offsets: integer numpy array of shape [N + 1] with offsets[0] == 0,
+        offsets[-1] == num_boxes and non-decreasing values.
+      groundtruth_is_difficult_list: A length num_boxes numpy boolean array
+        denoting whether a ground truth box is a difficult instance or not. By
+        default no boxes are difficult.
+      groundtruth_is_group_of_list: A length num_boxes numpy boolean array
+        denoting whether a ground truth box is a group-of box or not. By
+        default no boxes are groups-of.
+
+    Raises:
+      ValueError: if offsets do not match image_keys and the packed arrays.
+    """
+    offsets = np.asarray(offsets)
+    num_boxes = groundtruth_boxes.shape[0]
+    if (offsets.shape != (len(image_keys) + 1,) or offsets[0] != 0 or
+        offsets[-1] != num_boxes or np.any(np.diff(offsets) < 0)):
+      raise ValueError('offsets must be non-decreasing from 0 to num_boxes '
+                       'with one more entry than image_keys.')
+    if groundtruth_is_difficult_list is None:
+      groundtruth_is_difficult_list = np.zeros(num_boxes, dtype=bool)
+    if groundtruth_is_group_of_list is None:
+      groundtruth_is_group_of_list = np.zeros(num_boxes, dtype=bool)
+    groundtruth_is_difficult_list = groundtruth_is_difficult_list.astype(
+        dtype=bool)
+    groundtruth_is_group_of_list = groundtruth_is_group_of_list.astype(
+        dtype=bool)
+
+    is_added = np.zeros(len(image_keys), dtype=bool)
+    for image_index, image_key in enumerate(image_keys):
+      if image_key in self.groundtruth_boxes:
+        logging.warn(
+            'image %s has already been added to the ground truth database.',
+            image_key)
+        continue
+      is_added[image_index] = True
+      rows = slice(offsets[image_index], offsets[image_index + 1])
+      self.groundtruth_boxes[image_key] = groundtruth_boxes[rows]
+      self.groundtruth_class_labels[image_key] = groundtruth_class_labels[rows]
+      self.groundtruth_is_difficult_list[
+          image_key] = groundtruth_is_difficult_list[rows]
+      self.groundtruth_is_group_of_list[
+          image_key] = groundtruth_is_group_of_list[rows]
+
+    image_indices = np.repeat(np.arange(len(image_keys)), np.diff(offsets))
+    is_box_added = is_added[image_indices]
+    self._update_ground_truth_statistics(
+        groundtruth_class_labels[is_box_added],
+        groundtruth_is_difficult_list[is_box_added],
+        groundtruth_is_group_of_list[is_box_added],
+        image_indices[is_box_added])
+
   def _update_ground_truth_statistics(self, groundtruth_class_labels,
                                       groundtruth_is_difficult_list,
-                                      groundtruth_is_group_of_list):
+                                      groundtruth_is_group_of_list,
+                                      image_indices=None):
     """Update grouth truth statitistics.
 
     1. Difficult boxes are ignored when counting the number of ground truth
@@ -547,14 +803,25 @@ class ObjectDetectionEvaluation(object):
           whether a ground truth box is a difficult instance or not
       groundtruth_is_group_of_list: A boolean numpy array of length M denoting
           whether a ground truth box is a group-of box or not
+      image_indices: An optional non-negative integer numpy array of length M
+          with the image of every box. By default all boxes belong to a single
+          image.
     """
-    for class_index in range(self.num_class):
-      num_gt_instances = np.sum(groundtruth_class_labels[
-          ~groundtruth_is_difficult_list
-          & ~groundtruth_is_group_of_list] == class_index)
-      self.num_gt_instances_per_class[class_index] += num_gt_instances
-      if np.any(groundtruth_class_labels == class_index):
-        self.num_gt_imgs_per_class[class_index] += 1
+    is_valid_class = ((groundtruth_class_labels >= 0) &
+                      (groundtruth_class_labels < self.num_class))
+    is_counted = (is_valid_class & ~groundtruth_is_difficult_list &
+                  ~groundtruth_is_group_of_list)
+    self.num_gt_instances_per_class += np.bincount(
+        groundtruth_class_labels[is_counted].astype(int),
+        minlength=self.num_class)
+    class_labels = groundtruth_class_labels[is_valid_class].astype(int)
+    if image_indices is None:
+      self.num_gt_imgs_per_class[np.unique(class_labels)] += 1
+    else:
+      image_classes = np.unique(
+          image_indices[is_valid_class] * self.num_class + class_labels)
+      self.num_gt_imgs_per_class += np.bincount(
+          image_classes % self.num_class, minlength=self.num_class)
 
   def evaluate(self):
     """Compute evaluation result.
@@ -576,6 +843,82 @@ class ObjectDetectionEvaluation(object):
           np.squeeze(np.argwhere(self.num_gt_instances_per_class == 0)) +
           self.label_id_offset)
 
+    self.precisions_per_class = []
+    self.recalls_per_class = []
+    if self.incremental:
+      mean_ap = self._evaluate_incrementally()
+    else:
+      mean_ap = self._evaluate_from_scratch()
+
+    self.corloc_per_class = metrics.compute_cor_loc(
+        self.num_gt_imgs_per_class,
+        self.num_images_correctly_detected_per_class)
+    mean_corloc = np.nanmean(self.corloc_per_class)
+    return ObjectDetectionEvalMetrics(
+        self.average_precision_per_class, mean_ap, self.precisions_per_class,
+        self.recalls_per_class, self.corloc_per_class, mean_corloc)
+
+  def _evaluate_incrementally(self):
+    """Updates the cached per-class results and returns the mean AP."""
+    weighted_results = []
+    for class_index in range(self.num_class):
+      num_gt_instances = self.num_gt_instances_per_class[class_index]
+      if num_gt_instances == 0:
+        continue
+      scores_list = self.scores_per_class[class_index]
+      tp_fp_labels_list = self.tp_fp_labels_per_class[class_index]
+      is_updated = (len(scores_list) !=
+                    self._num_sorted_arrays_per_class[class_index])
+      if is_updated:
+        # The sorted head and the new arrays form runs that the stable merge
+        # sort combines in close to linear time.
+        scores = np.concatenate(scores_list)
+        tp_fp_labels = np.concatenate(tp_fp_labels_list)
+        order = np.argsort(-scores, kind='mergesort')
+        scores_list[:] = [scores[order]]
+        tp_fp_labels_list[:] = [tp_fp_labels[order]]
+        self._num_sorted_arrays_per_class[class_index] = 1
+      if scores_list:
+        scores, tp_fp_labels = scores_list[0], tp_fp_labels_list[0]
+      else:
+        scores = np.array([], dtype=float)
+        tp_fp_labels = np.array([], dtype=bool)
+      class_results = self._class_results[class_index]
+      if (is_updated or class_results is None or
+          class_results[0] != num_gt_instances):
+        precision, recall = metrics.compute_precision_recall(
+            scores, tp_fp_labels, num_gt_instances, scores_sorted=True,
+            validate=False)
+        class_results = (num_gt_instances, precision, recall,
+                         metrics.compute_average_precision(
+                             precision, recall, validate=False))
+        self._class_results[class_index] = class_results
+      _, precision, recall, average_precision = class_results
+      self.precisions_per_class.append(precision)
+      self.recalls_per_class.append(recall)
+      self.average_precision_per_class[class_index] = average_precision
+      if self.use_weighted_mean_ap and tp_fp_labels.size:
+        weighted_results.append((scores, tp_fp_labels))
+
+    if not self.use_weighted_mean_ap:
+      return np.nanmean(self.average_precision_per_class)
+    if weighted_results:
+      all_scores = np.concatenate([scores for scores, _ in weighted_results])
+      all_tp_fp_labels = np.concatenate(
+          [tp_fp_labels for _, tp_fp_labels in weighted_results])
+      order = np.argsort(-all_scores, kind='mergesort')
+      all_scores = all_scores[order]
+      all_tp_fp_labels = all_tp_fp_labels[order]
+    else:
+      all_scores = np.array([], dtype=float)
+      all_tp_fp_labels = np.array([], dtype=bool)
+    precision, recall = metrics.compute_precision_recall(
+        all_scores, all_tp_fp_labels, np.sum(self.num_gt_instances_per_class),
+        scores_sorted=True, validate=False)
+    return metrics.compute_average_precision(precision, recall, validate=False)
+
+  def _evaluate_from_scratch(self):
+    """Computes the per-class results from all detections; returns mean AP."""
     if self.use_weighted_mean_ap:
       all_scores = np.array([], dtype=float)
       all_tp_fp_labels = np.array([], dtype=bool)
@@ -596,21 +939,570 @@ class ObjectDetectionEvaluation(object):
           scores, tp_fp_labels, self.num_gt_instances_per_class[class_index])
       self.precisions_per_class.append(precision)
       self.recalls_per_class.append(recall)
-      average_precision = metrics.compute_average_precision(precision, recall)
+      average_precision = metrics.compute_average_precision(
+          precision, recall, validate=False)
       self.average_precision_per_class[class_index] = average_precision
 
+    if self.use_weighted_mean_ap:
+      num_gt_instances = np.sum(self.num_gt_instances_per_class)
+      precision, recall = metrics.compute_precision_recall(
+          all_scores, all_tp_fp_labels, num_gt_instances)
+      return metrics.compute_average_precision(precision, recall,
+                                               validate=False)
+    return np.nanmean(self.average_precision_per_class)
+
+  def get_state(self):
+    """Returns the accumulated statistics needed by evaluate().
+
+    Returns:
+      An ObjectDetectionEvalState holding copies of the ground truth statistics
+      and of the scores and tp_fp_labels of every class.
+    """
+    scores_per_class = []
+    tp_fp_labels_per_class = []
+    for class_index in range(self.num_class):
+      if not self.scores_per_class[class_index]:
+        scores_per_class.append(np.array([], dtype=float))
+        tp_fp_labels_per_class.append(np.array([], dtype=bool))
+      else:
+        scores_per_class.append(
+            np.concatenate(self.scores_per_class[class_index]))
+        tp_fp_labels_per_class.append(
+            np.concatenate(self.tp_fp_labels_per_class[class_index]))
+    return ObjectDetectionEvalState(
+        self.num_gt_instances_per_class.copy(),
+        self.num_gt_imgs_per_class.copy(),
+        self.num_images_correctly_detected_per_class.copy(),
+        scores_per_class, tp_fp_labels_per_class, set(self.detection_keys))
+
+  def merge(self, state):
+    """Merges the statistics of another evaluation into this one.
+
+    Every image should have been added to a single evaluation, both for
+    ground truth and detections, since the statistics of the ground truth are
+    summed.
+
+    Args:
+      state: An ObjectDetectionEvalState, e.g. returned by get_state() or
+        load_state(), or an ObjectDetectionEvaluation.
+
+    Raises:
+      ValueError: if the state cannot be merged into this evaluation, e.g. if
+        the number of classes differs or if an image has detections in both
+        evaluations.
+    """
+    if isinstance(state, ObjectDetectionEvaluation):
+      state = state.get_state()
+    self._check_mergeable(state)
+    self.num_gt_instances_per_class += state.num_gt_instances_per_class
+    self.num_gt_imgs_per_class += state.num_gt_imgs_per_class
+    self._merge_detections(state)
+
+  def _check_mergeable(self, state):
+    """Raises a ValueError if state cannot be merged into this evaluation."""
+    if not isinstance(state, ObjectDetectionEvalState):
+      raise ValueError('Cannot merge a %s into an ObjectDetectionEvaluation.' %
+                       type(state).__name__)
+    if len(state.num_gt_instances_per_class) != self.num_class:
+      raise ValueError('Cannot merge an evaluation of %d classes into one of '
+                       '%d classes.' % (len(state.num_gt_instances_per_class),
+                                        self.num_class))
+    duplicate_keys = self.detection_keys & state.detection_keys
+    if duplicate_keys:
+      raise ValueError('Images were evaluated more than once: %s' %
+                       sorted(duplicate_keys, key=str)[:10])
+
+  def _merge_detections(self, state):
+    """Merges the detection statistics of a state checked by merge()."""
+    self.num_images_correctly_detected_per_class += (
+        state.num_images_correctly_detected_per_class)
+    for class_index in range(self.num_class):
+      if state.scores_per_class[class_index].shape[0] > 0:
+        self.scores_per_class[class_index].append(
+            state.scores_per_class[class_index])
+        self.tp_fp_labels_per_class[class_index].append(
+            state.tp_fp_labels_per_class[class_index])
+    self.detection_keys.update(state.detection_keys)
+
+
+class StreamingObjectDetectionEvaluation(ObjectDetectionEvaluation):
+  """ObjectDetectionEvaluation with memory bounded by score histograms.
+
+  Instead of keeping every detection score and tp/fp label, true and false
+  positive counts are accumulated in num_score_bins equally sized score bins
+  per class, and the ground truth of an image is released once its
+  detections are added. Memory is O(num_classes * num_score_bins) however
+  many images are evaluated, but every image must be added once, ground truth
+  first.
+
+  Precision and recall are computed once per non-empty bin, as if all the
+  detections of a bin were tied. Since bins are ordered by score, these points
+  are a subset of the points of the exact precision recall curve, so for every
+  class
+
+    0 <= AP_exact - AP <= sum_b dr_b * (max_{b' >= b} P_max_b' -
+                                        max_{b' >= b} P_b')
+
+  where bins are indexed by decreasing score, dr_b is the recall gained in bin
+  b, P_b is the precision after bin b and P_max_b the precision after bin b had
+  its true positives been ranked before its false positives. evaluate() stores
+  this bound in average_precision_error_bound_per_class; it vanishes when no
+  bin mixes true and false positives, e.g. when bins are narrower than the gap
+  between distinct scores.
+  """
+
+  def __init__(self,
+               num_groundtruth_classes,
+               num_score_bins=1000,
+               score_range=(0.0, 1.0),
+               **kwargs):
+    """Constructor.
+
+    Args:
+      num_groundtruth_classes: Number of ground truth object classes.
+      num_score_bins: Number of score bins per class.
+      score_range: (min_score, max_score) tuple covered by the bins. Scores
+        outside of the range are counted in the first or last bin.
+      **kwargs: Other arguments of the ObjectDetectionEvaluation constructor.
+
+    Raises:
+      ValueError: if num_score_bins is not positive or score_range is empty.
+    """
+    if num_score_bins < 1:
+      raise ValueError('num_score_bins must be positive.')
+    if score_range[1] <= score_range[0]:
+      raise ValueError('score_range must be a (min_score, max_score) tuple.')
+    super(StreamingObjectDetectionEvaluation, self).__init__(
+        num_groundtruth_classes, **kwargs)
+    self.num_score_bins = num_score_bins
+    self.score_range = score_range
+    self.tp_histogram_per_class = np.zeros(
+        [self.num_class, num_score_bins], dtype=np.int64)
+    self.fp_histogram_per_class = np.zeros(
+        [self.num_class, num_score_bins], dtype=np.int64)
+    self.average_precision_error_bound_per_class = np.zeros(self.num_class)
+
+  def clear_detections(self):
+    super(StreamingObjectDetectionEvaluation, self).clear_detections()
+    self.tp_histogram_per_class.fill(0)
+    self.fp_histogram_per_class.fill(0)
+    self.average_precision_error_bound_per_class = np.zeros(self.num_class)
+
+  def add_single_detected_image_info(self, image_key, detected_boxes,
+                                     detected_scores, detected_class_labels):
+    """Adds detections for a single image and releases its ground truth.
+
+    Args:
+      image_key: A unique string/integer identifier for the image.
+      detected_boxes: float32 numpy array of shape [num_boxes, 4]
+        containing `num_boxes` detection boxes of the format
+        [ymin, xmin, ymax, xmax] in absolute image coordinates.
+      detected_scores: float32 numpy array of shape [num_boxes] containing
+        detection scores for the boxes.
+      detected_class_labels: integer numpy array of shape [num_boxes] containing
+        0-indexed detection classes for the boxes.
+    """
+    super(StreamingObjectDetectionEvaluation,
+          self).add_single_detected_image_info(image_key, detected_boxes,
+                                               detected_scores,
+                                               detected_class_labels)
+    self.detection_keys.discard(image_key)
+    for groundtruth in (self.groundtruth_boxes, self.groundtruth_class_labels,
+                        self.groundtruth_is_difficult_list,
+                        self.groundtruth_is_group_of_list):
+      groundtruth.pop(image_key, None)
+
+  def _add_image_results(self, scores, tp_fp_labels,
+                         is_class_correctly_detected_in_image):
+    num_detections = [class_scores.shape[0] for class_scores in scores]
+    if sum(num_detections):
+      class_indices = np.repeat(np.arange(self.num_class), num_detections)
+      score_bins = self._score_bins(np.concatenate(scores))
+      tp_fp_labels = np.concatenate(tp_fp_labels)
+      np.add.at(self.tp_histogram_per_class,
+                (class_indices[tp_fp_labels], score_bins[tp_fp_labels]), 1)
+      np.add.at(self.fp_histogram_per_class,
+                (class_indices[~tp_fp_labels], score_bins[~tp_fp_labels]), 1)
+    self.num_images_correctly_detected_per_class += (
+        is_class_correctly_detected_in_image)
+
+  def _score_bins(self, scores):
+    min_score, max_score = self.score_range
+    score_bins = np.floor((scores - min_score) / (max_score - min_score) *
+                          self.num_score_bins)
+    return np.clip(score_bins, 0, self.num_score_bins - 1).astype(int)
+
+  def get_state(self):
+    """Returns the accumulated statistics needed by evaluate().
+
+    Returns:
+      A StreamingObjectDetectionEvalState holding copies of the ground truth
+      statistics and of the score histograms.
+    """
+    return StreamingObjectDetectionEvalState(
+        self.num_gt_instances_per_class.copy(),
+        self.num_gt_imgs_per_class.copy(),
+        self.num_images_correctly_detected_per_class.copy(),
+        self.tp_histogram_per_class.copy(), self.fp_histogram_per_class.copy(),
+        tuple(self.score_range), set())
+
+  def _check_mergeable(self, state):
+    """Raises a ValueError if state cannot be merged into this evaluation.
+
+    Both the histograms of another streaming evaluation, with the same bins,
+    and the scores of an ObjectDetectionEvaluation can be merged.
+    """
+    if not isinstance(state, StreamingObjectDetectionEvalState):
+      super(StreamingObjectDetectionEvaluation, self)._check_mergeable(state)
+      return
+    if (state.tp_histogram_per_class.shape !=
+        self.tp_histogram_per_class.shape or
+        tuple(state.score_range) != tuple(self.score_range)):
+      raise ValueError(
+          'Cannot merge histograms of shape %s over %s into histograms of '
+          'shape %s over %s.' % (state.tp_histogram_per_class.shape,
+                                 tuple(state.score_range),
+                                 self.tp_histogram_per_class.shape,
+                                 tuple(self.score_range)))
+
+  def _merge_detections(self, state):
+    if isinstance(state, StreamingObjectDetectionEvalState):
+      self.tp_histogram_per_class += state.tp_histogram_per_class
+      self.fp_histogram_per_class += state.fp_histogram_per_class
+      self.num_images_correctly_detected_per_class += (
+          state.num_images_correctly_detected_per_class)
+    else:
+      # Image keys are not kept, as for the images added to this evaluation.
+      self._add_image_results(state.scores_per_class,
+                              state.tp_fp_labels_per_class,
+                              state.num_images_correctly_detected_per_class)
+
+  def evaluate(self):
+    """Compute evaluation result from the score histograms.
+
+    Returns:
+      A named tuple with the same fields as ObjectDetectionEvaluation.evaluate.
+      Precisions and recalls have one entry per non-empty score bin.
+    """
+    if (self.num_gt_instances_per_class == 0).any():
+      logging.warn(
+          'The following classes have no ground truth examples: %s',
+          np.squeeze(np.argwhere(self.num_gt_instances_per_class == 0)) +
+          self.label_id_offset)
+
+    self.precisions_per_class = []
+    self.recalls_per_class = []
+    for class_index in range(self.num_class):
+      if self.num_gt_instances_per_class[class_index] == 0:
+        continue
+      precision, recall, error_bound = _compute_histogram_precision_recall(
+          self.tp_histogram_per_class[class_index],
+          self.fp_histogram_per_class[class_index],
+          self.num_gt_instances_per_class[class_index])
+      self.precisions_per_class.append(precision)
+      self.recalls_per_class.append(recall)
+      self.average_precision_per_class[class_index] = (
+          metrics.compute_average_precision(precision, recall, validate=False))
+      self.average_precision_error_bound_per_class[class_index] = error_bound
+
     self.corloc_per_class = metrics.compute_cor_loc(
         self.num_gt_imgs_per_class,
         self.num_images_correctly_detected_per_class)
 
     if self.use_weighted_mean_ap:
-      num_gt_instances = np.sum(self.num_gt_instances_per_class)
-      precision, recall = metrics.compute_precision_recall(
-          all_scores, all_tp_fp_labels, num_gt_instances)
-      mean_ap = metrics.compute_average_precision(precision, recall)
+      has_gt = self.num_gt_instances_per_class > 0
+      precision, recall, _ = _compute_histogram_precision_recall(
+          np.sum(self.tp_histogram_per_class[has_gt], axis=0),
+          np.sum(self.fp_histogram_per_class[has_gt], axis=0),
+          np.sum(self.num_gt_instances_per_class))
+      mean_ap = metrics.compute_average_precision(
+          precision, recall, validate=False)
     else:
       mean_ap = np.nanmean(self.average_precision_per_class)
     mean_corloc = np.nanmean(self.corloc_per_class)
     return ObjectDetectionEvalMetrics(
         self.average_precision_per_class, mean_ap, self.precisions_per_class,
         self.recalls_per_class, self.corloc_per_class, mean_corloc)
+
+
+class MultiThresholdObjectDetectionEvaluation(ObjectDetectionEvaluation):
+  """ObjectDetectionEvaluation at several IOU thresholds in a single pass.
+
+  The detections of every image are matched once for all thresholds: the IOU
+  matrix and the best matching groundtruth box of every detection do not
+  depend on the threshold, so only the threshold comparison and the greedy
+  true positive selection are repeated, vectorized over the thresholds. The
+  scores and tp_fp_labels of every threshold are accumulated in an
+  ObjectDetectionEvaluation of threshold_evaluations, which share the ground
+  truth statistics of this evaluation.
+  """
+
+  def __init__(self,
+               num_groundtruth_classes,
+               matching_iou_thresholds=COCO_MATCHING_IOU_THRESHOLDS,
+               **kwargs):
+    """Constructor.
+
+    Args:
+      num_groundtruth_classes: Number of ground truth object classes.
+      matching_iou_thresholds: A sequence of IOU thresholds to use for matching
+        groundtruth boxes to detection boxes.
+      **kwargs: Other arguments of the ObjectDetectionEvaluation constructor,
+        except matching_iou_threshold.
+
+    Raises:
+      ValueError: if matching_iou_thresholds is empty.
+    """
+    if not len(matching_iou_thresholds):
+      raise ValueError('matching_iou_thresholds must not be empty.')
+    self.matching_iou_thresholds = np.asarray(matching_iou_thresholds,
+                                              dtype=float)
+    super(MultiThresholdObjectDetectionEvaluation, self).__init__(
+        num_groundtruth_classes,
+        matching_iou_threshold=self.matching_iou_thresholds[0], **kwargs)
+    self.threshold_evaluations = [
+        ObjectDetectionEvaluation(
+            num_groundtruth_classes, matching_iou_threshold=threshold,
+            **kwargs) for threshold in self.matching_iou_thresholds
+    ]
+
+  def clear_detections(self):
+    super(MultiThresholdObjectDetectionEvaluation, self).clear_detections()
+    for evaluation in self.threshold_evaluations:
+      evaluation.clear_detections()
+
+  def _evaluate_image(self, detected_boxes, detected_scores,
+                      detected_class_labels, groundtruth_boxes,
+                      groundtruth_class_labels, groundtruth_is_difficult_list,
+                      groundtruth_is_group_of_list):
+    scores, tp_fp_labels, is_class_correctly_detected_in_image = (
+        self.per_image_eval.compute_object_detection_metrics_at_thresholds(
+            detected_boxes, detected_scores, detected_class_labels,
+            groundtruth_boxes, groundtruth_class_labels,
+            groundtruth_is_difficult_list, groundtruth_is_group_of_list,
+            self.matching_iou_thresholds))
+    for threshold_index, evaluation in enumerate(self.threshold_evaluations):
+      evaluation._add_image_results(  # pylint: disable=protected-access
+          scores[threshold_index], tp_fp_labels[threshold_index],
+          is_class_correctly_detected_in_image[threshold_index])
+
+  def get_state(self):
+    """Returns the accumulated statistics of every IOU threshold.
+
+    Returns:
+      A list with the ObjectDetectionEvalState of every evaluation of
+      threshold_evaluations, holding the ground truth statistics and the
+      detection keys of this evaluation.
+    """
+    return [
+        evaluation.get_state()._replace(
+            num_gt_instances_per_class=self.num_gt_instances_per_class.copy(),
+            num_gt_imgs_per_class=self.num_gt_imgs_per_class.copy(),
+            detection_keys=set(self.detection_keys))
+        for evaluation in self.threshold_evaluations
+    ]
+
+  def merge(self, state):
+    """Merges the statistics of another multi-threshold evaluation.
+
+    Args:
+      state: A list of ObjectDetectionEvalState returned by get_state(), one
+        per IOU threshold, or a MultiThresholdObjectDetectionEvaluation.
+
+    Raises:
+      ValueError: if the IOU thresholds differ, or for the reasons of
+        ObjectDetectionEvaluation.merge.
+    """
+    if isinstance(state, MultiThresholdObjectDetectionEvaluation):
+      if not np.array_equal(state.matching_iou_thresholds,
+                            self.matching_iou_thresholds):
+        raise ValueError('Cannot merge an evaluation at IOU thresholds %s into '
+                         'one at IOU thresholds %s.' %
+                         (state.matching_iou_thresholds,
+                          self.matching_iou_thresholds))
+      state = state.get_state()
+    if (not isinstance(state, (list, tuple)) or
+        len(state) != len(self.threshold_evaluations)):
+      raise ValueError('Expected a list of the states of %d IOU thresholds.' %
+                       len(self.threshold_evaluations))
+    for threshold_state in state:
+      self._check_mergeable(threshold_state)
+    self.num_gt_instances_per_class += state[0].num_gt_instances_per_class
+    self.num_gt_imgs_per_class += state[0].num_gt_imgs_per_class
+    self.detection_keys.update(state[0].detection_keys)
+    for evaluation, threshold_state in zip(self.threshold_evaluations, state):
+      # Image keys are only kept by this evaluation.
+      evaluation._merge_detections(  # pylint: disable=protected-access
+          threshold_state._replace(detection_keys=set()))
+
+  def evaluate(self):
+    """Compute evaluation result at every IOU threshold.
+
+    Returns:
+      A named tuple with the following fields -
+        average_precisions: float numpy array of average precision for each
+            class, averaged over the IOU thresholds.
+        mean_ap: mean average precision, averaged over the IOU thresholds.
+        metrics_per_threshold: list of the ObjectDetectionEvalMetrics of every
+            IOU threshold.
+    """
+    metrics_per_threshold = []
+    for evaluation in self.threshold_evaluations:
+      evaluation.num_gt_instances_per_class = self.num_gt_instances_per_class
+      evaluation.num_gt_imgs_per_class = self.num_gt_imgs_per_class
+      metrics_per_threshold.append(evaluation.evaluate())
+    self.average_precision_per_class = np.mean(
+        [threshold_metrics.average_precisions
+         for threshold_metrics in metrics_per_threshold], axis=0)
+    mean_ap = np.mean([threshold_metrics.mean_ap
+                       for threshold_metrics in metrics_per_threshold])
+    return MultiThresholdObjectDetectionEvalMetrics(
+        self.average_precision_per_class, mean_ap, metrics_per_threshold)
+
+
+def _compute_histogram_precision_recall(tp_histogram, fp_histogram, num_gt):
+  """Computes precision, recall and the AP error bound from score histograms.
+
+  Args:
+    tp_histogram: An integer numpy array of true positive counts per score bin,
+      in increasing score order.
+    fp_histogram: An integer numpy array of false positive counts per score
+      bin.
+    num_gt: Number of ground truth instances.
+
+  Returns:
+    precision: A float numpy array with the precision after every non-empty bin,
+      in decreasing score order.
+    recall: A float numpy array with the matching recalls.
+    error_bound: Upper bound of the average precision lost by ignoring the
+      order of the detections within bins.
+  """
+  tp_counts = tp_histogram[::-1]
+  fp_counts = fp_histogram[::-1]
+  non_empty = (tp_counts + fp_counts) > 0
+  cum_true_positives = np.cumsum(tp_counts)[non_empty]
+  cum_false_positives = np.cumsum(fp_counts)[non_empty]
+  tp_counts = tp_counts[non_empty]
+  precision = cum_true_positives.astype(float) / (
+      cum_true_positives + cum_false_positives)
+  recall = cum_true_positives.astype(float) / num_gt
+
+  # Precision reached within a bin when its true positives are ranked first.
+  max_precision_denominator = (cum_true_positives + cum_false_positives -
+                               fp_counts[non_empty])
+  max_precision = np.where(
+      max_precision_denominator > 0,
+      cum_true_positives / np.maximum(max_precision_denominator, 1),
+      precision)
+  precision_gap = (np.maximum.accumulate(max_precision[::-1]) -
+                   np.maximum.accumulate(precision[::-1]))[::-1]
+  error_bound = np.sum(tp_counts.astype(float) / num_gt * precision_gap)
+  return precision, recall, error_bound
+
+
+def save_state(state, path):
+  """Writes an ObjectDetectionEvalState to a numpy .npz file.
+
+  Image keys are stored as strings.
+
+  Args:
+    state: An ObjectDetectionEvalState.
+    path: Path of the file to write.
+  """
+  with open(path, 'wb') as fid:
+    np.savez(
+        fid,
+        num_gt_instances_per_class=state.num_gt_instances_per_class,
+        num_gt_imgs_per_class=state.num_gt_imgs_per_class,
+        num_images_correctly_detected_per_class=(
+            state.num_images_correctly_detected_per_class),
+        num_detections_per_class=np.array(
+            [scores.shape[0] for scores in state.scores_per_class],
+            dtype=np.int64),
+        scores=np.concatenate(state.scores_per_class).astype(float),
+        tp_fp_labels=np.concatenate(state.tp_fp_labels_per_class).astype(bool),
+        detection_keys=np.array(
+            sorted(str(key) for key in state.detection_keys), dtype=np.str_))
+
+
+def load_state(path):
+  """Reads an ObjectDetectionEvalState written by save_state.
+
+  Args:
+    path: Path of the file to read.
+
+  Returns:
+    An ObjectDetectionEvalState.
+  """
+  with open(path, 'rb') as fid:
+    data = np.load(fid, allow_pickle=False)
+    split_points = np.cumsum(data['num_detections_per_class'])[:-1]
+    return ObjectDetectionEvalState(
+        data['num_gt_instances_per_class'],
+        data['num_gt_imgs_per_class'],
+        data['num_images_correctly_detected_per_class'],
+        np.split(data['scores'], split_points),
+        np.split(data['tp_fp_labels'], split_points),
+        set(data['detection_keys'].tolist()))
+
+
+def _evaluate_shard(args):
+  """Builds the evaluation state of a shard of images."""
+  evaluation_class, evaluation_kwargs, image_infos = args
+  evaluation = evaluation_class(**evaluation_kwargs)
+  for image_info in image_infos:
+    evaluation.add_single_ground_truth_image_info(
+        image_info['image_key'], image_info['groundtruth_boxes'],
+        image_info['groundtruth_class_labels'],
+        image_info.get('groundtruth_is_difficult_list'),
+        image_info.get('groundtruth_is_group_of_list'))
+    if 'detected_boxes' in image_info:
+      evaluation.add_single_detected_image_info(
+          image_info['image_key'], image_info['detected_boxes'],
+          image_info['detected_scores'], image_info['detected_class_labels'])
+  return evaluation.get_state()
+
+
+def evaluate_in_parallel(image_infos, num_groundtruth_classes, num_workers=None,
+                         num_shards=None,
+                         evaluation_class=ObjectDetectionEvaluation, **kwargs):
+  """Accumulates evaluation statistics of a dataset with a process pool.
+
+  Images are split into shards that are evaluated by independent evaluations
+  of evaluation_class in worker processes; their states are then merged into a
+  single evaluation.
+
+  Args:
+    image_infos: A list of dicts, one per image, with the keys 'image_key',
+      'groundtruth_boxes', 'groundtruth_class_labels' and optionally
+      'groundtruth_is_difficult_list', 'groundtruth_is_group_of_list',
+      'detected_boxes', 'detected_scores' and 'detected_class_labels', as
+      expected by the add_single_*_image_info methods of
+      ObjectDetectionEvaluation.
+    num_groundtruth_classes: Number of ground truth object classes.
+    num_workers: Number of worker processes. Defaults to the number of CPUs.
+    num_shards: Number of shards the images are split into. Defaults to
+      num_workers.
+    evaluation_class: ObjectDetectionEvaluation or one of its subclasses, e.g.
+      MultiThresholdObjectDetectionEvaluation.
+    **kwargs: Other arguments of the evaluation_class constructor.
+
+  Returns:
+    An evaluation_class instance holding the statistics of all images, ready
+    to be evaluated.
+  """
+  num_workers = num_workers or multiprocessing.cpu_count()
+  num_shards = num_shards or num_workers
+  kwargs['num_groundtruth_classes'] = num_groundtruth_classes
+  shards = [(evaluation_class, kwargs, image_infos[shard_index::num_shards])
+            for shard_index in range(num_shards)]
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    states = pool.map(_evaluate_shard, shards)
+  finally:
+    pool.close()
+    pool.join()
+  evaluation = evaluation_class(**kwargs)
+  for state in states:
+    evaluation.merge(state)
+  return evaluation
@@ -15,6 +15,8 @@
 
 """Tests for object_detection.utils.object_detection_evaluation."""
 
+import os
+
 import numpy as np
 import tensorflow as tf
 
@@ -432,5 +434,446 @@ class ObjectDetectionEvaluationTest(tf.test.TestCase):
     self.assertAlmostEqual(expected_mean_corloc, mean_corloc)
 
 
+def _create_image_infos(num_groundtruth_classes, num_images):
+  """Creates random per-image infos as used by evaluate_in_parallel."""
+  image_infos = []
+  for image_index in range(num_images):
+    num_groundtruth = np.random.randint(0, 6)
+    corners = np.random.uniform(0, 10, size=[num_groundtruth, 2])
+    groundtruth_boxes = np.hstack([corners, corners + 2])
+    num_detections = np.random.randint(0, 10)
+    corners = np.random.uniform(0, 10, size=[num_detections, 2])
+    detected_boxes = np.hstack([corners, corners + 2])
+    image_infos.append({
+        'image_key': 'img%d' % image_index,
+        'groundtruth_boxes': groundtruth_boxes,
+        'groundtruth_class_labels': np.random.randint(
+            0, num_groundtruth_classes, size=[num_groundtruth]),
+        'groundtruth_is_difficult_list': np.random.uniform(
+            size=[num_groundtruth]) < 0.2,
+        'detected_boxes': detected_boxes,
+        'detected_scores': np.random.uniform(size=[num_detections]),
+        'detected_class_labels': np.random.randint(
+            0, num_groundtruth_classes, size=[num_detections]),
+    })
+  return image_infos
+
+
+def _add_image_infos(evaluation, image_infos):
+  for image_info in image_infos:
+    evaluation.add_single_ground_truth_image_info(
+        image_info['image_key'], image_info['groundtruth_boxes'],
+        image_info['groundtruth_class_labels'],
+        image_info['groundtruth_is_difficult_list'])
+    evaluation.add_single_detected_image_info(
+        image_info['image_key'], image_info['detected_boxes'],
+        image_info['detected_scores'], image_info['detected_class_labels'])
+
+
+class ParallelEvaluationTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.num_groundtruth_classes = 4
+    self.image_infos = _create_image_infos(self.num_groundtruth_classes, 12)
+
+  def evaluate_serially(self, image_infos):
+    evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+        self.num_groundtruth_classes)
+    _add_image_infos(evaluation, image_infos)
+    return evaluation
+
+  def assert_same_metrics(self, expected_evaluation, evaluation):
+    expected_metrics = expected_evaluation.evaluate()
+    metrics = evaluation.evaluate()
+    self.assertAllClose(expected_metrics.average_precisions,
+                        metrics.average_precisions)
+    self.assertAllClose(expected_metrics.mean_ap, metrics.mean_ap)
+    self.assertAllClose(expected_metrics.corlocs, metrics.corlocs)
+
+  def test_evaluate_in_parallel(self):
+    evaluation = object_detection_evaluation.evaluate_in_parallel(
+        self.image_infos, self.num_groundtruth_classes, num_workers=2,
+        num_shards=3)
+    expected_evaluation = self.evaluate_serially(self.image_infos)
+    self.assertAllEqual(expected_evaluation.num_gt_instances_per_class,
+                        evaluation.num_gt_instances_per_class)
+    self.assertAllEqual(expected_evaluation.num_gt_imgs_per_class,
+                        evaluation.num_gt_imgs_per_class)
+    self.assertEqual(expected_evaluation.detection_keys,
+                     evaluation.detection_keys)
+    self.assert_same_metrics(expected_evaluation, evaluation)
+
+  def test_merge_saved_states(self):
+    paths = []
+    for shard_index in range(2):
+      shard = self.evaluate_serially(self.image_infos[shard_index::2])
+      paths.append(os.path.join(self.get_temp_dir(),
+                                'shard%d.npz' % shard_index))
+      object_detection_evaluation.save_state(shard.get_state(), paths[-1])
+    evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+        self.num_groundtruth_classes)
+    for path in paths:
+      evaluation.merge(object_detection_evaluation.load_state(path))
+    self.assert_same_metrics(self.evaluate_serially(self.image_infos),
+                             evaluation)
+
+  def test_merge_raises_on_duplicate_images(self):
+    evaluation = self.evaluate_serially(self.image_infos[:3])
+    with self.assertRaises(ValueError):
+      evaluation.merge(self.evaluate_serially(self.image_infos[2:4]))
+
+
+class IncrementalEvaluationTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.num_groundtruth_classes = 4
+    self.image_infos = _create_image_infos(self.num_groundtruth_classes, 12)
+
+  def test_repeated_evaluate_matches_evaluation_from_scratch(self):
+    for use_weighted_mean_ap in [False, True]:
+      evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+          self.num_groundtruth_classes,
+          use_weighted_mean_ap=use_weighted_mean_ap, incremental=True)
+      for image_index, image_info in enumerate(self.image_infos):
+        _add_image_infos(evaluation, [image_info])
+        if image_index % 3 == 0:
+          metrics = evaluation.evaluate()
+          expected_evaluation = (
+              object_detection_evaluation.ObjectDetectionEvaluation(
+                  self.num_groundtruth_classes,
+                  use_weighted_mean_ap=use_weighted_mean_ap))
+          _add_image_infos(expected_evaluation,
+                           self.image_infos[:image_index + 1])
+          expected_metrics = expected_evaluation.evaluate()
+          self.assertAllClose(expected_metrics.average_precisions,
+                              metrics.average_precisions)
+          self.assertAllClose(expected_metrics.mean_ap, metrics.mean_ap)
+          self.assertEqual(len(expected_metrics.precisions),
+                           len(metrics.precisions))
+          for expected_precision, precision in zip(expected_metrics.precisions,
+                                                   metrics.precisions):
+            self.assertAllClose(expected_precision, precision)
+
+  def test_evaluate_does_not_accumulate_precisions(self):
+    evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+        self.num_groundtruth_classes)
+    _add_image_infos(evaluation, self.image_infos)
+    num_precisions = len(evaluation.evaluate().precisions)
+    self.assertEqual(num_precisions, len(evaluation.evaluate().precisions))
+
+
+class GroundTruthBatchTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.num_groundtruth_classes = 5
+    self.image_infos = _create_image_infos(self.num_groundtruth_classes, 30)
+
+  def add_ground_truth_batch(self, evaluation, image_infos):
+    evaluation.add_ground_truth_batch(
+        [image_info['image_key'] for image_info in image_infos],
+        np.concatenate([image_info['groundtruth_boxes']
+                        for image_info in image_infos]),
+        np.concatenate([image_info['groundtruth_class_labels']
+                        for image_info in image_infos]),
+        np.cumsum([0] + [len(image_info['groundtruth_class_labels'])
+                         for image_info in image_infos]),
+        groundtruth_is_difficult_list=np.concatenate(
+            [image_info['groundtruth_is_difficult_list']
+             for image_info in image_infos]))
+
+  def test_matches_single_image_statistics(self):
+    expected_evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+        self.num_groundtruth_classes)
+    for image_info in self.image_infos:
+      expected_evaluation.add_single_ground_truth_image_info(
+          image_info['image_key'], image_info['groundtruth_boxes'],
+          image_info['groundtruth_class_labels'],
+          image_info['groundtruth_is_difficult_list'])
+    evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+        self.num_groundtruth_classes)
+    self.add_ground_truth_batch(evaluation, self.image_infos[:20])
+    # Images added twice are skipped.
+    self.add_ground_truth_batch(evaluation, self.image_infos[10:])
+    self.assertAllEqual(expected_evaluation.num_gt_instances_per_class,
+                        evaluation.num_gt_instances_per_class)
+    self.assertAllEqual(expected_evaluation.num_gt_imgs_per_class,
+                        evaluation.num_gt_imgs_per_class)
+    for image_info in self.image_infos:
+      image_key = image_info['image_key']
+      self.assertAllEqual(image_info['groundtruth_boxes'],
+                          evaluation.groundtruth_boxes[image_key])
+      self.assertAllEqual(image_info['groundtruth_is_difficult_list'],
+                          evaluation.groundtruth_is_difficult_list[image_key])
+
+  def test_invalid_offsets(self):
+    evaluation = object_detection_evaluation.ObjectDetectionEvaluation(
+        self.num_groundtruth_classes)
+    with self.assertRaises(ValueError):
+      evaluation.add_ground_truth_batch(
+          ['img1', 'img2'], np.zeros([3, 4]), np.zeros(3, dtype=int),
+          np.array([0, 2]))
+
+
+class StreamingObjectDetectionEvaluationTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.num_groundtruth_classes = 3
+    self.image_infos = []
+    for image_index in range(50):
+      num_groundtruth = np.random.randint(0, 6)
+      corners = np.random.uniform(0, 10, size=[num_groundtruth, 2])
+      num_detections = np.random.randint(0, 15)
+      detection_corners = np.random.uniform(0, 10, size=[num_detections, 2])
+      self.image_infos.append((
+          'img%d' % image_index,
+          np.hstack([corners, corners + 2]),
+          np.random.randint(0, self.num_groundtruth_classes,
+                            size=[num_groundtruth]),
+          np.hstack([detection_corners, detection_corners + 2]),
+          np.random.uniform(size=[num_detections]),
+          np.random.randint(0, self.num_groundtruth_classes,
+                            size=[num_detections])))
+
+  def evaluate(self, evaluation):
+    for (image_key, groundtruth_boxes, groundtruth_class_labels,
+         detected_boxes, detected_scores,
+         detected_class_labels) in self.image_infos:
+      evaluation.add_single_ground_truth_image_info(
+          image_key, groundtruth_boxes, groundtruth_class_labels)
+      evaluation.add_single_detected_image_info(
+          image_key, detected_boxes, detected_scores, detected_class_labels)
+    return evaluation.evaluate()
+
+  def test_fine_bins_match_exact_evaluation(self):
+    expected_metrics = self.evaluate(
+        object_detection_evaluation.ObjectDetectionEvaluation(
+            self.num_groundtruth_classes))
+    streaming_evaluation = (
+        object_detection_evaluation.StreamingObjectDetectionEvaluation(
+            self.num_groundtruth_classes, num_score_bins=10**7))
+    metrics = self.evaluate(streaming_evaluation)
+    self.assertAllClose(expected_metrics.average_precisions,
+                        metrics.average_precisions)
+    self.assertAllClose(expected_metrics.corlocs, metrics.corlocs)
+    self.assertAllClose(
+        streaming_evaluation.average_precision_error_bound_per_class,
+        np.zeros(self.num_groundtruth_classes))
+
+  def test_coarse_bins_within_error_bound(self):
+    expected_metrics = self.evaluate(
+        object_detection_evaluation.ObjectDetectionEvaluation(
+            self.num_groundtruth_classes))
+    for num_score_bins in [1, 4, 20]:
+      streaming_evaluation = (
+          object_detection_evaluation.StreamingObjectDetectionEvaluation(
+              self.num_groundtruth_classes, num_score_bins=num_score_bins))
+      metrics = self.evaluate(streaming_evaluation)
+      error = expected_metrics.average_precisions - metrics.average_precisions
+      self.assertTrue(np.all(error >= -1e-12))
+      self.assertTrue(np.all(
+          error <=
+          streaming_evaluation.average_precision_error_bound_per_class + 1e-12))
+
+  def test_weighted_mean_ap(self):
+    expected_metrics = self.evaluate(
+        object_detection_evaluation.ObjectDetectionEvaluation(
+            self.num_groundtruth_classes, use_weighted_mean_ap=True))
+    metrics = self.evaluate(
+        object_detection_evaluation.StreamingObjectDetectionEvaluation(
+            self.num_groundtruth_classes, num_score_bins=10**7,
+            use_weighted_mean_ap=True))
+    self.assertAlmostEqual(expected_metrics.mean_ap, metrics.mean_ap)
+
+  def test_memory_is_bounded(self):
+    streaming_evaluation = (
+        object_detection_evaluation.StreamingObjectDetectionEvaluation(
+            self.num_groundtruth_classes, num_score_bins=10))
+    self.evaluate(streaming_evaluation)
+    self.assertFalse(streaming_evaluation.groundtruth_boxes)
+    self.assertFalse(streaming_evaluation.detection_keys)
+    self.assertFalse(any(streaming_evaluation.scores_per_class))
+    self.assertEqual(
+        np.sum(streaming_evaluation.tp_histogram_per_class) +
+        np.sum(streaming_evaluation.fp_histogram_per_class),
+        sum(len(image_info[4]) for image_info in self.image_infos))
+
+  def test_merge(self):
+    num_score_bins = 20
+    expected_evaluation = (
+        object_detection_evaluation.StreamingObjectDetectionEvaluation(
+            self.num_groundtruth_classes, num_score_bins=num_score_bins))
+    expected_metrics = self.evaluate(expected_evaluation)
+    # Histograms and exact scores can both be merged into histograms.
+    shards = [
+        object_detection_evaluation.StreamingObjectDetectionEvaluation(
+            self.num_groundtruth_classes, num_score_bins=num_score_bins),
+        object_detection_evaluation.ObjectDetectionEvaluation(
+            self.num_groundtruth_classes)
+    ]
+    image_infos = self.image_infos
+    for shard_index, shard in enumerate(shards):
+      self.image_infos = image_infos[shard_index::2]
+      self.evaluate(shard)
+    evaluation = object_detection_evaluation.StreamingObjectDetectionEvaluation(
+        self.num_groundtruth_classes, num_score_bins=num_score_bins)
+    for shard in shards:
+      evaluation.merge(shard.get_state())
+    self.assertAllEqual(expected_evaluation.tp_histogram_per_class,
+                        evaluation.tp_histogram_per_class)
+    self.assertAllEqual(expected_evaluation.fp_histogram_per_class,
+                        evaluation.fp_histogram_per_class)
+    metrics = evaluation.evaluate()
+    self.assertAllClose(expected_metrics.average_precisions,
+                        metrics.average_precisions)
+    self.assertAllClose(expected_metrics.corlocs, metrics.corlocs)
+    self.assertFalse(evaluation.detection_keys)
+
+  def test_merge_raises_on_incompatible_states(self):
+    self.image_infos = self.image_infos[:5]
+    streaming_evaluation = (
+        object_detection_evaluation.StreamingObjectDetectionEvaluation(
+            self.num_groundtruth_classes, num_score_bins=10))
+    self.evaluate(streaming_evaluation)
+    with self.assertRaises(ValueError):
+      object_detection_evaluation.StreamingObjectDetectionEvaluation(
+          self.num_groundtruth_classes, num_score_bins=20).merge(
+              streaming_evaluation)
+    with self.assertRaises(ValueError):
+      object_detection_evaluation.ObjectDetectionEvaluation(
+          self.num_groundtruth_classes).merge(streaming_evaluation)
+
+
+class MultiThresholdObjectDetectionEvaluationTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.num_groundtruth_classes = 4
+    self.image_infos = _create_image_infos(self.num_groundtruth_classes, 20)
+    # Adds detections close to the groundtruth, so that true positives depend
+    # on the threshold.
+    for image_info in self.image_infos:
+      groundtruth_boxes = image_info['groundtruth_boxes']
+      num_groundtruth = groundtruth_boxes.shape[0]
+      image_info['detected_boxes'] = np.vstack([
+          image_info['detected_boxes'], groundtruth_boxes +
+          np.random.uniform(-0.5, 0.5, size=[num_groundtruth, 4])])
+      image_info['detected_scores'] = np.concatenate([
+          image_info['detected_scores'],
+          np.random.uniform(size=[num_groundtruth])])
+      image_info['detected_class_labels'] = np.concatenate([
+          image_info['detected_class_labels'],
+          image_info['groundtruth_class_labels']])
+    self.matching_iou_thresholds = [0.1, 0.3, 0.5, 0.7]
+
+  def test_matches_single_threshold_evaluations(self):
+    evaluation = (
+        object_detection_evaluation.MultiThresholdObjectDetectionEvaluation(
+            self.num_groundtruth_classes,
+            matching_iou_thresholds=self.matching_iou_thresholds))
+    _add_image_infos(evaluation, self.image_infos)
+    metrics = evaluation.evaluate()
+    mean_aps = []
+    for threshold, threshold_metrics in zip(self.matching_iou_thresholds,
+                                            metrics.metrics_per_threshold):
+      expected_evaluation = (
+          object_detection_evaluation.ObjectDetectionEvaluation(
+              self.num_groundtruth_classes, matching_iou_threshold=threshold))
+      _add_image_infos(expected_evaluation, self.image_infos)
+      expected_metrics = expected_evaluation.evaluate()
+      self.assertAllClose(expected_metrics.average_precisions,
+                          threshold_metrics.average_precisions)
+      self.assertAllClose(expected_metrics.corlocs, threshold_metrics.corlocs)
+      mean_aps.append(expected_metrics.mean_ap)
+    self.assertAlmostEqual(np.mean(mean_aps), metrics.mean_ap)
+    self.assertGreater(mean_aps[0], mean_aps[-1])
+
+  def create_evaluation(self, matching_iou_thresholds=None):
+    return object_detection_evaluation.MultiThresholdObjectDetectionEvaluation(
+        self.num_groundtruth_classes,
+        matching_iou_thresholds=(matching_iou_thresholds or
+                                 self.matching_iou_thresholds))
+
+  def assert_same_metrics(self, expected_evaluation, evaluation):
+    expected_metrics = expected_evaluation.evaluate()
+    metrics = evaluation.evaluate()
+    self.assertAllClose(expected_metrics.average_precisions,
+                        metrics.average_precisions)
+    self.assertAlmostEqual(expected_metrics.mean_ap, metrics.mean_ap)
+    for expected_threshold_metrics, threshold_metrics in zip(
+        expected_metrics.metrics_per_threshold, metrics.metrics_per_threshold):
+      self.assertAllClose(expected_threshold_metrics.average_precisions,
+                          threshold_metrics.average_precisions)
+      self.assertAllClose(expected_threshold_metrics.corlocs,
+                          threshold_metrics.corlocs)
+
+  def test_merge(self):
+    expected_evaluation = self.create_evaluation()
+    _add_image_infos(expected_evaluation, self.image_infos)
+    evaluation = self.create_evaluation()
+    for shard_index in range(3):
+      shard = self.create_evaluation()
+      _add_image_infos(shard, self.image_infos[shard_index::3])
+      evaluation.merge(shard.get_state())
+    self.assertAllEqual(expected_evaluation.num_gt_instances_per_class,
+                        evaluation.num_gt_instances_per_class)
+    self.assertEqual(expected_evaluation.detection_keys,
+                     evaluation.detection_keys)
+    self.assert_same_metrics(expected_evaluation, evaluation)
+
+  def test_merge_raises_on_incompatible_states(self):
+    evaluation = self.create_evaluation()
+    _add_image_infos(evaluation, self.image_infos[:3])
+    with self.assertRaises(ValueError):
+      evaluation.merge(self.create_evaluation([0.5, 0.75]))
+    duplicate = self.create_evaluation()
+    _add_image_infos(duplicate, self.image_infos[2:4])
+    with self.assertRaises(ValueError):
+      evaluation.merge(duplicate)
+
+  def test_evaluate_in_parallel(self):
+    expected_evaluation = self.create_evaluation()
+    _add_image_infos(expected_evaluation, self.image_infos)
+    evaluation_class = (
+        object_detection_evaluation.MultiThresholdObjectDetectionEvaluation)
+    evaluation = object_detection_evaluation.evaluate_in_parallel(
+        self.image_infos, self.num_groundtruth_classes, num_workers=2,
+        num_shards=3, evaluation_class=evaluation_class,
+        matching_iou_thresholds=self.matching_iou_thresholds)
+    self.assert_same_metrics(expected_evaluation, evaluation)
+
+  def test_evaluator_metrics(self):
+    categories = [{'id': 1, 'name': 'cat'}, {'id': 2, 'name': 'dog'}]
+    evaluator = object_detection_evaluation.MultiThresholdDetectionEvaluator(
+        categories, matching_iou_thresholds=[0.5, 0.75])
+    evaluator.add_single_ground_truth_image_info('img1', {
+        standard_fields.InputDataFields.groundtruth_boxes:
+            np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=float),
+        standard_fields.InputDataFields.groundtruth_classes:
+            np.array([1, 2], dtype=int)
+    })
+    evaluator.add_single_detected_image_info('img1', {
+        standard_fields.DetectionResultFields.detection_boxes:
+            np.array([[0, 0, 10, 10], [20, 20, 30, 36]], dtype=float),
+        standard_fields.DetectionResultFields.detection_scores:
+            np.array([0.9, 0.8], dtype=float),
+        standard_fields.DetectionResultFields.detection_classes:
+            np.array([1, 2], dtype=int)
+    })
+    metrics = evaluator.evaluate()
+    self.assertAlmostEqual(metrics['Precision/mAP@0.5IOU'], 1.0)
+    self.assertAlmostEqual(metrics['Precision/mAP@0.75IOU'], 0.5)
+    self.assertAlmostEqual(metrics['Precision/mAP@[0.5:0.75]IOU'], 0.75)
+    self.assertAlmostEqual(
+        metrics['PerformanceByCategory/AP@[0.5:0.75]IOU/cat'], 1.0)
+    self.assertAlmostEqual(
+        metrics['PerformanceByCategory/AP@[0.5:0.75]IOU/dog'], 0.5)
+    evaluator.clear()
+    self.assertFalse(evaluator._image_ids)
+
+
 if __name__ == '__main__':
   tf.test.main()
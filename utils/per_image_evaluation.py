@@ -22,6 +22,11 @@ import numpy as np
 
 from object_detection.utils import np_box_list
 from object_detection.utils import np_box_list_ops
+from object_detection.utils import np_box_ops
+
+# Shared results of classes without detections in an image.
+_EMPTY_SCORES = np.array([], dtype=float)
+_EMPTY_TP_FP_LABELS = np.array([], dtype=bool)
 
 
 class PerImageEvaluation(object):
@@ -99,6 +104,56 @@ class PerImageEvaluation(object):
         groundtruth_boxes, groundtruth_class_labels)
     return scores, tp_fp_labels, is_class_correctly_detected_in_image
 
+  def compute_object_detection_metrics_at_thresholds(
+      self, detected_boxes, detected_scores, detected_class_labels,
+      groundtruth_boxes, groundtruth_class_labels,
+      groundtruth_is_difficult_lists, groundtruth_is_group_of_list,
+      matching_iou_thresholds):
+    """Evaluates detections of a single image at several IOU thresholds.
+
+    Same as compute_object_detection_metrics, except that detections are
+    matched at every threshold of matching_iou_thresholds instead of
+    matching_iou_threshold. The IOU matrix and the best matching groundtruth
+    box of every detection are computed once for all thresholds.
+
+    Args:
+      detected_boxes: A float numpy array of shape [N, 4], representing N
+          regions of detected object regions.
+          Each row is of the format [y_min, x_min, y_max, x_max]
+      detected_scores: A float numpy array of shape [N, 1], representing
+          the confidence scores of the detected N object instances.
+      detected_class_labels: A integer numpy array of shape [N, 1], repreneting
+          the class labels of the detected N object instances.
+      groundtruth_boxes: A float numpy array of shape [M, 4], representing M
+          regions of object instances in ground truth
+      groundtruth_class_labels: An integer numpy array of shape [M, 1],
+          representing M class labels of object instances in ground truth
+      groundtruth_is_difficult_lists: A boolean numpy array of length M denoting
+          whether a ground truth box is a difficult instance or not
+      groundtruth_is_group_of_list: A boolean numpy array of length M denoting
+          whether a ground truth box has group-of tag
+      matching_iou_thresholds: A 1-d float numpy array of T IOU thresholds.
+
+    Returns:
+      scores: A list of T lists of C float numpy arrays, as returned by
+          compute_object_detection_metrics for every threshold.
+      tp_fp_labels: A list of T lists of C boolean numpy arrays.
+      is_class_correctly_detected_in_image: a numpy integer array of
+          shape [T, C].
+    """
+    detected_boxes, detected_scores, detected_class_labels = (
+        self._remove_invalid_boxes(detected_boxes, detected_scores,
+                                   detected_class_labels))
+    scores, tp_fp_labels = self._compute_tp_fp_at_thresholds(
+        detected_boxes, detected_scores, detected_class_labels,
+        groundtruth_boxes, groundtruth_class_labels,
+        groundtruth_is_difficult_lists, groundtruth_is_group_of_list,
+        matching_iou_thresholds)
+    is_class_correctly_detected_in_image = self._compute_cor_loc_at_thresholds(
+        detected_boxes, detected_scores, detected_class_labels,
+        groundtruth_boxes, groundtruth_class_labels, matching_iou_thresholds)
+    return scores, tp_fp_labels, is_class_correctly_detected_in_image
+
   def _compute_cor_loc(self, detected_boxes, detected_scores,
                        detected_class_labels, groundtruth_boxes,
                        groundtruth_class_labels):
@@ -121,47 +176,73 @@ class PerImageEvaluation(object):
           shape [C, 1], indicating whether the correponding class has a least
           one instance being correctly detected in the image
     """
+    return self._compute_cor_loc_at_thresholds(
+        detected_boxes, detected_scores, detected_class_labels,
+        groundtruth_boxes, groundtruth_class_labels,
+        [self.matching_iou_threshold])[0]
+
+  def _compute_cor_loc_at_thresholds(self, detected_boxes, detected_scores,
+                                     detected_class_labels, groundtruth_boxes,
+                                     groundtruth_class_labels,
+                                     matching_iou_thresholds):
+    """Compute CorLoc scores for several IOU thresholds.
+
+    Args:
+      detected_boxes: A float numpy array of shape [N, 4].
+      detected_scores: A float numpy array of shape [N].
+      detected_class_labels: A integer numpy array of shape [N].
+      groundtruth_boxes: A float numpy array of shape [M, 4].
+      groundtruth_class_labels: An integer numpy array of shape [M].
+      matching_iou_thresholds: A 1-d float numpy array of T IOU thresholds.
+
+    Returns:
+      is_class_correctly_detected_in_image: a numpy integer array of
+          shape [T, C].
+    """
+    matching_iou_thresholds = np.asarray(matching_iou_thresholds, dtype=float)
     is_class_correctly_detected_in_image = np.zeros(
-        self.num_groundtruth_classes, dtype=int)
-    for i in range(self.num_groundtruth_classes):
+        [len(matching_iou_thresholds), self.num_groundtruth_classes],
+        dtype=int)
+    # Only classes with both detections and groundtruth can be detected.
+    present_classes = np.intersect1d(detected_class_labels,
+                                     groundtruth_class_labels)
+    present_classes = present_classes[
+        (present_classes >= 0)
+        & (present_classes < self.num_groundtruth_classes)]
+    for i in present_classes:
       gt_boxes_at_ith_class = groundtruth_boxes[groundtruth_class_labels ==
                                                 i, :]
       detected_boxes_at_ith_class = detected_boxes[detected_class_labels ==
                                                    i, :]
       detected_scores_at_ith_class = detected_scores[detected_class_labels == i]
-      is_class_correctly_detected_in_image[i] = (
-          self._compute_is_aclass_correctly_detected_in_image(
-              detected_boxes_at_ith_class, detected_scores_at_ith_class,
-              gt_boxes_at_ith_class))
+      max_iou = self._compute_max_iou_of_top_detection(
+          detected_boxes_at_ith_class, detected_scores_at_ith_class,
+          gt_boxes_at_ith_class)
+      is_class_correctly_detected_in_image[:, int(i)] = (
+          max_iou >= matching_iou_thresholds)
 
     return is_class_correctly_detected_in_image
 
-  def _compute_is_aclass_correctly_detected_in_image(
+  def _compute_max_iou_of_top_detection(
       self, detected_boxes, detected_scores, groundtruth_boxes):
-    """Compute CorLoc score for a single class.
+    """Computes the best IOU of the highest scored detection of a class.
 
     Args:
       detected_boxes: A numpy array of shape [N, 4] representing detected box
-          coordinates
+          coordinates, with N > 0
       detected_scores: A 1-d numpy array of length N representing classification
           score
       groundtruth_boxes: A numpy array of shape [M, 4] representing ground truth
-          box coordinates
+          box coordinates, with M > 0
 
     Returns:
-      is_class_correctly_detected_in_image: An integer 1 or 0 denoting whether a
-          class is correctly detected in the image or not
+      The largest IOU between the highest scored detection and the ground truth
+      boxes.
     """
-    if detected_boxes.size > 0:
-      if groundtruth_boxes.size > 0:
-        max_score_id = np.argmax(detected_scores)
-        detected_boxlist = np_box_list.BoxList(
-            np.expand_dims(detected_boxes[max_score_id, :], axis=0))
-        gt_boxlist = np_box_list.BoxList(groundtruth_boxes)
-        iou = np_box_list_ops.iou(detected_boxlist, gt_boxlist)
-        if np.max(iou) >= self.matching_iou_threshold:
-          return 1
-    return 0
+    max_score_id = np.argmax(detected_scores)
+    iou = np_box_ops.iou(detected_boxes[max_score_id:max_score_id + 1, :],
+                         groundtruth_boxes)
+    return np.max(iou)
 
   def _compute_tp_fp(self, detected_boxes, detected_scores,
                      detected_class_labels, groundtruth_boxes,
@@ -193,27 +274,251 @@ class PerImageEvaluation(object):
       result_tp_fp_labels: A list of boolean numpy array. Each numpy array is of
           shape [K, 1], representing K True/False positive label of object
           instances detected with class label c
+
+    All classes are matched together: detections of every class present in
+    the image are selected (sorted by score and suppressed) per class, then
+    matched against all groundtruth boxes through one IOU matrix in which
+    pairs of different classes are masked out. The result is identical to
+    calling _compute_tp_fp_for_single_class for every class, while classes
+    without detections cost nothing.
     """
-    result_scores = []
-    result_tp_fp_labels = []
-    for i in range(self.num_groundtruth_classes):
-      gt_boxes_at_ith_class = groundtruth_boxes[(groundtruth_class_labels == i
-                                                ), :]
-      groundtruth_is_difficult_list_at_ith_class = (
-          groundtruth_is_difficult_lists[groundtruth_class_labels == i])
-      groundtruth_is_group_of_list_at_ith_class = (
-          groundtruth_is_group_of_list[groundtruth_class_labels == i])
-      detected_boxes_at_ith_class = detected_boxes[(detected_class_labels == i
-                                                   ), :]
-      detected_scores_at_ith_class = detected_scores[detected_class_labels == i]
-      scores, tp_fp_labels = self._compute_tp_fp_for_single_class(
-          detected_boxes_at_ith_class, detected_scores_at_ith_class,
-          gt_boxes_at_ith_class, groundtruth_is_difficult_list_at_ith_class,
-          groundtruth_is_group_of_list_at_ith_class)
-      result_scores.append(scores)
-      result_tp_fp_labels.append(tp_fp_labels)
+    result_scores, result_tp_fp_labels = self._compute_tp_fp_at_thresholds(
+        detected_boxes, detected_scores, detected_class_labels,
+        groundtruth_boxes, groundtruth_class_labels,
+        groundtruth_is_difficult_lists, groundtruth_is_group_of_list,
+        [self.matching_iou_threshold])
+    return result_scores[0], result_tp_fp_labels[0]
+
+  def _compute_tp_fp_at_thresholds(
+      self, detected_boxes, detected_scores, detected_class_labels,
+      groundtruth_boxes, groundtruth_class_labels,
+      groundtruth_is_difficult_lists, groundtruth_is_group_of_list,
+      matching_iou_thresholds):
+    """Labels true/false positives of detections for several IOU thresholds.
+
+    Args:
+      detected_boxes: A float numpy array of shape [N, 4].
+      detected_scores: A float numpy array of shape [N].
+      detected_class_labels: A integer numpy array of shape [N].
+      groundtruth_boxes: A float numpy array of shape [M, 4].
+      groundtruth_class_labels: An integer numpy array of shape [M].
+      groundtruth_is_difficult_lists: A boolean numpy array of length M.
+      groundtruth_is_group_of_list: A boolean numpy array of length M.
+      matching_iou_thresholds: A 1-d float numpy array of T IOU thresholds.
+
+    Returns:
+      result_scores: A list of T lists of C float numpy arrays, as returned by
+          _compute_tp_fp for every threshold.
+      result_tp_fp_labels: A list of T lists of C boolean numpy arrays.
+    """
+    num_classes = self.num_groundtruth_classes
+    num_thresholds = len(matching_iou_thresholds)
+    result_scores = [[_EMPTY_SCORES] * num_classes
+                     for _ in range(num_thresholds)]
+    result_tp_fp_labels = [[_EMPTY_TP_FP_LABELS] * num_classes
+                           for _ in range(num_thresholds)]
+    if detected_class_labels.size == 0:
+      return result_scores, result_tp_fp_labels
+
+    class_order = np.argsort(detected_class_labels, kind='mergesort')
+    sorted_class_labels = detected_class_labels[class_order]
+    present_classes = np.unique(sorted_class_labels)
+    present_classes = present_classes[(present_classes >= 0)
+                                      & (present_classes < num_classes)]
+    if present_classes.size == 0:
+      return result_scores, result_tp_fp_labels
+    class_starts = np.searchsorted(sorted_class_labels, present_classes, 'left')
+    class_ends = np.searchsorted(sorted_class_labels, present_classes, 'right')
+
+    selected_indices = [
+        self._select_detections(detected_boxes, detected_scores,
+                                class_order[start:end])
+        for start, end in zip(class_starts, class_ends)]
+    num_selected = [indices.size for indices in selected_indices]
+    selected_indices = np.concatenate(selected_indices).astype(int)
+    selected_class_labels = np.repeat(present_classes, num_selected)
+
+    tp_fp_labels, is_ignored = self._match_detections_at_thresholds(
+        detected_boxes[selected_indices, :], groundtruth_boxes,
+        groundtruth_is_difficult_lists, groundtruth_is_group_of_list,
+        matching_iou_thresholds, selected_class_labels,
+        groundtruth_class_labels)
+
+    split_points = np.cumsum(num_selected)[:-1]
+    class_scores = np.split(detected_scores[selected_indices], split_points)
+    for threshold_index in range(num_thresholds):
+      for class_label, scores, class_tp_fp_labels, class_is_ignored in zip(
+          present_classes, class_scores,
+          np.split(tp_fp_labels[threshold_index], split_points),
+          np.split(is_ignored[threshold_index], split_points)):
+        result_scores[threshold_index][int(class_label)] = (
+            scores[~class_is_ignored])
+        result_tp_fp_labels[threshold_index][int(class_label)] = (
+            class_tp_fp_labels[~class_is_ignored])
     return result_scores, result_tp_fp_labels
 
+  def _select_detections(self, detected_boxes, detected_scores,
+                         class_indices):
+    """Applies non maximum suppression to the detections of a single class.
+
+    Args:
+      detected_boxes: A float numpy array of shape [N, 4] holding the
+          detections of all classes.
+      detected_scores: A 1-d float numpy array of length N.
+      class_indices: A 1-d integer numpy array with the indices of the
+          detections of a single class, in increasing order.
+
+    Returns:
+      An integer numpy array with the indices of the detections kept by non
+      maximum suppression, in the order non_max_suppression outputs them.
+    """
+    class_scores = detected_scores[class_indices]
+    if self.nms_iou_threshold == 1.0 and self.nms_max_output_boxes >= 0:
+      # Same filtering and ordering as non_max_suppression with NMS disabled,
+      # without building intermediate BoxLists.
+      valid = np.greater(class_scores, -10.0)
+      class_indices = class_indices[valid]
+      class_scores = class_scores[valid]
+      sorted_indices = class_indices[np.argsort(class_scores)[::-1]]
+      return sorted_indices[:self.nms_max_output_boxes]
+    detected_boxlist = np_box_list.BoxList(detected_boxes[class_indices, :])
+    detected_boxlist.add_field('scores', class_scores)
+    detected_boxlist.add_field('indices', class_indices)
+    detected_boxlist = np_box_list_ops.non_max_suppression(
+        detected_boxlist, self.nms_max_output_boxes, self.nms_iou_threshold)
+    return detected_boxlist.get_field('indices')
+
+  def _match_detections_to_groundtruth(
+      self, detected_boxes, groundtruth_boxes, groundtruth_is_difficult_list,
+      groundtruth_is_group_of_list, detected_class_labels=None,
+      groundtruth_class_labels=None):
+    """Greedily matches score-ordered detections to groundtruth boxes.
+
+    Every detection is matched to the groundtruth box it overlaps most; it is a
+    true positive if the overlap reaches matching_iou_threshold, the box is not
+    difficult and no earlier detection claimed the box. Since only true
+    positives claim boxes, the true positives are the first occurrences of
+    each box among the detections matched to non difficult boxes, so the
+    greedy assignment is computed without visiting detections one by one.
+
+    When class labels are given, detections are only matched to groundtruth
+    boxes of their own class, so detections of several classes may be matched
+    at once as long as the detections of every class are sorted by decreasing
+    score.
+
+    Args:
+      detected_boxes: A numpy array of shape [N, 4] representing detected box
+          coordinates, sorted by decreasing score.
+      groundtruth_boxes: A numpy array of shape [M, 4] representing ground truth
+          box coordinates
+      groundtruth_is_difficult_list: A boolean numpy array of length M denoting
+          whether a ground truth box is a difficult instance or not.
+      groundtruth_is_group_of_list: A boolean numpy array of length M denoting
+          whether a ground truth box has group-of tag.
+      detected_class_labels: An optional 1-d integer numpy array of length N.
+      groundtruth_class_labels: An optional 1-d integer numpy array of length
+          M. Required if detected_class_labels is given.
+
+    Returns:
+      tp_fp_labels: a boolean numpy array of length N indicating whether a
+          detection is a true positive.
+      is_ignored: a boolean numpy array of length N indicating whether a
+          detection matched a difficult or a group-of box.
+    """
+    tp_fp_labels, is_ignored = self._match_detections_at_thresholds(
+        detected_boxes, groundtruth_boxes, groundtruth_is_difficult_list,
+        groundtruth_is_group_of_list, [self.matching_iou_threshold],
+        detected_class_labels, groundtruth_class_labels)
+    return tp_fp_labels[0], is_ignored[0]
+
+  def _match_detections_at_thresholds(
+      self, detected_boxes, groundtruth_boxes, groundtruth_is_difficult_list,
+      groundtruth_is_group_of_list, matching_iou_thresholds,
+      detected_class_labels=None, groundtruth_class_labels=None):
+    """Greedily matches detections to groundtruth at several IOU thresholds.
+
+    Same as _match_detections_to_groundtruth for every threshold of
+    matching_iou_thresholds. The groundtruth box a detection overlaps most does
+    not depend on the threshold, so the overlaps are computed once and only the
+    comparison with the threshold and the first occurrence search are done per
+    threshold, all in a single pass over [T, N] arrays.
+
+    Args:
+      detected_boxes: A numpy array of shape [N, 4] representing detected box
+          coordinates, sorted by decreasing score.
+      groundtruth_boxes: A numpy array of shape [M, 4] representing ground truth
+          box coordinates
+      groundtruth_is_difficult_list: A boolean numpy array of length M denoting
+          whether a ground truth box is a difficult instance or not.
+      groundtruth_is_group_of_list: A boolean numpy array of length M denoting
+          whether a ground truth box has group-of tag.
+      matching_iou_thresholds: A 1-d float numpy array of T IOU thresholds.
+      detected_class_labels: An optional 1-d integer numpy array of length N.
+      groundtruth_class_labels: An optional 1-d integer numpy array of length
+          M. Required if detected_class_labels is given.
+
+    Returns:
+      tp_fp_labels: a boolean numpy array of shape [T, N] indicating whether a
+          detection is a true positive at each threshold.
+      is_ignored: a boolean numpy array of shape [T, N] indicating whether a
+          detection matched a difficult or a group-of box at each threshold.
+    """
+    thresholds = np.asarray(matching_iou_thresholds,
+                            dtype=float).reshape(-1, 1)
+    num_thresholds = thresholds.shape[0]
+    num_detections = detected_boxes.shape[0]
+    tp_fp_labels = np.zeros((num_thresholds, num_detections), dtype=bool)
+    is_matched_to_difficult_box = np.zeros((num_thresholds, num_detections),
+                                           dtype=bool)
+    is_matched_to_group_of_box = np.zeros((num_thresholds, num_detections),
+                                          dtype=bool)
+    if num_detections == 0 or groundtruth_boxes.size == 0:
+      return tp_fp_labels, is_matched_to_difficult_box
+
+    groundtruth_is_difficult_list = groundtruth_is_difficult_list.astype(bool)
+    groundtruth_is_group_of_list = groundtruth_is_group_of_list.astype(bool)
+    if detected_class_labels is None:
+      is_same_class = np.ones(
+          (num_detections, groundtruth_boxes.shape[0]), dtype=bool)
+    else:
+      is_same_class = np.equal(detected_class_labels[:, np.newaxis],
+                               groundtruth_class_labels[np.newaxis, :])
+
+    # Tp-fp evaluation for non-group of boxes (if any).
+    is_candidate = is_same_class & ~groundtruth_is_group_of_list
+    if is_candidate.any():
+      iou = np.where(is_candidate,
+                     np_box_ops.iou(detected_boxes, groundtruth_boxes),
+                     -np.inf)
+      max_overlap_gt_ids = np.argmax(iou, axis=1)
+      is_matched = (iou[np.arange(num_detections), max_overlap_gt_ids] >=
+                    thresholds)
+      is_matched_gt_difficult = groundtruth_is_difficult_list[
+          max_overlap_gt_ids]
+      is_matched_to_difficult_box = is_matched & is_matched_gt_difficult
+      threshold_indices, tp_candidates = np.nonzero(
+          is_matched & ~is_matched_gt_difficult)
+      # Boxes claimed at different thresholds are distinct keys.
+      _, first_occurrences = np.unique(
+          threshold_indices * groundtruth_boxes.shape[0] +
+          max_overlap_gt_ids[tp_candidates], return_index=True)
+      tp_fp_labels[threshold_indices[first_occurrences],
+                   tp_candidates[first_occurrences]] = True
+
+    # Tp-fp evaluation for group of boxes.
+    is_candidate = is_same_class & groundtruth_is_group_of_list
+    if is_candidate.any():
+      ioa = np.where(is_candidate.T,
+                     np_box_ops.ioa(groundtruth_boxes, detected_boxes),
+                     -np.inf)
+      max_overlap_group_of_gt = np.max(ioa, axis=0)
+      is_matched_to_group_of_box = (
+          ~tp_fp_labels & ~is_matched_to_difficult_box &
+          (max_overlap_group_of_gt >= thresholds))
+
+    return (tp_fp_labels,
+            is_matched_to_difficult_box | is_matched_to_group_of_box)
+
   def _remove_invalid_boxes(self, detected_boxes, detected_scores,
                             detected_class_labels):
     valid_indices = np.logical_and(detected_boxes[:, 0] < detected_boxes[:, 2],
@@ -263,50 +568,12 @@ class PerImageEvaluation(object):
     if groundtruth_boxes.size == 0:
       return scores, np.zeros(detected_boxlist.num_boxes(), dtype=bool)
 
-    tp_fp_labels = np.zeros(detected_boxlist.num_boxes(), dtype=bool)
-    is_matched_to_difficult_box = np.zeros(
-        detected_boxlist.num_boxes(), dtype=bool)
-    is_matched_to_group_of_box = np.zeros(
-        detected_boxlist.num_boxes(), dtype=bool)
-
     # The evaluation is done in two stages:
     # 1. All detections are matched to non group-of boxes; true positives are
     #    determined and detections matched to difficult boxes are ignored.
     # 2. Detections that are determined as false positives are matched against
     #    group-of boxes and ignored if matched.
-
-    # Tp-fp evaluation for non-group of boxes (if any).
-    gt_non_group_of_boxlist = np_box_list.BoxList(
-        groundtruth_boxes[~groundtruth_is_group_of_list, :])
-    if gt_non_group_of_boxlist.num_boxes() > 0:
-      groundtruth_nongroup_of_is_difficult_list = groundtruth_is_difficult_list[
-          ~groundtruth_is_group_of_list]
-      iou = np_box_list_ops.iou(detected_boxlist, gt_non_group_of_boxlist)
-      max_overlap_gt_ids = np.argmax(iou, axis=1)
-      is_gt_box_detected = np.zeros(
-          gt_non_group_of_boxlist.num_boxes(), dtype=bool)
-      for i in range(detected_boxlist.num_boxes()):
-        gt_id = max_overlap_gt_ids[i]
-        if iou[i, gt_id] >= self.matching_iou_threshold:
-          if not groundtruth_nongroup_of_is_difficult_list[gt_id]:
-            if not is_gt_box_detected[gt_id]:
-              tp_fp_labels[i] = True
-              is_gt_box_detected[gt_id] = True
-          else:
-            is_matched_to_difficult_box[i] = True
-
-    # Tp-fp evaluation for group of boxes.
-    gt_group_of_boxlist = np_box_list.BoxList(
-        groundtruth_boxes[groundtruth_is_group_of_list, :])
-    if gt_group_of_boxlist.num_boxes() > 0:
-      ioa = np_box_list_ops.ioa(gt_group_of_boxlist, detected_boxlist)
-      max_overlap_group_of_gt = np.max(ioa, axis=0)
-      for i in range(detected_boxlist.num_boxes()):
-        if (not tp_fp_labels[i] and not is_matched_to_difficult_box[i] and
-            max_overlap_group_of_gt[i] >= self.matching_iou_threshold):
-          is_matched_to_group_of_box[i] = True
-
-    return scores[~is_matched_to_difficult_box
-                  & ~is_matched_to_group_of_box], tp_fp_labels[
-                      ~is_matched_to_difficult_box
-                      & ~is_matched_to_group_of_box]
+    tp_fp_labels, is_ignored = self._match_detections_to_groundtruth(
+        detected_boxlist.get(), groundtruth_boxes,
+        groundtruth_is_difficult_list, groundtruth_is_group_of_list)
+    return scores[~is_ignored], tp_fp_labels[~is_ignored]
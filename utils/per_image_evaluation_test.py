@@ -18,6 +18,7 @@
 import numpy as np
 import tensorflow as tf
 
+from object_detection.utils import np_box_ops
 from object_detection.utils import per_image_evaluation
 
 
@@ -221,6 +222,209 @@ class MultiClassesTpFpTest(tf.test.TestCase):
       self.assertTrue(np.array_equal(expected_tp_fp_labels[i], tp_fp_labels[i]))
 
 
+class MultiClassesTpFpMatchesSingleClassTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.num_groundtruth_classes = 10
+    num_detections = 200
+    num_groundtruth = 40
+    corners = np.random.uniform(0, 20, size=[num_detections, 2])
+    sizes = np.random.uniform(1, 6, size=[num_detections, 2])
+    self.detected_boxes = np.hstack([corners, corners + sizes])
+    # Quantized scores produce ties, which must be ordered as in NMS.
+    self.detected_scores = np.round(
+        np.random.uniform(size=[num_detections]), 1)
+    self.detected_class_labels = np.random.randint(
+        0, 6, size=[num_detections])
+    corners = np.random.uniform(0, 20, size=[num_groundtruth, 2])
+    sizes = np.random.uniform(1, 6, size=[num_groundtruth, 2])
+    self.groundtruth_boxes = np.hstack([corners, corners + sizes])
+    self.groundtruth_class_labels = np.random.randint(
+        3, 8, size=[num_groundtruth])
+    self.groundtruth_is_difficult_list = np.random.uniform(
+        size=[num_groundtruth]) < 0.2
+    self.groundtruth_is_group_of_list = np.random.uniform(
+        size=[num_groundtruth]) < 0.2
+
+  def compute_tp_fp_per_class(self, evaluator):
+    result_scores = []
+    result_tp_fp_labels = []
+    for i in range(self.num_groundtruth_classes):
+      gt_mask = self.groundtruth_class_labels == i
+      detection_mask = self.detected_class_labels == i
+      scores, tp_fp_labels = evaluator._compute_tp_fp_for_single_class(
+          self.detected_boxes[detection_mask, :],
+          self.detected_scores[detection_mask],
+          self.groundtruth_boxes[gt_mask, :],
+          self.groundtruth_is_difficult_list[gt_mask],
+          self.groundtruth_is_group_of_list[gt_mask])
+      result_scores.append(scores)
+      result_tp_fp_labels.append(tp_fp_labels)
+    return result_scores, result_tp_fp_labels
+
+  def test_matches_single_class_evaluation(self):
+    for nms_iou_threshold, nms_max_output_boxes in [(1.0, 10000), (1.0, 5),
+                                                    (0.5, 50), (0.3, 3)]:
+      for matching_iou_threshold in [0.1, 0.5]:
+        evaluator = per_image_evaluation.PerImageEvaluation(
+            self.num_groundtruth_classes, matching_iou_threshold,
+            nms_iou_threshold, nms_max_output_boxes)
+        scores, tp_fp_labels = evaluator._compute_tp_fp(
+            self.detected_boxes, self.detected_scores,
+            self.detected_class_labels, self.groundtruth_boxes,
+            self.groundtruth_class_labels, self.groundtruth_is_difficult_list,
+            self.groundtruth_is_group_of_list)
+        expected_scores, expected_tp_fp_labels = self.compute_tp_fp_per_class(
+            evaluator)
+        self.assertEqual(len(scores), self.num_groundtruth_classes)
+        for i in range(self.num_groundtruth_classes):
+          self.assertTrue(np.array_equal(expected_scores[i], scores[i]))
+          self.assertTrue(np.array_equal(expected_tp_fp_labels[i],
+                                         tp_fp_labels[i]))
+          self.assertEqual(expected_tp_fp_labels[i].dtype,
+                           tp_fp_labels[i].dtype)
+
+  def test_no_detections(self):
+    evaluator = per_image_evaluation.PerImageEvaluation(
+        self.num_groundtruth_classes, 0.5, 1.0, 10000)
+    scores, tp_fp_labels = evaluator._compute_tp_fp(
+        np.zeros([0, 4]), np.zeros([0]), np.zeros([0], dtype=int),
+        self.groundtruth_boxes, self.groundtruth_class_labels,
+        self.groundtruth_is_difficult_list, self.groundtruth_is_group_of_list)
+    for i in range(self.num_groundtruth_classes):
+      self.assertEqual(scores[i].size, 0)
+      self.assertEqual(tp_fp_labels[i].size, 0)
+
+  def test_only_out_of_range_class_labels(self):
+    evaluator = per_image_evaluation.PerImageEvaluation(
+        self.num_groundtruth_classes, 0.5, 1.0, 10000)
+    detected_class_labels = np.array([-1, self.num_groundtruth_classes,
+                                      self.num_groundtruth_classes + 3])
+    scores, tp_fp_labels, is_class_correctly_detected_in_image = (
+        evaluator.compute_object_detection_metrics(
+            self.detected_boxes[:3], self.detected_scores[:3],
+            detected_class_labels, self.groundtruth_boxes,
+            self.groundtruth_class_labels, self.groundtruth_is_difficult_list,
+            self.groundtruth_is_group_of_list))
+    for i in range(self.num_groundtruth_classes):
+      self.assertEqual(scores[i].size, 0)
+      self.assertEqual(tp_fp_labels[i].size, 0)
+    self.assertFalse(is_class_correctly_detected_in_image.any())
+
+
+class SingleClassTpFpMatchesGreedyLoopTest(tf.test.TestCase):
+
+  def greedy_tp_fp(self, detected_boxes, groundtruth_boxes,
+                   groundtruth_is_difficult_list, groundtruth_is_group_of_list,
+                   matching_iou_threshold):
+    """Assigns detections one at a time, in decreasing score order."""
+    num_detections = detected_boxes.shape[0]
+    tp_fp_labels = np.zeros(num_detections, dtype=bool)
+    is_ignored = np.zeros(num_detections, dtype=bool)
+    non_group_of_boxes = groundtruth_boxes[~groundtruth_is_group_of_list]
+    non_group_of_is_difficult = groundtruth_is_difficult_list[
+        ~groundtruth_is_group_of_list]
+    group_of_boxes = groundtruth_boxes[groundtruth_is_group_of_list]
+    is_gt_box_detected = np.zeros(non_group_of_boxes.shape[0], dtype=bool)
+    for i in range(num_detections):
+      if non_group_of_boxes.shape[0]:
+        iou = np_box_ops.iou(detected_boxes[i:i + 1], non_group_of_boxes)[0]
+        gt_id = np.argmax(iou)
+        if iou[gt_id] >= matching_iou_threshold:
+          if non_group_of_is_difficult[gt_id]:
+            is_ignored[i] = True
+          elif not is_gt_box_detected[gt_id]:
+            tp_fp_labels[i] = True
+            is_gt_box_detected[gt_id] = True
+      if (not tp_fp_labels[i] and not is_ignored[i] and
+          group_of_boxes.shape[0]):
+        ioa = np_box_ops.ioa(group_of_boxes, detected_boxes[i:i + 1])[:, 0]
+        is_ignored[i] = np.max(ioa) >= matching_iou_threshold
+    return tp_fp_labels[~is_ignored], is_ignored
+
+  def test_crowded_scene(self):
+    np.random.seed(1)
+    num_detections = 500
+    num_groundtruth = 100
+    corners = np.random.uniform(0, 30, size=[num_detections, 2])
+    detected_boxes = np.hstack(
+        [corners, corners + np.random.uniform(1, 5, size=[num_detections, 2])])
+    detected_scores = np.random.uniform(size=[num_detections])
+    corners = np.random.uniform(0, 30, size=[num_groundtruth, 2])
+    groundtruth_boxes = np.hstack(
+        [corners, corners + np.random.uniform(1, 5, size=[num_groundtruth, 2])])
+    groundtruth_is_difficult_list = np.random.uniform(
+        size=[num_groundtruth]) < 0.1
+    groundtruth_is_group_of_list = np.random.uniform(
+        size=[num_groundtruth]) < 0.1
+    evaluator = per_image_evaluation.PerImageEvaluation(1, 0.3, 1.0, 10000)
+    scores, tp_fp_labels = evaluator._compute_tp_fp_for_single_class(
+        detected_boxes, detected_scores, groundtruth_boxes,
+        groundtruth_is_difficult_list, groundtruth_is_group_of_list)
+    order = np.argsort(detected_scores)[::-1]
+    expected_tp_fp_labels, is_ignored = self.greedy_tp_fp(
+        detected_boxes[order], groundtruth_boxes,
+        groundtruth_is_difficult_list, groundtruth_is_group_of_list, 0.3)
+    self.assertTrue(np.array_equal(detected_scores[order][~is_ignored],
+                                   scores))
+    self.assertTrue(np.array_equal(expected_tp_fp_labels, tp_fp_labels))
+    self.assertGreater(np.sum(tp_fp_labels), 0)
+    self.assertGreater(np.sum(is_ignored), 0)
+
+
+class MultiThresholdMatchesSingleThresholdTest(tf.test.TestCase):
+
+  def test_matches_single_threshold_evaluation(self):
+    np.random.seed(2)
+    num_groundtruth_classes = 3
+    num_detections = 200
+    num_groundtruth = 40
+    corners = np.random.uniform(0, 20, size=[num_detections, 2])
+    detected_boxes = np.hstack(
+        [corners, corners + np.random.uniform(1, 5, size=[num_detections, 2])])
+    detected_scores = np.random.uniform(size=[num_detections])
+    detected_class_labels = np.random.randint(
+        0, num_groundtruth_classes, size=[num_detections])
+    corners = np.random.uniform(0, 20, size=[num_groundtruth, 2])
+    groundtruth_boxes = np.hstack(
+        [corners, corners + np.random.uniform(1, 5, size=[num_groundtruth, 2])])
+    groundtruth_class_labels = np.random.randint(
+        0, num_groundtruth_classes, size=[num_groundtruth])
+    groundtruth_is_difficult_list = np.random.uniform(
+        size=[num_groundtruth]) < 0.1
+    groundtruth_is_group_of_list = np.random.uniform(
+        size=[num_groundtruth]) < 0.1
+    matching_iou_thresholds = np.linspace(0.1, 0.9, 9)
+    evaluator = per_image_evaluation.PerImageEvaluation(
+        num_groundtruth_classes, 0.5, 1.0, 10000)
+    scores, tp_fp_labels, is_class_correctly_detected_in_image = (
+        evaluator.compute_object_detection_metrics_at_thresholds(
+            detected_boxes, detected_scores, detected_class_labels,
+            groundtruth_boxes, groundtruth_class_labels,
+            groundtruth_is_difficult_list, groundtruth_is_group_of_list,
+            matching_iou_thresholds))
+    for threshold_index, threshold in enumerate(matching_iou_thresholds):
+      threshold_evaluator = per_image_evaluation.PerImageEvaluation(
+          num_groundtruth_classes, threshold, 1.0, 10000)
+      expected_scores, expected_tp_fp_labels, expected_corloc = (
+          threshold_evaluator.compute_object_detection_metrics(
+              detected_boxes, detected_scores, detected_class_labels,
+              groundtruth_boxes, groundtruth_class_labels,
+              groundtruth_is_difficult_list, groundtruth_is_group_of_list))
+      for i in range(num_groundtruth_classes):
+        self.assertTrue(np.array_equal(expected_scores[i],
+                                       scores[threshold_index][i]))
+        self.assertTrue(np.array_equal(expected_tp_fp_labels[i],
+                                       tp_fp_labels[threshold_index][i]))
+      self.assertTrue(np.array_equal(
+          expected_corloc, is_class_correctly_detected_in_image[
+              threshold_index]))
+    num_true_positives = [np.sum(np.concatenate(threshold_tp_fp_labels))
+                          for threshold_tp_fp_labels in tp_fp_labels]
+    self.assertGreater(num_true_positives[0], num_true_positives[-1])
+
+
 class CorLocTest(tf.test.TestCase):
 
   def test_compute_corloc_with_normal_iou_threshold(self):
@@ -18,21 +18,34 @@
 These functions often receive an image, perform some visualization on the image.
 The functions do not return a value, instead they modify the image itself.
 
+matplotlib, TensorFlow and the PIL drawing modules are only imported when a
+function that needs them is first called, so that importing this module is
+fast.
 """
 import collections
 import functools
-import matplotlib.pyplot as plt
 import numpy as np
 import PIL.Image as Image
-import PIL.ImageColor as ImageColor
-import PIL.ImageDraw as ImageDraw
-import PIL.ImageFont as ImageFont
 import six
-import tensorflow as tf
+
+from . import file_io
+from . import lazy_import
+
+plt = lazy_import.LazyModule('matplotlib.pyplot')
+ImageColor = lazy_import.LazyModule('PIL.ImageColor')  # pylint: disable=invalid-name
+ImageDraw = lazy_import.LazyModule('PIL.ImageDraw')  # pylint: disable=invalid-name
+ImageFont = lazy_import.LazyModule('PIL.ImageFont')  # pylint: disable=invalid-name
+tf = lazy_import.LazyModule('tensorflow')
 
 
 _TITLE_LEFT_MARGIN = 10
 _TITLE_TOP_MARGIN = 10
+_DEFAULT_FONT_PATH = '/usr/share/fonts/truetype/abyssinica/AbyssinicaSIL-R.ttf'
+_DEFAULT_FONT_SIZE = 50
+_TEXT_SIZE_CACHE_SIZE = 4096
+_LABEL_BITMAP_CACHE_SIZE = 512
+# PIL format names of the image formats supported by encode_image_array.
+_IMAGE_FORMATS = {'jpeg': 'JPEG', 'jpg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
 STANDARD_COLORS = [
     'AliceBlue', 'Chartreuse', 'Aqua', 'Aquamarine', 'Azure', 'Beige', 'Bisque',
     'BlanchedAlmond', 'BlueViolet', 'BurlyWood', 'CadetBlue', 'AntiqueWhite',
@@ -60,6 +73,142 @@ STANDARD_COLORS = [
 ]
 
 
+class _LRUCache(object):
+  """A mapping that keeps the most recently used max_size entries."""
+
+  def __init__(self, max_size):
+    self._max_size = max_size
+    self._entries = collections.OrderedDict()
+
+  def get(self, key, create_fn):
+    """Returns the entry of key, calling create_fn() to create it if needed."""
+    if key in self._entries:
+      value = self._entries.pop(key)
+    else:
+      value = create_fn()
+      if len(self._entries) >= self._max_size:
+        self._entries.popitem(last=False)
+    self._entries[key] = value
+    return value
+
+  def clear(self):
+    self._entries.clear()
+
+  def __len__(self):
+    return len(self._entries)
+
+
+# Fonts are loaded once per (path, size); text sizes and label bitmaps are
+# keyed by the font object, which the font cache keeps alive.
+_FONT_CACHE = {}
+_TEXT_SIZE_CACHE = _LRUCache(_TEXT_SIZE_CACHE_SIZE)
+_LABEL_BITMAP_CACHE = _LRUCache(_LABEL_BITMAP_CACHE_SIZE)
+_LABEL_ARRAY_CACHE = _LRUCache(_LABEL_BITMAP_CACHE_SIZE)
+_ELLIPSE_MASK_CACHE = {}
+
+
+def get_font(font_path=_DEFAULT_FONT_PATH, font_size=_DEFAULT_FONT_SIZE):
+  """Returns a truetype font, reading the font file only once.
+
+  Args:
+    font_path: path of the truetype font file.
+    font_size: font size in points.
+
+  Returns:
+    A PIL.ImageFont, the default PIL font if the font file cannot be read.
+  """
+  key = (font_path, font_size)
+  if key not in _FONT_CACHE:
+    try:
+      _FONT_CACHE[key] = ImageFont.truetype(font_path, font_size)
+    except IOError:
+      _FONT_CACHE[key] = ImageFont.load_default()
+  return _FONT_CACHE[key]
+
+
+def _compute_text_size(font, text):
+  if hasattr(font, 'getsize'):
+    return font.getsize(text)
+  # Pillow >= 10 removed getsize; the right and bottom of the bounding box
+  # from the text origin are what it returned.
+  _, _, right, bottom = font.getbbox(text)
+  return right, bottom
+
+
+def get_text_size(font, text):
+  """Returns the (width, height) of text rendered with font, cached."""
+  return _TEXT_SIZE_CACHE.get(
+      (font, text), functools.partial(_compute_text_size, font, text))
+
+
+def _render_label_bitmap(font, display_str, color, mode, text_offset):
+  text_width, text_height = get_text_size(font, display_str)
+  margin = int(np.ceil(0.05 * text_height))
+  label = Image.new(mode, (text_width + 1, text_height + 2 * margin + 1),
+                    color)
+  ImageDraw.Draw(label).text(
+      (margin + text_offset[0], margin + text_offset[1]), display_str,
+      fill='black', font=font)
+  return label
+
+
+def get_label_bitmap(font, display_str, color, mode='RGB', text_offset=(0, 0)):
+  """Returns display_str as black text on a box filled with color, cached.
+
+  The bitmap is what draw_bounding_box_on_image draws for a display string:
+  a rectangle of the text size plus a margin of 0.05x the text height above
+  and below it, with the text offset by the margin.
+
+  Args:
+    font: a PIL.ImageFont.
+    display_str: the string to render.
+    color: fill color of the box.
+    mode: PIL mode of the image the bitmap is pasted in.
+    text_offset: additional (x, y) offset of the text in pixels.
+
+  Returns:
+    A PIL.Image object.
+  """
+  return _LABEL_BITMAP_CACHE.get(
+      (font, display_str, color, mode, text_offset),
+      functools.partial(_render_label_bitmap, font, display_str, color, mode,
+                        text_offset))
+
+
+def _get_label_placement(font, display_str, left, top):
+  """Returns the pixel position of a label box and the offset of its text.
+
+  ImageDraw floors the coordinates of rectangles but rounds those of text, so
+  the text is shifted within the bitmap to land on the same pixels as if drawn
+  directly; only the anti-aliasing of text at fractional positions differs.
+
+  Args:
+    font: a PIL.ImageFont.
+    display_str: the string of the label.
+    left: left of the label box.
+    top: top of the label box.
+
+  Returns:
+    box_left, box_top: integer position of the label box.
+    text_offset: (x, y) text offset to pass to get_label_bitmap.
+  """
+  _, text_height = get_text_size(font, display_str)
+  margin = np.ceil(0.05 * text_height)
+  box_left, box_top = int(np.floor(left)), int(np.floor(top))
+  text_offset = (int(np.floor(left + margin + 0.5)) - box_left - int(margin),
+                 int(np.floor(top + margin + 0.5)) - box_top - int(margin))
+  return box_left, box_top, text_offset
+
+
+def _paste_label(image, font, display_str, color, left, top):
+  """Pastes the label bitmap whose box has its top left corner at left, top."""
+  box_left, box_top, text_offset = _get_label_placement(font, display_str,
+                                                        left, top)
+  image.paste(
+      get_label_bitmap(font, display_str, color, image.mode, text_offset),
+      (box_left, box_top))
+
+
 def save_image_array_as_png(image, output_path):
   """Saves an image (represented as a numpy array) to PNG.
 
@@ -68,7 +217,7 @@ def save_image_array_as_png(image, output_path):
     output_path: path to which image should be written.
   """
   image_pil = Image.fromarray(np.uint8(image)).convert('RGB')
-  with tf.gfile.Open(output_path, 'w') as fid:
+  with file_io.Open(output_path, 'wb') as fid:
     image_pil.save(fid, 'PNG')
 
 
@@ -81,12 +230,59 @@ def encode_image_array_as_png_str(image):
   Returns:
     PNG encoded image string.
   """
+  return encode_image_array(image, image_format='png')
+
+
+def encode_image_array(image, image_format='png', quality=None,
+                       compress_level=None, scale=1.0):
+  """Encodes a numpy array into a JPEG, PNG or WebP string.
+
+  Args:
+    image: a numpy array with shape [height, width, 3].
+    image_format: one of 'jpeg' (or 'jpg'), 'png' and 'webp'.
+    quality: JPEG or WebP quality, between 1 and 100. If None, the PIL
+      default is used. Ignored for PNG.
+    compress_level: PNG compression level, between 0 (fastest, largest) and
+      9 (slowest, smallest). If None, the PIL default is used. Ignored for
+      JPEG and WebP.
+    scale: factor in (0, 1] by which the image is downscaled before encoding.
+
+  Returns:
+    encoded image string.
+
+  Raises:
+    ValueError: if image_format is not supported or scale, quality or
+      compress_level are out of range.
+  """
+  pil_format = _IMAGE_FORMATS.get(image_format.lower())
+  if pil_format is None:
+    raise ValueError('Unsupported image format {}, should be one of {}'.format(
+        image_format, sorted(_IMAGE_FORMATS)))
+  if not 0 < scale <= 1:
+    raise ValueError('scale should be in (0, 1], got {}'.format(scale))
+  save_kwargs = {}
+  if pil_format == 'PNG':
+    if compress_level is not None:
+      if not 0 <= compress_level <= 9:
+        raise ValueError('compress_level should be between 0 and 9, got '
+                         '{}'.format(compress_level))
+      save_kwargs['compress_level'] = compress_level
+  elif quality is not None:
+    if not 1 <= quality <= 100:
+      raise ValueError('quality should be between 1 and 100, got '
+                       '{}'.format(quality))
+    save_kwargs['quality'] = quality
   image_pil = Image.fromarray(np.uint8(image))
+  if scale < 1:
+    width, height = image_pil.size
+    image_pil = image_pil.resize(
+        (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+        Image.BILINEAR)
   output = six.BytesIO()
-  image_pil.save(output, format='PNG')
-  png_string = output.getvalue()
+  image_pil.save(output, format=pil_format, **save_kwargs)
+  image_string = output.getvalue()
   output.close()
-  return png_string
+  return image_string
 
 
 def draw_bounding_box_on_image_array(image,
@@ -160,18 +356,12 @@ def draw_bounding_box_on_image(image,
     (left, right, top, bottom) = (xmin, xmax, ymin, ymax)
   draw.line([(left, top), (left, bottom), (right, bottom),
              (right, top), (left, top)], width=thickness, fill=color)
-  try:
-    font = ImageFont.truetype('/usr/share/fonts/truetype/abyssinica/AbyssinicaSIL-R.ttf', 50)
-    # font = ImageFont.truetype(size=30)
-
-  except IOError:
-    font = ImageFont.load_default()
-
+  font = get_font()
 
   # If the total height of the display strings added to the top of the bounding
   # box exceeds the top of the image, stack the strings below the bounding box
   # instead of above.
-  display_str_heights = [font.getsize(ds)[1] for ds in display_str_list]
+  display_str_heights = [get_text_size(font, ds)[1] for ds in display_str_list]
   # Each display_str has a top and bottom margin of 0.05x.
   total_display_str_height = (1 + 2 * 0.05) * sum(display_str_heights)
 
@@ -181,17 +371,10 @@ def draw_bounding_box_on_image(image,
     text_bottom = bottom + total_display_str_height
   # Reverse list and print from bottom to top.
   for display_str in display_str_list[::-1]:
-    text_width, text_height = font.getsize(display_str)
+    _, text_height = get_text_size(font, display_str)
     margin = np.ceil(0.05 * text_height)
-    draw.rectangle(
-        [(left, text_bottom - text_height - 2 * margin), (left + text_width,
-                                                          text_bottom)],
-        fill=color)
-    draw.text(
-        (left + margin, text_bottom - text_height - margin),
-        display_str,
-        fill='black',
-        font=font)
+    _paste_label(image, font, display_str, color, left,
+                 text_bottom - text_height - 2 * margin)
     text_bottom -= text_height - 2 * margin
 
 
@@ -217,10 +400,14 @@ def draw_bounding_boxes_on_image_array(image,
   Raises:
     ValueError: if boxes is not a [N, 4] array
   """
-  image_pil = Image.fromarray(image)
-  draw_bounding_boxes_on_image(image_pil, boxes, color, thickness,
-                               display_str_list_list)
-  np.copyto(image, np.array(image_pil))
+  boxes_shape = boxes.shape
+  if not boxes_shape:
+    return
+  if len(boxes_shape) != 2 or boxes_shape[1] != 4:
+    raise ValueError('Input must be of size [N, 4]')
+  draw_boxes_on_image_array(
+      image, boxes, [color] * boxes_shape[0], thickness=thickness,
+      display_str_list_list=display_str_list_list or None)
 
 
 def draw_bounding_boxes_on_image(image,
@@ -368,21 +555,256 @@ def draw_mask_on_image_array(image, mask, color='red', alpha=0.7):
   Raises:
     ValueError: On incorrect data type for image or masks.
   """
+  draw_masks_on_image_array(image, np.expand_dims(mask, axis=0), [color],
+                            alpha=alpha)
+
+
+def draw_masks_on_image_array(image, masks, colors, alpha=0.7):
+  """Draws a stack of instance masks on an image in place.
+
+  The masks are alpha blended in order, with the same integer arithmetic as
+  Image.composite in draw_mask_on_image_array, but only over the pixels of
+  each mask's bounding box, so that the cost of a mask scales with its area
+  rather than with the area of the image.
+
+  Args:
+    image: uint8 numpy array with shape (img_height, img_width, 3)
+    masks: a uint8 numpy array of shape (N, img_height, img_width) with
+      values either 0 or 1.
+    colors: a list of N colors, names or RGB tuples.
+    alpha: transparency value between 0 and 1. (default: 0.7)
+
+  Raises:
+    ValueError: On incorrect data type or shape for image or masks.
+  """
   if image.dtype != np.uint8:
     raise ValueError('`image` not of type np.uint8')
-  if mask.dtype != np.uint8:
+  if masks.dtype != np.uint8:
     raise ValueError('`mask` not of type np.uint8')
-  if np.any(np.logical_and(mask != 1, mask != 0)):
+  if masks.ndim != 3 or masks.shape[1:] != image.shape[:2]:
+    raise ValueError('`masks` should be of shape [N, {}, {}]'.format(
+        *image.shape[:2]))
+  if len(colors) != masks.shape[0]:
+    raise ValueError('Expected {} colors, got {}'.format(masks.shape[0],
+                                                         len(colors)))
+  # A single reduction: uint8 values cannot be negative.
+  if masks.size and masks.max() > 1:
     raise ValueError('`mask` elements should be in [0, 1]')
-  rgb = ImageColor.getrgb(color)
-  pil_image = Image.fromarray(image)
+  rows_with_mask = masks.any(axis=2)
+  columns_with_mask = masks.any(axis=1)
+  for mask, rows, columns, color in zip(masks, rows_with_mask,
+                                        columns_with_mask, colors):
+    _blend_mask_on_array(image, mask, rows, columns, _to_rgb(color), alpha)
+
+
+def _to_rgb(color):
+  if isinstance(color, six.string_types):
+    return ImageColor.getrgb(color)
+  return tuple(color)
+
+
+def _clip_to_image(image, top, left, height, width):
+  """Returns the image and patch slices of a patch clipped to the image.
+
+  Args:
+    image: a numpy array with shape [height, width, ...].
+    top: integer row of the top left corner of the patch.
+    left: integer column of the top left corner of the patch.
+    height: height of the patch.
+    width: width of the patch.
+
+  Returns:
+    A tuple of (image_rows, image_cols, patch_rows, patch_cols) slices, or
+    None if the patch is outside of the image.
+  """
+  im_height, im_width = image.shape[:2]
+  y0, x0 = max(top, 0), max(left, 0)
+  y1, x1 = min(top + height, im_height), min(left + width, im_width)
+  if y0 >= y1 or x0 >= x1:
+    return None
+  return (slice(y0, y1), slice(x0, x1),
+          slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+
+
+def _fill_rectangle_on_array(image, top, left, bottom, right, rgb):
+  """Fills the pixels of rows top:bottom and columns left:right inclusive."""
+  clipped = _clip_to_image(image, top, left, bottom - top + 1,
+                           right - left + 1)
+  if clipped is not None:
+    image[clipped[0], clipped[1]] = rgb
+
+
+def _draw_box_on_array(image, left, top, right, bottom, rgb, thickness):
+  """Draws the outline of a box like ImageDraw.line with width thickness.
+
+  ImageDraw truncates the coordinates and draws the sides of the outline
+  (left, top) -> (left, bottom) -> (right, bottom) -> (right, top) -> (left,
+  top) as bands of thickness pixels, shifted by one pixel to the left of the
+  drawing direction for even thicknesses; each side is filled here as the
+  same rectangle.
+  """
+  left, top, right, bottom = int(left), int(top), int(right), int(bottom)
+  x0, x1 = min(left, right), max(left, right)
+  y0, y1 = min(top, bottom), max(top, bottom)
+  low, high = (thickness - 1) // 2, thickness // 2
+  if thickness <= 1:
+    low = high = 0
+  # Offsets of the bands of the sides drawn down, right, up and left when
+  # the box is not flipped; wide sides of zero length reduce to end points.
+  vertical = (low, high) if y0 < y1 else (0, 0)
+  horizontal = (low, high) if x0 < x1 else (0, 0)
+  down = vertical if bottom >= top else vertical[::-1]
+  right_side = horizontal if right >= left else horizontal[::-1]
+  _fill_rectangle_on_array(image, y0, left - down[0], y1, left + down[1], rgb)
+  _fill_rectangle_on_array(image, bottom - right_side[0], x0,
+                           bottom + right_side[1], x1, rgb)
+  _fill_rectangle_on_array(image, y0, right - down[1], y1, right + down[0],
+                           rgb)
+  _fill_rectangle_on_array(image, top - right_side[1], x0,
+                           top + right_side[0], x1, rgb)
+
+
+def _get_label_array(font, display_str, color, text_offset):
+  return _LABEL_ARRAY_CACHE.get(
+      (font, display_str, color, text_offset),
+      lambda: np.array(get_label_bitmap(font, display_str, color, 'RGB',
+                                        text_offset)))
+
+
+def _draw_labels_on_array(image, left, top, bottom, color, display_str_list):
+  """Draws display strings like draw_bounding_box_on_image."""
+  font = get_font()
+  display_str_heights = [get_text_size(font, ds)[1] for ds in display_str_list]
+  total_display_str_height = (1 + 2 * 0.05) * sum(display_str_heights)
+  if top > total_display_str_height:
+    text_bottom = top
+  else:
+    text_bottom = bottom + total_display_str_height
+  for display_str in display_str_list[::-1]:
+    _, text_height = get_text_size(font, display_str)
+    margin = np.ceil(0.05 * text_height)
+    box_left, box_top, text_offset = _get_label_placement(
+        font, display_str, left, text_bottom - text_height - 2 * margin)
+    label = _get_label_array(font, display_str, color, text_offset)
+    clipped = _clip_to_image(image, box_top, box_left, label.shape[0],
+                             label.shape[1])
+    if clipped is not None:
+      image[clipped[0], clipped[1]] = label[clipped[2], clipped[3]]
+    text_bottom -= text_height - 2 * margin
+
 
-  solid_color = np.expand_dims(
-      np.ones_like(mask), axis=2) * np.reshape(list(rgb), [1, 1, 3])
-  pil_solid_color = Image.fromarray(np.uint8(solid_color)).convert('RGBA')
-  pil_mask = Image.fromarray(np.uint8(255.0*alpha*mask)).convert('L')
-  pil_image = Image.composite(pil_solid_color, pil_image, pil_mask)
-  np.copyto(image, np.array(pil_image.convert('RGB')))
+def _get_ellipse_mask(width, height):
+  """Returns the pixels ImageDraw.ellipse fills in a width x height box."""
+  key = (width, height)
+  if key not in _ELLIPSE_MASK_CACHE:
+    ellipse = Image.new('L', (width + 1, height + 1))
+    ImageDraw.Draw(ellipse).ellipse([(0, 0), (width, height)], outline=255,
+                                    fill=255)
+    _ELLIPSE_MASK_CACHE[key] = np.array(ellipse) > 0
+  return _ELLIPSE_MASK_CACHE[key]
+
+
+def _draw_keypoints_on_array(image, keypoints, rgb, radius,
+                             use_normalized_coordinates):
+  """Draws keypoints like draw_keypoints_on_image."""
+  keypoints = np.asarray(keypoints, dtype=float).reshape([-1, 2])
+  if use_normalized_coordinates:
+    keypoints = keypoints * image.shape[:2]
+  # ImageDraw truncates the coordinates of the ellipses.
+  corners = np.concatenate([keypoints - radius, keypoints + radius],
+                           axis=1).astype(int)
+  for y0, x0, y1, x1 in corners:
+    ellipse = _get_ellipse_mask(x1 - x0, y1 - y0)
+    clipped = _clip_to_image(image, y0, x0, ellipse.shape[0],
+                             ellipse.shape[1])
+    if clipped is not None:
+      image[clipped[0], clipped[1]][ellipse[clipped[2], clipped[3]]] = rgb
+
+
+def _blend_mask_on_array(image, mask, rows, columns, rgb, alpha):
+  """Alpha blends the pixels of a mask within its bounding box in place.
+
+  Args:
+    image: uint8 numpy array with shape (img_height, img_width, 3).
+    mask: numpy array of shape (img_height, img_width), nonzero in the mask.
+    rows: boolean numpy array of shape [img_height], True for the rows of the
+      image that hold part of the mask.
+    columns: boolean numpy array of shape [img_width], likewise for columns.
+    rgb: color of the mask.
+    alpha: transparency value between 0 and 1.
+  """
+  rows = np.flatnonzero(rows)
+  if not rows.size:
+    return
+  columns = np.flatnonzero(columns)
+  box = (slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1))
+  in_mask = mask[box] != 0
+  region = image[box]
+  # Image.composite computes (color * a + pixel * (255 - a) + 127) // 255,
+  # which fits in 16 bits.
+  mask_alpha = int(np.uint8(255.0 * alpha))
+  color = np.array(rgb, dtype=np.uint16) * mask_alpha + 127
+  pixels = region[in_mask].astype(np.uint16)
+  pixels *= 255 - mask_alpha
+  pixels += color
+  pixels //= 255
+  region[in_mask] = pixels
+
+
+def draw_boxes_on_image_array(image,
+                              boxes,
+                              colors,
+                              thickness=4,
+                              display_str_list_list=None,
+                              instance_masks=None,
+                              keypoints=None,
+                              use_normalized_coordinates=True,
+                              mask_alpha=0.7):
+  """Draws boxes with their labels, masks and keypoints on an image in place.
+
+  Renders directly into the numpy array, without converting the image to a
+  PIL.Image for every box like draw_bounding_box_on_image_array. Every box is
+  drawn in turn, its mask first, then its outline and labels and then its
+  keypoints, and looks the same as with draw_mask_on_image_array,
+  draw_bounding_box_on_image_array and draw_keypoints_on_image_array.
+
+  Args:
+    image: uint8 numpy array with shape (img_height, img_width, 3).
+    boxes: a numpy array of shape [N, 4]: (ymin, xmin, ymax, xmax).
+    colors: a list of N colors, names or RGB tuples.
+    thickness: line thickness. Default value is 4.
+    display_str_list_list: optional list of N lists of strings to display
+      above (or below) every box.
+    instance_masks: optional uint8 numpy array of shape [N, img_height,
+      img_width] with values in [0, 1].
+    keypoints: optional list of N numpy arrays of shape [num_keypoints, 2].
+    use_normalized_coordinates: If True (default), treat box and keypoint
+      coordinates as relative to the image. Otherwise treat them as absolute.
+    mask_alpha: transparency of the masks, between 0 and 1.
+
+  Raises:
+    ValueError: if image is not a uint8 RGB image.
+  """
+  if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] != 3:
+    raise ValueError('`image` should be a uint8 array of shape [H, W, 3]')
+  im_height, im_width = image.shape[:2]
+  boxes = np.asarray(boxes, dtype=float).reshape([-1, 4])
+  if use_normalized_coordinates:
+    boxes = boxes * [im_height, im_width, im_height, im_width]
+  for i, (top, left, bottom, right) in enumerate(boxes):
+    color = colors[i]
+    rgb = _to_rgb(color)
+    if instance_masks is not None:
+      mask = np.asarray(instance_masks[i])
+      _blend_mask_on_array(image, mask, mask.any(axis=1), mask.any(axis=0),
+                           rgb, mask_alpha)
+    _draw_box_on_array(image, left, top, right, bottom, rgb, thickness)
+    if display_str_list_list is not None and display_str_list_list[i]:
+      _draw_labels_on_array(image, left, top, bottom, color,
+                            display_str_list_list[i])
+    if keypoints is not None:
+      _draw_keypoints_on_array(image, keypoints[i], rgb, thickness / 2,
+                               use_normalized_coordinates)
 
 
 def visualize_boxes_and_labels_on_image_array(image,
@@ -461,31 +883,19 @@ def visualize_boxes_and_labels_on_image_array(image,
               classes[i] % len(STANDARD_COLORS)]
 
   # Draw all boxes onto image.
-  for box, color in box_to_color_map.items():
-    ymin, xmin, ymax, xmax = box
-    if instance_masks is not None:
-      draw_mask_on_image_array(
-          image,
-          box_to_instance_masks_map[box],
-          color=color
-      )
-    draw_bounding_box_on_image_array(
-        image,
-        ymin,
-        xmin,
-        ymax,
-        xmax,
-        color=color,
-        thickness=line_thickness,
-        display_str_list=box_to_display_str_map[box],
-        use_normalized_coordinates=use_normalized_coordinates)
-    if keypoints is not None:
-      draw_keypoints_on_image_array(
-          image,
-          box_to_keypoints_map[box],
-          color=color,
-          radius=line_thickness / 2,
-          use_normalized_coordinates=use_normalized_coordinates)
+  boxes_to_draw = list(box_to_color_map.keys())
+  draw_boxes_on_image_array(
+      image,
+      np.array(boxes_to_draw),
+      [box_to_color_map[box] for box in boxes_to_draw],
+      thickness=line_thickness,
+      display_str_list_list=[
+          box_to_display_str_map[box] for box in boxes_to_draw],
+      instance_masks=(None if instance_masks is None else [
+          box_to_instance_masks_map[box] for box in boxes_to_draw]),
+      keypoints=(None if keypoints is None else [
+          box_to_keypoints_map[box] for box in boxes_to_draw]),
+      use_normalized_coordinates=use_normalized_coordinates)
 
   return image
 
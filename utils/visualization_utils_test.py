@@ -24,6 +24,7 @@ import os
 
 import numpy as np
 import PIL.Image as Image
+import six
 import tensorflow as tf
 
 from object_detection.utils import visualization_utils
@@ -53,6 +54,23 @@ class VisualizationUtilsTest(tf.test.TestCase):
     image = np.concatenate((imu, imd), axis=0)
     return image
 
+  def test_encode_image_array(self):
+    test_image = self.create_colorful_test_image()
+    for image_format, pil_format in [('png', 'PNG'), ('JPEG', 'JPEG'),
+                                     ('webp', 'WEBP')]:
+      encoded_image = visualization_utils.encode_image_array(
+          test_image, image_format=image_format, quality=50, compress_level=1,
+          scale=0.5)
+      decoded_image = Image.open(six.BytesIO(encoded_image))
+      self.assertEqual(pil_format, decoded_image.format)
+      self.assertEqual((200, 100), decoded_image.size)
+    self.assertAllEqual(test_image, np.array(Image.open(six.BytesIO(
+        visualization_utils.encode_image_array_as_png_str(test_image)))))
+    with self.assertRaises(ValueError):
+      visualization_utils.encode_image_array(test_image, image_format='gif')
+    with self.assertRaises(ValueError):
+      visualization_utils.encode_image_array(test_image, scale=2)
+
   def test_draw_bounding_box_on_image(self):
     test_image = self.create_colorful_test_image()
     test_image = Image.fromarray(test_image)
@@ -86,6 +104,35 @@ class VisualizationUtilsTest(tf.test.TestCase):
     self.assertEqual(width_original, width_final)
     self.assertEqual(height_original, height_final)
 
+  def test_draw_bounding_box_with_labels_on_image(self):
+    test_image = Image.fromarray(self.create_colorful_test_image())
+    original_image = np.array(test_image)
+    visualization_utils.draw_bounding_box_on_image(
+        test_image, 0.5, 0.25, 0.9, 0.75, color='Chartreuse',
+        display_str_list=['traffic light: 87%', 'label'])
+    label = visualization_utils.get_label_bitmap(
+        visualization_utils.get_font(), 'label', 'Chartreuse')
+    self.assertEqual(test_image.size, (400, 200))
+    self.assertFalse(np.array_equal(original_image, np.array(test_image)))
+    self.assertIs(label, visualization_utils.get_label_bitmap(
+        visualization_utils.get_font(), 'label', 'Chartreuse'))
+
+  def test_font_and_text_size_are_cached(self):
+    font = visualization_utils.get_font()
+    self.assertIs(font, visualization_utils.get_font())
+    self.assertEqual(visualization_utils.get_text_size(font, 'cat'),
+                     visualization_utils.get_text_size(font, 'cat'))
+
+  def test_lru_cache_evicts_least_recently_used(self):
+    cache = visualization_utils._LRUCache(2)
+    cache.get('a', lambda: 1)
+    cache.get('b', lambda: 2)
+    cache.get('a', lambda: 3)
+    cache.get('c', lambda: 4)
+    self.assertEqual(len(cache), 2)
+    self.assertEqual(cache.get('a', lambda: 5), 1)
+    self.assertEqual(cache.get('b', lambda: 6), 6)
+
   def test_draw_bounding_boxes_on_image(self):
     test_image = self.create_colorful_test_image()
     test_image = Image.fromarray(test_image)
@@ -113,6 +160,40 @@ class VisualizationUtilsTest(tf.test.TestCase):
     self.assertEqual(width_original, width_final)
     self.assertEqual(height_original, height_final)
 
+  def test_draw_boxes_on_image_array_matches_pil_drawing(self):
+    np.random.seed(0)
+    boxes = np.random.uniform(-0.1, 1.1, size=[6, 4])
+    keypoints = np.random.uniform(-0.1, 1.1, size=[6, 3, 2])
+    masks = np.random.randint(0, 2, size=[6, 200, 400]).astype(np.uint8)
+    colors = ['Red', 'Blue', 'Chartreuse', (10, 20, 30), 'Gold', 'Orchid']
+    display_str_list_list = [['cat: 90%'], [], ['dog: 51%', 'occluded'],
+                             ['a'], [], ['b']]
+    test_image = np.random.randint(0, 256, size=[200, 400, 3]).astype(
+        np.uint8)
+    expected_image = test_image.copy()
+    for box, mask, box_keypoints, color, display_str_list in zip(
+        boxes, masks, keypoints, colors, display_str_list_list):
+      if isinstance(color, tuple):
+        color = '#%02x%02x%02x' % color
+      visualization_utils.draw_mask_on_image_array(
+          expected_image, mask, color=color, alpha=0.5)
+      visualization_utils.draw_bounding_box_on_image_array(
+          expected_image, box[0], box[1], box[2], box[3], color=color,
+          thickness=3, display_str_list=display_str_list)
+      visualization_utils.draw_keypoints_on_image_array(
+          expected_image, box_keypoints, color=color, radius=1.5)
+
+    visualization_utils.draw_boxes_on_image_array(
+        test_image, boxes, colors, thickness=3,
+        display_str_list_list=display_str_list_list, instance_masks=masks,
+        keypoints=keypoints, mask_alpha=0.5)
+    self.assertAllEqual(expected_image, test_image)
+
+  def test_draw_boxes_on_image_array_raises_on_non_uint8_image(self):
+    with self.assertRaises(ValueError):
+      visualization_utils.draw_boxes_on_image_array(
+          np.zeros([10, 10, 3], dtype=np.float32), np.zeros([1, 4]), ['Red'])
+
   def test_draw_bounding_boxes_on_image_tensors(self):
     """Tests that bounding box utility produces reasonable results."""
     category_index = {1: {'id': 1, 'name': 'dog'}, 2: {'id': 2, 'name': 'cat'}}
@@ -185,6 +266,28 @@ class VisualizationUtilsTest(tf.test.TestCase):
                                                  color='Blue', alpha=.5)
     self.assertAllEqual(test_image, expected_result)
 
+  def test_draw_masks_on_image_array(self):
+    test_image = np.zeros([2, 3, 3], dtype=np.uint8)
+    masks = np.asarray([[[0, 1, 0],
+                         [1, 1, 0]],
+                        [[0, 1, 1],
+                         [0, 0, 0]]], dtype=np.uint8)
+    expected_result = np.asarray([[[0, 0, 0], [127, 0, 64], [127, 0, 0]],
+                                  [[0, 0, 127], [0, 0, 127], [0, 0, 0]]],
+                                 dtype=np.uint8)
+    visualization_utils.draw_masks_on_image_array(
+        test_image, masks, ['Blue', (255, 0, 0)], alpha=.5)
+    self.assertAllEqual(test_image, expected_result)
+
+  def test_draw_masks_on_image_array_raises_on_invalid_masks(self):
+    test_image = np.zeros([2, 3, 3], dtype=np.uint8)
+    with self.assertRaises(ValueError):
+      visualization_utils.draw_masks_on_image_array(
+          test_image, np.full([1, 2, 3], 2, dtype=np.uint8), ['Blue'])
+    with self.assertRaises(ValueError):
+      visualization_utils.draw_masks_on_image_array(
+          test_image, np.ones([1, 3, 2], dtype=np.uint8), ['Blue'])
+
   def test_add_cdf_image_summary(self):
     values = [0.1, 0.2, 0.3, 0.4, 0.42, 0.44, 0.46, 0.48, 0.50]
     visualization_utils.add_cdf_image_summary(values, 'PositiveAnchorLoss')
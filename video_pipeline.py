@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Pipelined video annotation and Go/Stop detection
+
+Reads a video with OpenCV and runs decoding, batched inference, color
+classification, annotation and encoding as separate pipeline stages connected
+by bounded queues (see pipeline.py). Writes a JSONL file with the Go/Stop
+decision of every frame and, optionally, the annotated video, and reports the
+utilization of every stage.
+
+Usage:
+    python video_pipeline.py --video drive.mp4 --jsonl drive.jsonl
+    python video_pipeline.py --video drive.mp4 --jsonl drive.jsonl \\
+        --output drive_annotated.mp4 --batch_size 8 --queue_size 16
+"""
+
+import argparse
+import functools
+import json
+import sys
+import time
+
+import cv2
+
+from pipeline import (classify_records, detect_batches, print_stage_report, run_pipeline,
+                      start_detector)
+
+
+### Stages
+def read_video_frames(_, video_path, max_frames=None):
+    """
+    decoding stage: read the frames of a video
+    :param video_path: path of the video
+    :param max_frames: optional maximum number of frames
+    :return: iterator of records with 'frame', 'timestamp' (seconds) and the
+        RGB 'image'
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video {video_path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_index = 0
+    try:
+        while max_frames is None or frame_index < max_frames:
+            success, frame = capture.read()
+            if not success:
+                break
+            yield {'frame': frame_index, 'timestamp': frame_index / fps,
+                   'image': cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)}
+            frame_index += 1
+    finally:
+        capture.release()
+
+
+def annotate_frames(records, category_index):
+    """
+    annotation stage: draw the detected traffic lights on the frames in place
+    :param records: iterator of records of classify_records
+    :param category_index: category index of main.py
+    :return: iterator of the records
+    """
+    from utils import visualization_utils as vis_util
+
+    for record in records:
+        vis_util.visualize_boxes_and_labels_on_image_array(
+            record['image'], record['boxes'], record['classes'], record['scores'],
+            category_index, use_normalized_coordinates=True)
+        yield record
+
+
+def write_outputs(records, jsonl_path, output_path=None, fps=30.0):
+    """
+    encoding stage: write the decision of every frame to a JSONL file and the
+    frames to the annotated video
+    :param records: iterator of records of classify_records or annotate_frames
+    :param jsonl_path: path of the JSONL file
+    :param output_path: optional path of the annotated video
+    :param fps: frame rate of the annotated video
+    :return: iterator of the records, once written
+    """
+    writer = None
+    try:
+        with open(jsonl_path, 'w') as jsonl_file:
+            for record in records:
+                if output_path:
+                    if writer is None:
+                        height, width = record['image'].shape[:2]
+                        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'),
+                                                 fps, (width, height))
+                    writer.write(cv2.cvtColor(record['image'], cv2.COLOR_RGB2BGR))
+                jsonl_file.write(json.dumps({
+                    'frame': record['frame'],
+                    'timestamp': round(record['timestamp'], 3),
+                    'command': record['command'],
+                    'confidence': record['confidence'],
+                }) + '\n')
+                yield record
+    finally:
+        if writer is not None:
+            writer.release()
+
+
+### Job
+def process_video(video_path, jsonl_path, output_path=None, batch_size=4, queue_size=8,
+                  max_frames=None):
+    """
+    run the pipeline on a video
+    :param video_path: path of the input video
+    :param jsonl_path: path of the per-frame JSONL decisions
+    :param output_path: optional path of the annotated video
+    :param batch_size: maximum number of frames per inference
+    :param queue_size: maximum number of frames waiting between two stages
+    :param max_frames: optional maximum number of frames to process
+    :return: list of stage stats, see pipeline.run_pipeline
+    """
+    import main
+
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    capture.release()
+
+    with start_detector() as sess:
+        stages = [
+            ('decode', functools.partial(read_video_frames, video_path=video_path,
+                                         max_frames=max_frames)),
+            ('detect', functools.partial(detect_batches, sess=sess, batch_size=batch_size)),
+            ('classify', classify_records),
+        ]
+        if output_path:
+            stages.append(('annotate', functools.partial(
+                annotate_frames, category_index=main.category_index)))
+        stages.append(('encode', functools.partial(
+            write_outputs, jsonl_path=jsonl_path, output_path=output_path, fps=fps)))
+        return run_pipeline(stages, queue_size=queue_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined video Go/Stop detection")
+    parser.add_argument('--video', required=True, help="input video")
+    parser.add_argument('--jsonl', required=True, help="output JSONL of per-frame decisions")
+    parser.add_argument('--output', help="optional annotated output video (mp4)")
+    parser.add_argument('--batch_size', type=int, default=4, help="frames per inference")
+    parser.add_argument('--queue_size', type=int, default=8,
+                        help="maximum number of frames waiting between two stages")
+    parser.add_argument('--max_frames', type=int, help="only process the first frames")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        stats = process_video(args.video, args.jsonl, output_path=args.output,
+                              batch_size=args.batch_size, queue_size=args.queue_size,
+                              max_frames=args.max_frames)
+    except (IOError, RuntimeError) as e:
+        print(f"Video processing failed: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    num_frames = stats[-1]['items']
+    print(f"Processed {num_frames} frames in {elapsed:.1f}s "
+          f"({num_frames / elapsed:.2f} frames/s)")
+    print(f"Decisions written to {args.jsonl}")
+    if args.output:
+        print(f"Annotated video written to {args.output}")
+    print_stage_report(stats)
+
+
+if __name__ == "__main__":
+    main()